@@ -4,7 +4,9 @@ from django.contrib.auth.decorators import login_required
 from django.http import HttpResponse,  HttpResponseForbidden
 from django.db.models import Prefetch
 from geo.models import Fylke
-from members.models import Lokallag, Medlem, Fylkeslagsmedlemskap
+from members.models import Lokallag, Medlem
+from members.queries import has_fylke_access
+from members.routing import contact_routes
 from .models import FylkeSite
 
 def _get_fylke(slug: str) -> Fylke:
@@ -24,21 +26,22 @@ def fylke_home(request, slug):
         "title": fylke.homepage_title or fylke.navn,
         "intro": fylke.homepage_intro,
         "lokallag": lokallag,
+        "kontakt_epost": contact_routes().for_fylke(fylke.id),
     })
 
 def fylke_lokallag(request, slug):
     fylke = _get_fylke(slug)
-    lokallag = Lokallag.objects.filter(fylke_id=fylke.id).select_related("kommune").order_by("navn")
+    lokallag = list(Lokallag.objects.filter(fylke_id=fylke.id).select_related("kommune").order_by("navn"))
+    routes = contact_routes()
+    for l in lokallag:
+        l.kontakt_epost = routes.for_lokallag(l.id)
     return render(request, "fylkehub/lokallag.html", {"fylke": fylke, "lokallag": lokallag})
 
 @login_required
 def fylke_medlemmer(request, slug):
     fylke = _get_fylke(slug)
     # Tilgang: superuser ELLER har fylkesrolle via Fylkeslagsmedlemskap i dette fylket
-    has_role = request.user.is_superuser or Fylkeslagsmedlemskap.objects.filter(
-        medlem__user=request.user,
-        fylkeslag__fylke_id=fylke.id,
-    ).exists()
+    has_role = has_fylke_access(request.user, fylke.id)
     if not has_role:
         return HttpResponseForbidden("Du har ikke tilgang til medlemmer i dette fylket.")
     medlemmer = (Medlem.objects
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Fylke, Kommune, Postnummer
+from django.urls import reverse
+from django.utils.html import format_html
+from .models import Fylke, GeoEndring, GeoImport, Kommune, Postnummer
 # Ta med PostnummerKommune hvis du har den i models.py
 try:
     from .models import PostnummerKommune
@@ -31,3 +33,36 @@ if PostnummerKommune:
     class PKAdmin(admin.ModelAdmin):
         list_display = ("postnummer", "kommune", "primar")
         list_filter = ("primar", "kommune__fylke")
+
+
+@admin.register(GeoImport)
+class GeoImportAdmin(admin.ModelAdmin):
+    list_display = ("importert", "kilde", "filnavn", "rader", "nye", "endrede", "fjernede", "versjon", "vis_endringer")
+    list_filter = ("kilde",)
+    readonly_fields = ("kilde", "filnavn", "sha256", "rader", "nye", "endrede", "fjernede", "versjon", "importert")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="Endringer")
+    def vis_endringer(self, obj):
+        url = reverse("admin:geo_geoendring_changelist") + f"?geo_import__id__exact={obj.pk}"
+        return format_html('<a href="{}">Vis</a>', url)
+
+
+@admin.register(GeoEndring)
+class GeoEndringAdmin(admin.ModelAdmin):
+    list_display = ("geo_import", "handling", "tabell", "nokkel", "fra", "til")
+    list_filter = ("handling", "tabell", "geo_import__kilde")
+    search_fields = ("nokkel",)
+    list_select_related = ("geo_import",)
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,81 @@
+# geo/fragments.py
+"""
+Ferdigbygde <option>-fragmenter for HTMX-nedtrekkene (members.views.Hx*).
+
+Alle fragmenter bygges samlet med tre spørringer første gang de trengs, og
+på nytt når geo-versjonen (geo/stamp.py) endres. Oppslag er deretter et
+dict-oppslag; ETag/Last-Modified i viewene bygger på samme versjon.
+"""
+import threading
+from collections import defaultdict
+
+from django.utils.html import format_html, format_html_join
+
+from .models import Kommune, PostnummerKommune, Postnummer
+from .stamp import current_stamp
+
+POSTNUMMER_ALL_LIMIT = 1000
+_lock = threading.Lock()
+_built = {"versjon": None, "data": None}
+
+
+def _options(rows):
+    return format_html_join("", '<option value="{}">{}</option>', rows)
+
+
+def _postnummer_label(nummer, poststed):
+    return f"{nummer} – {poststed}" if poststed else nummer
+
+
+def _build():
+    from members.models import Lokallag  # members avhenger av geo, ikke omvendt
+
+    kommuner = defaultdict(list)
+    for kid, navn, fylke_id in Kommune.objects.order_by("navn").values_list("id", "navn", "fylke_id"):
+        kommuner[fylke_id].append((kid, navn))
+        kommuner[None].append((kid, navn))
+
+    lag = defaultdict(list)
+    for lid, navn, fylke_id, kommune_id in Lokallag.objects.order_by("navn").values_list(
+        "id", "navn", "fylke_id", "kommune_id",
+    ):
+        for key in {(None, None), (fylke_id, None), (None, kommune_id), (fylke_id, kommune_id)}:
+            lag[key].append((lid, navn))
+
+    postnr = defaultdict(dict)
+    for kommune_id, nummer, poststed in (PostnummerKommune.objects
+                                         .values_list("kommune_id", "postnummer__nummer", "postnummer__poststed")):
+        postnr[kommune_id][nummer] = _postnummer_label(nummer, poststed)
+    alle = Postnummer.objects.order_by("nummer").values_list("nummer", "poststed")[:POSTNUMMER_ALL_LIMIT]
+
+    return {
+        "kommuner": {k: _options(v) for k, v in kommuner.items()},
+        "lokallag": {k: _options(v) for k, v in lag.items()},
+        "postnummer": {
+            **{k: _options(sorted(v.items())) for k, v in postnr.items()},
+            None: _options((n, _postnummer_label(n, s)) for n, s in alle),
+        },
+    }
+
+
+def _data():
+    versjon = current_stamp()[0]
+    with _lock:
+        if _built["versjon"] == versjon:
+            return _built["data"]
+    data = _build()
+    with _lock:
+        _built["versjon"], _built["data"] = versjon, data
+    return data
+
+
+def kommune_options(fylke_id=None):
+    return _data()["kommuner"].get(fylke_id) or format_html('<option value="">(Ingen kommuner)</option>')
+
+
+def lokallag_options(fylke_id=None, kommune_id=None):
+    return _data()["lokallag"].get((fylke_id, kommune_id)) or format_html('<option value="">(Ingen lag)</option>')
+
+
+def postnummer_options(kommune_id=None):
+    return _data()["postnummer"].get(kommune_id) or format_html('<option value="">(Ingen postnummer)</option>')
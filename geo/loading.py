@@ -0,0 +1,102 @@
+# geo/loading.py
+"""
+Felles for lasterne load_kommuner og load_postnummer.
+
+Lasterne leser hele fila, tar ett øyeblikksbilde av tabellene (én spørring
+per tabell) og sammenligner i minnet. Bare forskjellene skrives – med
+bulk_create/bulk_update/delete i én transaksjon – så en uendret fil koster
+noen få spørringer uansett størrelse, og geo-versjonen (geo/stamp.py)
+økes bare når noe faktisk er endret.
+"""
+import csv
+import io
+
+from django.core.management.base import CommandError
+from django.db import models
+
+ENCODINGS = ("utf-8-sig", "utf-8", "cp1252", "latin1")
+
+
+def decode_best(path):
+    raw = path.read_bytes()
+    last_exc = None
+    for enc in ENCODINGS:
+        try:
+            return raw.decode(enc), enc
+        except UnicodeDecodeError as e:
+            last_exc = e
+    raise CommandError(f"Klarte ikke å dekode {path} som UTF-8/cp1252/latin1: {last_exc}")
+
+
+def pick_delimiter(text):
+    header = text.splitlines()[0] if text else ""
+    if "\t" in header:
+        return "\t"
+    if ";" in header:
+        return ";"
+    try:
+        return csv.Sniffer().sniff(text[:2000]).delimiter
+    except csv.Error:
+        return ","
+
+
+def delimiter_name(delim):
+    return "TAB" if delim == "\t" else delim
+
+
+def read_table(path, fallback_fields=None):
+    """
+    (DictReader, enc, delim) for en CSV/TSV-fil i ukjent tegnsett. Har fila
+    ingen header med noen av `fallback_fields`, brukes de som feltnavn.
+    """
+    if not path.exists():
+        raise CommandError(f"Fant ikke fil: {path}")
+    text, enc = decode_best(path)
+    delim = pick_delimiter(text)
+    reader = csv.DictReader(io.StringIO(text), delimiter=delim)
+    if fallback_fields:
+        known = {f.lower() for f in fallback_fields}
+        if not any((fn or "").strip().lower() in known for fn in reader.fieldnames or []):
+            reader = csv.DictReader(io.StringIO(text), delimiter=delim, fieldnames=fallback_fields)
+    return reader, enc, delim
+
+
+def field(row, *keys):
+    """Første ikke-tomme verdi for en av nøklene (uavhengig av store/små bokstaver)."""
+    for k in keys:
+        if row.get(k):
+            return row[k].strip()
+    lower = {(k or "").strip().lower(): v for k, v in row.items()}
+    for k in keys:
+        if lower.get(k.lower()):
+            return lower[k.lower()].strip()
+    return ""
+
+
+def diff(current, incoming):
+    """
+    Sammenlign {nøkkel: verdier} fra databasen med {nøkkel: verdier} fra fila.
+    Gir (nye, endrede, mangler) som lister av nøkler.
+    """
+    new = [k for k in incoming if k not in current]
+    changed = [k for k, v in incoming.items() if k in current and current[k] != v]
+    missing = [k for k in current if k not in incoming]
+    return new, changed, missing
+
+
+def protected_ids(model, ids):
+    """Id-ene i `ids` som ikke kan slettes fordi en PROTECT-FK peker på dem."""
+    used = set()
+    for rel in model._meta.related_objects:
+        if rel.on_delete is models.PROTECT and ids:
+            used.update(
+                rel.related_model._base_manager
+                .filter(**{f"{rel.field.name}__in": ids})
+                .values_list(rel.field.attname, flat=True)
+                .distinct()
+            )
+    return used
+
+
+def counts(new, changed, removed):
+    return f"+{len(new)} ~{len(changed)} -{len(removed)}"
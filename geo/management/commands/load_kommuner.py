@@ -1,100 +1,235 @@
 # geo/management/commands/load_kommuner.py
-import csv, io
+from collections import defaultdict
 from pathlib import Path
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from django.utils.dateparse import parse_date
+from django.utils.text import slugify
+from geo.loading import counts, delimiter_name, diff, field, read_table
 from geo.models import Fylke, Kommune
+from geo.sync import ChangeLog, already_imported, file_sha256, remap_kommuner, resolve_chains
+
+
+def _dates(r):
+    vf = field(r, "validFrom", "gyldigFom", "gyldig_fra")
+    vt = field(r, "validTo", "gyldigTom", "gyldig_til")
+    return (parse_date(vf) if vf else None), (parse_date(vt) if vt else None)
+
+
+def _kommune_row(v):
+    navn, fylke, vf, vt, aktiv = v
+    return {"navn": navn, "fylke": fylke, "gyldig_fra": vf and vf.isoformat(),
+            "gyldig_til": vt and vt.isoformat(), "aktiv": aktiv}
 
-def read_csv_any(path: Path):
-    raw = path.read_bytes()
-    text = None
-    last_exc = None
-    used_enc = None
-    for enc in ("utf-8-sig", "utf-8", "cp1252", "latin1"):
-        try:
-            text = raw.decode(enc)
-            used_enc = enc
-            break
-        except UnicodeDecodeError as e:
-            last_exc = e
-    if text is None:
-        raise CommandError(f"Klarte ikke å dekode {path} som UTF-8/cp1252/latin1: {last_exc}")
-
-    header = text.splitlines()[0] if text else ""
-    if "\t" in header:
-        delim = "\t"
-    elif ";" in header:
-        delim = ";"
-    else:
-        try:
-            dialect = csv.Sniffer().sniff(text[:2000])
-            delim = dialect.delimiter
-        except Exception:
-            delim = ","
-    return csv.DictReader(io.StringIO(text), delimiter=delim), used_enc, delim
 
 class Command(BaseCommand):
-    help = "Importer fylker og kommuner fra SSB KLASS CSV (to filer)."
+    help = (
+        "Importer fylker og kommuner fra SSB KLASS CSV (to filer), og evt. kommuneendringer "
+        "(KLASS «changes») som flytter medlemmer/lokallag fra sammenslåtte kommuner. "
+        "Sammenligner med tabellene og skriver bare endringene."
+    )
 
     def add_arguments(self, parser):
-        parser.add_argument("--fylker", required=True, help="CSV fra KLASS Fylkesinndeling (104)")
-        parser.add_argument("--kommuner", required=True, help="CSV fra KLASS Kommuneinndeling (131)")
+        parser.add_argument("--fylker", help="CSV fra KLASS Fylkesinndeling (104)")
+        parser.add_argument("--kommuner", help="CSV fra KLASS Kommuneinndeling (131)")
+        parser.add_argument("--endringer",
+                            help="CSV med KLASS-endringer for kommuner (oldCode, newCode, changeOccurred)")
+        parser.add_argument("--dry-run", action="store_true", help="Ikke skriv til DB – bare rapporter")
+        parser.add_argument("--prune", action="store_true",
+                            help="Sett kommuner som ikke er i fila som inaktive")
+        parser.add_argument("--force", action="store_true", help="Les filene selv om de er lastet før")
 
     def handle(self, *args, **opts):
-        fylker_csv = Path(opts["fylker"])
-        kommuner_csv = Path(opts["kommuner"])
-        if not fylker_csv.exists() or not kommuner_csv.exists():
-            raise CommandError("Fant ikke angitt CSV-fil.")
-
-        # Fylker
-        reader, enc_f, delim_f = read_csv_any(fylker_csv)
-        f_cnt = 0
+        if bool(opts["fylker"]) != bool(opts["kommuner"]):
+            raise CommandError("--fylker og --kommuner må oppgis sammen.")
+        if not opts["kommuner"] and not opts["endringer"]:
+            raise CommandError("Oppgi --fylker/--kommuner og/eller --endringer.")
+        verbosity = int(opts.get("verbosity", 1))
+        self.vlog = self.stdout.write if verbosity >= 2 else (lambda msg: None)
+        if opts["kommuner"]:
+            self._load_kommuner(opts)
+        if opts["endringer"]:
+            self._load_endringer(opts)
+
+    def _skip(self, kilde, paths, opts):
+        """sha256 for filene, eller None hvis akkurat disse filene allerede er lastet."""
+        for p in paths:
+            if not p.exists():
+                raise CommandError(f"Fant ikke fil: {p}")
+        sha = file_sha256(*paths)
+        if not opts["force"] and already_imported(kilde, sha):
+            names = " + ".join(p.name for p in paths)
+            self.stdout.write(self.style.SUCCESS(f"{names} er allerede lastet (sha256 {sha[:12]}) – hopper over."))
+            return None
+        return sha
+
+    def _load_kommuner(self, opts):
+        fylker_csv, kommuner_csv = Path(opts["fylker"]), Path(opts["kommuner"])
+        sha = self._skip("kommuner", [fylker_csv, kommuner_csv], opts)
+        if sha is None:
+            return
+
+        # --- fylker: Fylke har ikke nummer, så KLASS-koden knyttes via navnet ---
+        reader, enc_f, delim_f = read_table(fylker_csv)
+        fylke_navn = {}    # kode -> navn
         for r in reader:
-            code = (r.get("code") or r.get("Kode") or r.get("kode") or "").strip()
-            name = (r.get("name") or r.get("Navn") or r.get("navn") or "").strip()
-            vf   = (r.get("validFrom") or r.get("gyldigFom") or r.get("gyldig_fra") or "").strip()
-            vt   = (r.get("validTo") or r.get("gyldigTom") or r.get("gyldig_til") or "").strip()
-            if not code or not name:
-                continue
-            Fylke.objects.update_or_create(
-                nummer=code.zfill(2),
-                defaults={
-                    "navn": name,
-                    "gyldig_fra": parse_date(vf) if vf else None,
-                    "gyldig_til": parse_date(vt) if vt else None,
-                },
-            )
-            f_cnt += 1
-
-        # Kommuner
-        reader, enc_k, delim_k = read_csv_any(kommuner_csv)
-        k_cnt = 0
+            code = field(r, "code", "Kode", "kode")
+            name = field(r, "name", "Navn", "navn")
+            if code and name:
+                fylke_navn[code.zfill(2)] = name
+
+        fylke_ids, slugs = {}, set()
+        for fid, navn, slug in Fylke.objects.values_list("id", "navn", "slug"):
+            fylke_ids[navn.lower()] = fid
+            if slug:
+                slugs.add(slug)
+        nye_fylker = sorted({n for n in fylke_navn.values() if n.lower() not in fylke_ids})
+
+        # --- kommuner ---
+        reader, enc_k, delim_k = read_table(kommuner_csv)
+        n_rows = 0
+        kommuner = {}      # nummer -> (navn, fylke, gyldig_fra, gyldig_til, aktiv)
         for r in reader:
-            code = (r.get("code") or r.get("Kode") or r.get("kode") or "").strip()
-            name = (r.get("name") or r.get("Navn") or r.get("navn") or "").strip()
-            vf   = (r.get("validFrom") or r.get("gyldigFom") or r.get("gyldig_fra") or "").strip()
-            vt   = (r.get("validTo") or r.get("gyldigTom") or r.get("gyldig_til") or "").strip()
+            n_rows += 1
+            code = field(r, "code", "Kode", "kode")
+            name = field(r, "name", "Navn", "navn")
             if not code or not name:
                 continue
             fylkesnr = code[:2].zfill(2)
-            try:
-                fylke = Fylke.objects.get(nummer=fylkesnr)
-            except Fylke.DoesNotExist:
+            fnavn = fylke_navn.get(fylkesnr)
+            if fnavn is None:
                 self.stderr.write(f"Advarsel: mangler fylke {fylkesnr} for kommune {code} {name}")
                 continue
-            Kommune.objects.update_or_create(
-                nummer=code.zfill(4),
-                defaults={
-                    "navn": name,
-                    "fylke": fylke,
-                    "gyldig_fra": parse_date(vf) if vf else None,
-                    "gyldig_til": parse_date(vt) if vt else None,
-                    "aktiv": not bool(vt),
-                },
-            )
-            k_cnt += 1
+            vf, vt = _dates(r)
+            # fylke som navn (små bokstaver) til id-ene er kjent – nye fylker har ingen id ennå
+            kommuner[code.zfill(4)] = (name, fnavn.lower(), vf, vt, not vt)
+
+        fylke_navn_by_id = {fid: navn for navn, fid in fylke_ids.items()}
+        ids, current = {}, {}
+        for kid, nummer, navn, fylke_id, vf, vt, aktiv in Kommune.objects.values_list(
+            "id", "nummer", "navn", "fylke_id", "gyldig_fra", "gyldig_til", "aktiv",
+        ):
+            ids[nummer] = kid
+            current[nummer] = (navn, fylke_navn_by_id.get(fylke_id), vf, vt, aktiv)
+
+        new, changed, missing = diff(current, kommuner)
+        deaktiver = [nr for nr in missing if current[nr][4]] if opts["prune"] else []
+
+        log = ChangeLog()
+        # nøkkelen er KLASS-fylkesnummeret (navn som «Finnmark - Finnmárku - Finmarkku» er for lange)
+        fylke_kode = {navn: kode for kode, navn in fylke_navn.items()}
+        for n in nye_fylker:
+            log.add("fylke", fylke_kode[n], "+", til={"navn": n})
+        for nr in new:
+            log.add("kommune", nr, "+", til=_kommune_row(kommuner[nr]))
+        for nr in changed:
+            log.add("kommune", nr, "~", fra=_kommune_row(current[nr]), til=_kommune_row(kommuner[nr]))
+        for nr in deaktiver:
+            log.add("kommune", nr, "-", fra={"navn": current[nr][0], "aktiv": True}, til={"aktiv": False})
+        for e in log.rows:
+            self.vlog(f"{e.handling} {e.tabell} {e.nokkel} {e.fra or ''} → {e.til or ''}")
+
+        if not opts["dry_run"]:
+            with transaction.atomic():
+                if nye_fylker:
+                    objs = []
+                    for navn in nye_fylker:
+                        base = slugify(navn) or "fylke"
+                        slug, i = base, 2
+                        while slug in slugs:
+                            slug, i = f"{base}-{i}", i + 1
+                        slugs.add(slug)
+                        objs.append(Fylke(navn=navn, slug=slug, homepage_title=navn))
+                    Fylke.objects.bulk_create(objs)
+                    fylke_ids.update((n.lower(), fid) for n, fid in
+                                     Fylke.objects.filter(navn__in=nye_fylker).values_list("navn", "id"))
+
+                def build(nr):
+                    navn, fylke, vf, vt, aktiv = kommuner[nr]
+                    return Kommune(id=ids.get(nr), nummer=nr, navn=navn, fylke_id=fylke_ids[fylke],
+                                   gyldig_fra=vf, gyldig_til=vt, aktiv=aktiv)
+
+                if new:
+                    Kommune.objects.bulk_create([build(nr) for nr in new], batch_size=1000)
+                if changed:
+                    Kommune.objects.bulk_update(
+                        [build(nr) for nr in changed],
+                        ["navn", "fylke", "gyldig_fra", "gyldig_til", "aktiv"], batch_size=1000,
+                    )
+                if deaktiver:
+                    Kommune.objects.filter(id__in=[ids[nr] for nr in deaktiver]).update(aktiv=False)
+                # lagres også uten endringer, så samme filer hoppes over neste gang;
+                # geo-versjonen økes bare når noe er endret (geo/stamp.py)
+                log.save("kommuner", f"{fylker_csv.name} + {kommuner_csv.name}", sha, rader=n_rows)
+
+        prefix = "Tørrkjøring – ingenting skrevet. " if opts["dry_run"] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}Fylker: {len(fylke_navn)}, nye {len(nye_fylker)} "
+            f"(enc={enc_f}, delim={delimiter_name(delim_f)}) | "
+            f"Kommuner: {len(kommuner)} {counts(new, changed, deaktiver)} "
+            f"(enc={enc_k}, delim={delimiter_name(delim_k)})"
+        ))
+
+    def _load_endringer(self, opts):
+        path = Path(opts["endringer"])
+        sha = self._skip("kommuneendringer", [path], opts)
+        if sha is None:
+            return
+
+        reader, _, _ = read_table(path)
+        n_rows = 0
+        pairs, dato = defaultdict(set), {}
+        for r in reader:
+            n_rows += 1
+            old = field(r, "oldCode", "gammelKode", "fra")
+            new = field(r, "newCode", "nyKode", "til")
+            if not old or not new or old.zfill(4) == new.zfill(4):
+                continue
+            old, new = old.zfill(4), new.zfill(4)
+            pairs[old].add(new)
+            when = field(r, "changeOccurred", "endret", "dato")
+            if when:
+                dato[old] = parse_date(when)
+        final, split = resolve_chains(pairs)
+
+        kommuner = {nr: (kid, navn, aktiv, vt) for kid, nr, navn, aktiv, vt in
+                    Kommune.objects.values_list("id", "nummer", "navn", "aktiv", "gyldig_til")}
+        mapping, log, ukjent = {}, ChangeLog(), set()
+        for old, new in sorted(final.items()):
+            if old not in kommuner:
+                continue   # gammel kommune finnes ikke her – ingenting å flytte
+            if new not in kommuner:
+                ukjent.add(new)
+                continue
+            mapping[kommuner[old][0]] = kommuner[new][0]
+            log.add("kommune", old, ">", fra={"navn": kommuner[old][1], "aktiv": kommuner[old][2]},
+                    til={"nummer": new, "navn": kommuner[new][1]})
+        for e in log.rows:
+            self.vlog(f"> {e.nokkel} {e.fra['navn']} → {e.til['nummer']} {e.til['navn']}")
+
+        moved = {}
+        if not opts["dry_run"]:
+            with transaction.atomic():
+                moved = remap_kommuner(mapping)
+                # de gamle kommunene blir inaktive, med endringsdatoen som gyldig_til
+                by_date = defaultdict(list)
+                for old in final:
+                    if old in kommuner and kommuner[old][0] in mapping and kommuner[old][2]:
+                        by_date[kommuner[old][3] or dato.get(old)].append(kommuner[old][0])
+                for vt, kids in by_date.items():
+                    Kommune.objects.filter(id__in=kids).update(aktiv=False, gyldig_til=vt)
+                log.save("kommuneendringer", path.name, sha, rader=n_rows)
 
+        if split:
+            self.stderr.write("Advarsel: delte kommuner må flyttes manuelt: " + "; ".join(
+                f"{old} → {', '.join(new)}" for old, new in sorted(split.items())
+            ))
+        if ukjent:
+            self.stderr.write(f"Advarsel: nye kommunenumre som ikke finnes (last kommunefila først): "
+                              f"{', '.join(sorted(ukjent))}")
+        prefix = "Tørrkjøring – ingenting skrevet. " if opts["dry_run"] else ""
+        flyttet = ", ".join(f"{label}: {n}" for label, n in sorted(moved.items()) if n) or "ingen rader"
         self.stdout.write(self.style.SUCCESS(
-            f"Fylker: {f_cnt} (enc={enc_f}, delim={'TAB' if delim_f=='\\t' else delim_f}) | "
-            f"Kommuner: {k_cnt} (enc={enc_k}, delim={'TAB' if delim_k=='\\t' else delim_k})"
+            f"{prefix}Kommuneendringer: {len(mapping)} sammenslått/omnummerert, {len(split)} delt | "
+            f"flyttet {flyttet}"
         ))
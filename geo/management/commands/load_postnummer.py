@@ -1,113 +1,150 @@
-import csv, io
 from pathlib import Path
-from django.core.management.base import BaseCommand, CommandError
-from django.apps import apps
-
-Postnummer = apps.get_model("geo", "Postnummer")
-Kommune = apps.get_model("geo", "Kommune")
-try:
-    PostnummerKommune = apps.get_model("geo", "PostnummerKommune")
-    HAS_PNK = True
-except LookupError:
-    PostnummerKommune = None
-    HAS_PNK = False
-
-def decode_best(path: Path):
-    raw = path.read_bytes()
-    last_exc = None
-    for enc in ("utf-8-sig", "utf-8", "cp1252", "latin1"):
-        try:
-            return raw.decode(enc), enc
-        except UnicodeDecodeError as e:
-            last_exc = e
-    raise CommandError(f"Klarte ikke å dekode {path} som UTF-8/cp1252/latin1: {last_exc}")
-
-def pick_delimiter(text: str):
-    header = text.splitlines()[0] if text else ""
-    if "\t" in header: return "\t", "TAB"
-    if ";" in header:  return ";",  ";"
-    try:
-        dialect = csv.Sniffer().sniff(text[:2000])
-        return dialect.delimiter, dialect.delimiter
-    except Exception:
-        return ",", ","
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from geo.loading import counts, delimiter_name, diff, field, protected_ids, read_table
+from geo.models import Kommune, Postnummer, PostnummerKommune
+from geo.sync import ChangeLog, already_imported, file_sha256
+
+# feltnavn når fila mangler header (Brings tabulatorseparerte postnummerregister)
+MANUAL_FIELDS = ["Postnummer", "Poststed", "Kommunenummer", "Kommunenavn", "Kategori"]
+
 
 class Command(BaseCommand):
-    help = "Importer Postens/Bring postnummer (tåler ANSI/UTF-8; TSV/CSV; med/uten header)."
+    help = (
+        "Importer Postens/Bring postnummer (tåler ANSI/UTF-8; TSV/CSV; med/uten header). "
+        "Sammenligner med tabellene og skriver bare endringene."
+    )
 
     def add_arguments(self, parser):
         parser.add_argument("--fil", required=True, help="Sti til filen (tsv/csv/txt)")
         parser.add_argument("--dry-run", action="store_true", help="Ikke skriv til DB – bare rapporter")
+        parser.add_argument("--prune", action="store_true",
+                            help="Slett postnumre som ikke er i fila (unntatt de som er i bruk)")
+        parser.add_argument("--force", action="store_true", help="Les fila selv om den er lastet før")
 
     def handle(self, *args, **opts):
         verbosity = int(opts.get("verbosity", 1))
+
         def vlog(msg):
             if verbosity >= 2:
                 self.stdout.write(msg)
 
-        p = Path(opts["fil"])
-        if not p.exists():
-            raise CommandError(f"Fant ikke fil: {p}")
-
-        text, enc = decode_best(p)
-        delim, delim_name = pick_delimiter(text)
-
-        # Første forsøk: anta header
-        reader = csv.DictReader(io.StringIO(text), delimiter=delim)
-        fieldnames = [fn.strip() for fn in (reader.fieldnames or [])]
-
-        # Hvis første linje ser ut som DATA (ikke header), sett felt manuelt
-        expected = {"postnummer", "poststed", "kommunenummer", "kommunenavn", "kategori"}
-        if not any(fn.lower() in expected for fn in fieldnames):
-            manual_fields = ["Postnummer", "Poststed", "Kommunenummer", "Kommunenavn", "Kategori"]
-            reader = csv.DictReader(io.StringIO(text), delimiter=delim, fieldnames=manual_fields)
-            fieldnames = manual_fields
-            vlog("Ingen gyldig header funnet – bruker manuelle felt: " + ", ".join(manual_fields))
+        path = Path(opts["fil"])
+        sha = file_sha256(path) if path.exists() else ""
+        if sha and not opts["force"] and already_imported("postnummer", sha):
+            self.stdout.write(self.style.SUCCESS(f"{path.name} er allerede lastet (sha256 {sha[:12]}) – ingenting å gjøre."))
+            return
 
-        vlog(f"Felt i fil: {fieldnames}")
-
-        # Hent felter fra dict uansett variant / case
-        def g(d, *keys):
-            for k in keys:
-                if k in d: return d[k]
-            lower = {k.lower(): v for k, v in d.items()}
-            for k in keys:
-                v = lower.get(k.lower())
-                if v is not None: return v
-            return ""
-
-        has_kategori_field = "kategori" in {f.name for f in Postnummer._meta.get_fields()}
+        reader, enc, delim = read_table(path, MANUAL_FIELDS)
+        if reader.fieldnames == MANUAL_FIELDS:
+            vlog("Ingen gyldig header funnet – bruker manuelle felt: " + ", ".join(MANUAL_FIELDS))
 
+        # --- fila ---
         n_rows = 0
-        n_written = 0
+        poster = {}        # nummer -> (poststed, kategori)
+        kommunenr = {}     # nummer -> {kommunenummer}
         for r in reader:
             n_rows += 1
-            nr   = (g(r, "postnummer", "Postnummer") or "").strip()
-            sted = (g(r, "poststed", "Poststed") or "").strip().title()
-            kat  = (g(r, "kategori", "Kategori") or "").strip()[:1].upper()
-            k_nr = (g(r, "kommunenummer", "Kommunenummer") or "").strip()
-
+            nr = field(r, "postnummer", "Postnummer")
+            sted = field(r, "poststed", "Poststed").title()
             if not nr or not sted:
                 continue
-
-            defaults = {"poststed": sted}
-            if has_kategori_field:
-                defaults["kategori"] = kat or ""
-
-            if not opts["dry_run"]:
-                pn, _ = Postnummer.objects.update_or_create(
-                    nummer=nr.zfill(4),
-                    defaults=defaults,
-                )
-                if HAS_PNK and k_nr:
-                    k = Kommune.objects.filter(nummer=k_nr.zfill(4)).first()
-                    if k:
-                        PostnummerKommune.objects.update_or_create(
-                            postnummer=pn, kommune=k, defaults={"primar": True}
-                        )
-                n_written += 1
-
+            nr = nr.zfill(4)
+            poster[nr] = (sted, field(r, "kategori", "Kategori")[:1].upper())
+            k_nr = field(r, "kommunenummer", "Kommunenummer")
+            if k_nr:
+                kommunenr.setdefault(nr, set()).add(k_nr.zfill(4))
+
+        # --- øyeblikksbilde: tre spørringer ---
+        ids, current = {}, {}
+        for pid, nr, sted, kat in Postnummer.objects.values_list("id", "nummer", "poststed", "kategori"):
+            ids[nr], current[nr] = pid, (sted, kat)
+        nr_by_id = {pid: nr for nr, pid in ids.items()}
+        kommune_ids = dict(Kommune.objects.values_list("nummer", "id"))
+        links_now = {}     # (nummer, kommune_id) -> (id, primar)
+        for lid, pid, kid, primar in PostnummerKommune.objects.values_list("id", "postnummer_id", "kommune_id", "primar"):
+            links_now[(nr_by_id[pid], kid)] = (lid, primar)
+
+        # --- forskjeller ---
+        new, changed, missing = diff(current, poster)
+
+        ukjent_kommune = set()
+        links = {}         # (nummer, kommune_id) -> primar; kommunen i fila er primærkommunen
+        for nr, k_nrs in kommunenr.items():
+            for k_nr in k_nrs:
+                kid = kommune_ids.get(k_nr)
+                if kid is None:
+                    ukjent_kommune.add(k_nr)
+                else:
+                    links[(nr, kid)] = True
+        # koblinger fjernes bare for postnumre der fila har minst én kjent kommune
+        styrt = {nr for nr, _ in links}
+        links_current = {key: primar for key, (_, primar) in links_now.items() if key[0] in styrt}
+        new_links, changed_links, removed_links = diff(links_current, links)
+
+        pruned = []
+        if opts["prune"] and missing:
+            in_use = protected_ids(Postnummer, [ids[nr] for nr in missing])
+            pruned = [nr for nr in missing if ids[nr] not in in_use]
+            if len(pruned) < len(missing):
+                self.stdout.write(f"{len(missing) - len(pruned)} postnummer mangler i fila, men er i bruk – beholdt.")
+
+        # endringslogg (GeoEndring) – samme rader som vises med -v2
+        log = ChangeLog()
+        kommune_nr = {kid: nr for nr, kid in kommune_ids.items()}
+
+        def row(v):
+            return {"poststed": v[0], "kategori": v[1]}
+
+        for nr in new:
+            log.add("postnummer", nr, "+", til=row(poster[nr]))
+        for nr in changed:
+            log.add("postnummer", nr, "~", fra=row(current[nr]), til=row(poster[nr]))
+        for nr in pruned:
+            log.add("postnummer", nr, "-", fra=row(current[nr]))
+        for key in new_links:
+            log.add("postnummerkommune", f"{key[0]}/{kommune_nr[key[1]]}", "+", til={"primar": True})
+        for key in changed_links:
+            log.add("postnummerkommune", f"{key[0]}/{kommune_nr[key[1]]}", "~", fra={"primar": False}, til={"primar": True})
+        for key in removed_links:
+            log.add("postnummerkommune", f"{key[0]}/{kommune_nr[key[1]]}", "-", fra={"primar": links_now[key][1]})
+        for e in log.rows:
+            vlog(f"{e.handling} {e.tabell} {e.nokkel} {e.fra or ''} → {e.til or ''}")
+
+        if not opts["dry_run"]:
+            with transaction.atomic():
+                if new:
+                    Postnummer.objects.bulk_create(
+                        [Postnummer(nummer=nr, poststed=poster[nr][0], kategori=poster[nr][1]) for nr in new],
+                        batch_size=1000,
+                    )
+                    ids.update(Postnummer.objects.filter(nummer__in=new).values_list("nummer", "id"))
+                if changed:
+                    Postnummer.objects.bulk_update(
+                        [Postnummer(id=ids[nr], nummer=nr, poststed=poster[nr][0], kategori=poster[nr][1])
+                         for nr in changed],
+                        ["poststed", "kategori"], batch_size=1000,
+                    )
+                if removed_links:
+                    PostnummerKommune.objects.filter(id__in=[links_now[k][0] for k in removed_links]).delete()
+                if changed_links:
+                    PostnummerKommune.objects.filter(id__in=[links_now[k][0] for k in changed_links]).update(primar=True)
+                if new_links:
+                    PostnummerKommune.objects.bulk_create(
+                        [PostnummerKommune(postnummer_id=ids[nr], kommune_id=kid, primar=True) for nr, kid in new_links],
+                        batch_size=1000,
+                    )
+                if pruned:
+                    Postnummer.objects.filter(id__in=[ids[nr] for nr in pruned]).delete()
+                # lagres også uten endringer, så samme fil hoppes over neste gang;
+                # geo-versjonen økes bare når noe er endret (geo/stamp.py)
+                log.save("postnummer", path.name, sha, rader=n_rows)
+
+        if ukjent_kommune:
+            self.stderr.write(f"Advarsel: ukjente kommunenumre: {', '.join(sorted(ukjent_kommune))}")
+        prefix = "Tørrkjøring – ingenting skrevet. " if opts["dry_run"] else ""
         self.stdout.write(self.style.SUCCESS(
-            f"Lest {n_rows} rader | skrevet {n_written} | enc={enc} | delim={delim_name} | "
-            f"PNK={'ja' if HAS_PNK else 'nei'}"
+            f"{prefix}Lest {n_rows} rader | postnummer {counts(new, changed, pruned)} | "
+            f"koblinger {counts(new_links, changed_links, removed_links)} | "
+            f"enc={enc} | delim={delimiter_name(delim)}"
         ))
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geo', '0006_fill_homepage_title'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeoStamp',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('versjon', models.PositiveBigIntegerField(default=1)),
+                ('endret', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Geo-versjon',
+                'verbose_name_plural': 'Geo-versjon',
+            },
+        ),
+    ]
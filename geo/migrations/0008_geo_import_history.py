@@ -0,0 +1,53 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:39
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geo', '0007_geostamp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeoImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kilde', models.CharField(choices=[('postnummer', 'Postnummer (Bring)'), ('kommuner', 'Fylker og kommuner (KLASS)'), ('kommuneendringer', 'Kommuneendringer (KLASS)')], max_length=20)),
+                ('filnavn', models.CharField(max_length=255)),
+                ('sha256', models.CharField(max_length=64)),
+                ('rader', models.PositiveIntegerField(default=0)),
+                ('nye', models.PositiveIntegerField(default=0)),
+                ('endrede', models.PositiveIntegerField(default=0)),
+                ('fjernede', models.PositiveIntegerField(default=0)),
+                ('versjon', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('importert', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Geo-import',
+                'verbose_name_plural': 'Geo-importer',
+                'ordering': ['-importert', '-id'],
+                'indexes': [models.Index(fields=['kilde', 'sha256'], name='geo_import_kilde_sha_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='GeoEndring',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tabell', models.CharField(max_length=30)),
+                ('nokkel', models.CharField(max_length=20)),
+                ('handling', models.CharField(choices=[('+', 'Ny'), ('~', 'Endret'), ('-', 'Fjernet'), ('>', 'Slått sammen')], max_length=1)),
+                ('fra', models.JSONField(blank=True, null=True)),
+                ('til', models.JSONField(blank=True, null=True)),
+                ('geo_import', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='endringer', to='geo.geoimport')),
+            ],
+            options={
+                'verbose_name': 'Geo-endring',
+                'verbose_name_plural': 'Geo-endringer',
+                'indexes': [models.Index(fields=['tabell', 'nokkel'], name='geo_endring_tabell_nokkel_idx')],
+            },
+        ),
+    ]
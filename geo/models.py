@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
 from django.db import models
@@ -60,3 +61,74 @@ class PostnummerKommune(models.Model):
 
     class Meta:
         unique_together = [("postnummer", "kommune")]
+
+
+class GeoStamp(models.Model):
+    """
+    Én rad: versjonsnummer for geo-tabellene (fylke/kommune/postnummer og
+    lokallag). Økes av lasterne og ved endringer i admin (geo/signals.py);
+    caches i hver prosess bygges på nytt når tallet endrer seg (geo/stamp.py).
+    """
+    versjon = models.PositiveBigIntegerField(default=1)
+    endret  = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Geo-versjon"
+        verbose_name_plural = "Geo-versjon"
+
+    def __str__(self):
+        return f"v{self.versjon} ({self.endret:%Y-%m-%d %H:%M})"
+
+
+class GeoImport(models.Model):
+    """
+    Én innlasting av referansedata (geo/sync.py). sha256 av fila gjør at en
+    fil som allerede er lastet hoppes over; versjon er GeoStamp etter importen.
+    """
+    KILDER = (
+        ("postnummer", "Postnummer (Bring)"),
+        ("kommuner", "Fylker og kommuner (KLASS)"),
+        ("kommuneendringer", "Kommuneendringer (KLASS)"),
+    )
+    kilde     = models.CharField(max_length=20, choices=KILDER)
+    filnavn   = models.CharField(max_length=255)
+    sha256    = models.CharField(max_length=64)
+    rader     = models.PositiveIntegerField(default=0)
+    nye       = models.PositiveIntegerField(default=0)
+    endrede   = models.PositiveIntegerField(default=0)
+    fjernede  = models.PositiveIntegerField(default=0)
+    versjon   = models.PositiveBigIntegerField(null=True, blank=True)
+    importert = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["-importert", "-id"]
+        indexes = [models.Index(fields=["kilde", "sha256"], name="geo_import_kilde_sha_idx")]
+        verbose_name = "Geo-import"
+        verbose_name_plural = "Geo-importer"
+
+    def __str__(self):
+        return f"{self.get_kilde_display()} {self.importert:%Y-%m-%d %H:%M}"
+
+
+class GeoEndring(models.Model):
+    """Endringslogg per rad for en GeoImport (ny/endret/fjernet/slått sammen)."""
+    HANDLINGER = (
+        ("+", "Ny"),
+        ("~", "Endret"),
+        ("-", "Fjernet"),
+        (">", "Slått sammen"),
+    )
+    geo_import = models.ForeignKey(GeoImport, on_delete=models.CASCADE, related_name="endringer")
+    tabell     = models.CharField(max_length=30)    # postnummer, postnummerkommune, fylke, kommune
+    nokkel     = models.CharField(max_length=20)    # postnummer/kommunenummer/fylkesnummer (evt. "0301/0301")
+    handling   = models.CharField(max_length=1, choices=HANDLINGER)
+    fra        = models.JSONField(null=True, blank=True)
+    til        = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["tabell", "nokkel"], name="geo_endring_tabell_nokkel_idx")]
+        verbose_name = "Geo-endring"
+        verbose_name_plural = "Geo-endringer"
+
+    def __str__(self):
+        return f"{self.handling} {self.tabell} {self.nokkel}"
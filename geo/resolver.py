@@ -0,0 +1,149 @@
+# geo/resolver.py
+"""
+Postnummer → kommune/fylke uten databaseoppslag per kall.
+
+Hele Postnummer/PostnummerKommune-tabellen (~5000 rader) lastes én gang per
+prosess inn i faste array-er indeksert på postnummeret som tall (0000–9999),
+så et oppslag er ett indeksoppslag. Tabellen bygges på nytt (tre spørringer)
+når geo-versjonen endres (geo/stamp.py), som for fragmentene i geo/fragments.py.
+
+Primærkommune: koblingen med primar=True, ellers den første (laveste id) –
+samme regel som de gamle oppslagene i skjema og API.
+"""
+import threading
+from array import array
+from collections import namedtuple
+
+from .models import Fylke, Kommune, Postnummer, PostnummerKommune
+from .stamp import current_stamp
+
+SLOTS = 10000
+_lock = threading.Lock()
+_built = {"versjon": None, "table": None}
+
+KommuneRef = namedtuple("KommuneRef", "id nummer navn fylke_id fylke_navn")
+PostnummerRef = namedtuple("PostnummerRef", "id nummer poststed kommune")
+
+
+def _slot(nummer):
+    s = str(nummer or "").strip()
+    if not s.isdigit() or len(s) > 4:
+        return None
+    return int(s)
+
+
+class PostnummerTable:
+    """Kompakt oppslagstabell; bygges av load_table(), aldri endret etterpå."""
+
+    def __init__(self):
+        self.pn_id = array("l", [0]) * SLOTS          # Postnummer.id per slot (0 = finnes ikke)
+        self.pn_kommune = array("l", [-1]) * SLOTS    # indeks i kommune-tabellen (-1 = ingen)
+        self.poststed = [None] * SLOTS
+        self.alternativer = {}                        # slot -> alle kommune-indekser når > 1
+        self.slot_by_id = {}                          # Postnummer.id -> slot
+        self.k_id = array("l")
+        self.k_fylke = array("l")
+        self.k_nummer = []
+        self.k_navn = []
+        self.fylke_navn = {}
+
+    def kommune(self, idx):
+        if idx < 0:
+            return None
+        fylke_id = self.k_fylke[idx]
+        return KommuneRef(self.k_id[idx], self.k_nummer[idx], self.k_navn[idx],
+                          fylke_id, self.fylke_navn.get(fylke_id, ""))
+
+    def lookup(self, slot):
+        if slot is None or not self.pn_id[slot]:
+            return None
+        return PostnummerRef(self.pn_id[slot], f"{slot:04d}", self.poststed[slot],
+                             self.kommune(self.pn_kommune[slot]))
+
+    def kandidater(self, slot):
+        if slot is None or not self.pn_id[slot]:
+            return []
+        idxs = self.alternativer.get(slot) or ((self.pn_kommune[slot],) if self.pn_kommune[slot] >= 0 else ())
+        return [self.kommune(i) for i in idxs]
+
+
+def load_table():
+    t = PostnummerTable()
+    t.fylke_navn = dict(Fylke.objects.values_list("id", "navn"))
+    k_index = {}
+    for kid, nummer, navn, fylke_id in Kommune.objects.order_by("id").values_list("id", "nummer", "navn", "fylke_id"):
+        k_index[kid] = len(t.k_id)
+        t.k_id.append(kid)
+        t.k_fylke.append(fylke_id)
+        t.k_nummer.append(nummer)
+        t.k_navn.append(navn)
+
+    for pid, nummer, poststed in Postnummer.objects.values_list("id", "nummer", "poststed"):
+        slot = _slot(nummer)
+        if slot is None:
+            continue
+        t.pn_id[slot] = pid
+        t.poststed[slot] = poststed
+        t.slot_by_id[pid] = slot
+
+    # primær først, deretter laveste id – første treff per postnummer blir primærkommunen
+    for pid, kid in (PostnummerKommune.objects.order_by("-primar", "id")
+                     .values_list("postnummer_id", "kommune_id")):
+        slot, idx = t.slot_by_id.get(pid), k_index.get(kid)
+        if slot is None or idx is None:
+            continue
+        if t.pn_kommune[slot] < 0:
+            t.pn_kommune[slot] = idx
+        else:
+            t.alternativer.setdefault(slot, [t.pn_kommune[slot]]).append(idx)
+    return t
+
+
+def _table():
+    versjon = current_stamp()[0]
+    with _lock:
+        if _built["versjon"] == versjon:
+            return _built["table"]
+    table = load_table()
+    with _lock:
+        _built["versjon"], _built["table"] = versjon, table
+    return table
+
+
+def resolve(nummer):
+    """PostnummerRef (id, nummer, poststed, primærkommune) eller None."""
+    return _table().lookup(_slot(nummer))
+
+
+def resolve_id(postnummer_id):
+    """Som resolve(), men fra Postnummer.id (f.eks. Medlem.postnummer_id)."""
+    t = _table()
+    return t.lookup(t.slot_by_id.get(postnummer_id))
+
+
+def kommune_for(nummer, kommune_navn=""):
+    """
+    Kommunen for et postnummer. Er `kommune_navn` oppgitt og postnummeret
+    ligger i flere kommuner, velges den med samme navn; ellers primærkommunen.
+    """
+    t = _table()
+    slot = _slot(nummer)
+    if kommune_navn:
+        wanted = kommune_navn.strip().lower()
+        for k in t.kandidater(slot):
+            if k.navn.strip().lower() == wanted:
+                return k
+    ref = t.lookup(slot)
+    return ref.kommune if ref else None
+
+
+def kommune_instance(ref):
+    """
+    Kommune-instans (med fylke) bygget fra en KommuneRef uten spørring –
+    til FK-tilordning og skjema-data. Ikke ment for å lagres.
+    """
+    if ref is None:
+        return None
+    k = Kommune(id=ref.id, nummer=ref.nummer, navn=ref.navn, fylke_id=ref.fylke_id)
+    k.fylke = Fylke(id=ref.fylke_id, navn=ref.fylke_navn)
+    return k
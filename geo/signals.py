@@ -0,0 +1,17 @@
+# geo/signals.py
+from django.db.models.signals import post_delete, post_save
+
+from .stamp import bump_stamp
+
+# Lokallag ligger i members, men inngår i nedtrekkene – lat referanse med streng
+GEO_MODELS = ("geo.Fylke", "geo.Kommune", "geo.Postnummer", "geo.PostnummerKommune", "members.Lokallag")
+
+
+def geo_changed(sender, **kwargs):
+    # lasterne gjør masseoperasjoner uten signaler og kaller bump_stamp() selv
+    bump_stamp()
+
+
+for model in GEO_MODELS:
+    post_save.connect(geo_changed, sender=model, dispatch_uid=f"geo_stamp_save_{model}")
+    post_delete.connect(geo_changed, sender=model, dispatch_uid=f"geo_stamp_delete_{model}")
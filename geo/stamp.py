@@ -0,0 +1,51 @@
+# geo/stamp.py
+"""
+Versjonsstempel for geo-data, delt mellom prosesser via GeoStamp-raden.
+
+current_stamp() leses fra databasen høyst hvert GEO_STAMP_TTL sekund per
+prosess; bump_stamp() øker versjonen (F()-oppdatering, trygt ved samtidighet).
+Prosess-cacher (geo/fragments.py m.fl.) nøkler på versjonen og bygges på nytt
+når den endres.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import GeoStamp
+
+STAMP_TTL = float(getattr(settings, "GEO_STAMP_TTL", 5))
+_lock = threading.Lock()
+_cached = {"stamp": None, "checked": 0.0}
+
+
+def _read():
+    row = GeoStamp.objects.filter(pk=1).values_list("versjon", "endret").first()
+    if row is None:
+        obj, _ = GeoStamp.objects.get_or_create(pk=1, defaults={"endret": timezone.now()})
+        row = (obj.versjon, obj.endret)
+    return row
+
+
+def current_stamp():
+    """(versjon, endret) – høyst STAMP_TTL sekunder gammel."""
+    now = time.monotonic()
+    with _lock:
+        if _cached["stamp"] is not None and now - _cached["checked"] < STAMP_TTL:
+            return _cached["stamp"]
+    stamp = _read()
+    with _lock:
+        _cached["stamp"], _cached["checked"] = stamp, now
+    return stamp
+
+
+def bump_stamp():
+    """Marker geo-data som endret (alle prosesser ser det innen STAMP_TTL)."""
+    updated = GeoStamp.objects.filter(pk=1).update(versjon=F("versjon") + 1, endret=timezone.now())
+    if not updated:
+        GeoStamp.objects.get_or_create(pk=1, defaults={"endret": timezone.now()})
+    with _lock:
+        _cached["stamp"] = None
+
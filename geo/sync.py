@@ -0,0 +1,133 @@
+# geo/sync.py
+"""
+Versjonert innlasting av geo-referansedata.
+
+Hver fil som lastes blir en GeoImport med sha256 av innholdet; en fil som
+allerede er lastet (samme kilde og hash) hoppes over uten å parses.
+Radendringene lasterne finner (geo/loading.py) lagres som GeoEndring, så
+man kan se hva en kommunereform eller ny postnummerfil faktisk endret.
+
+Kommunesammenslåinger (KLASS «changes»: gammel kode → ny kode) flyttes med
+remap_kommuner(): én UPDATE per målkommune og FK-tabell som peker på
+Kommune (Medlem.kommune, Lokallag.kommune, Campaign.maal_kommune, …), i
+stedet for manuell opprydding etter en full innlasting.
+"""
+import hashlib
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import GeoEndring, GeoImport, GeoStamp, Kommune, PostnummerKommune
+from .stamp import bump_stamp
+
+HASH_CHUNK = 1 << 20
+
+
+def file_sha256(*paths):
+    """sha256 over innholdet i én eller flere filer (lest i biter)."""
+    h = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_CHUNK), b""):
+                h.update(block)
+    return h.hexdigest()
+
+
+def already_imported(kilde, sha):
+    return GeoImport.objects.filter(kilde=kilde, sha256=sha).exists()
+
+
+class ChangeLog:
+    """Samler GeoEndring-rader til de lagres med bulk_create i save()."""
+
+    def __init__(self):
+        self.rows = []
+        self.counts = {"+": 0, "~": 0, "-": 0, ">": 0}
+
+    def add(self, tabell, nokkel, handling, fra=None, til=None):
+        self.rows.append(GeoEndring(tabell=tabell, nokkel=str(nokkel), handling=handling, fra=fra, til=til))
+        self.counts[handling] += 1
+
+    def __len__(self):
+        return len(self.rows)
+
+    def save(self, kilde, filnavn, sha, rader=0):
+        """Lagre importen og endringene, og øk geo-versjonen hvis noe er endret."""
+        if self.rows:
+            bump_stamp()
+        imp = GeoImport.objects.create(
+            kilde=kilde, filnavn=filnavn[:255], sha256=sha, rader=rader,
+            nye=self.counts["+"], endrede=self.counts["~"] + self.counts[">"], fjernede=self.counts["-"],
+            versjon=GeoStamp.objects.filter(pk=1).values_list("versjon", flat=True).first(),
+        )
+        for row in self.rows:
+            row.geo_import = imp
+        GeoEndring.objects.bulk_create(self.rows, batch_size=1000)
+        return imp
+
+
+def resolve_chains(pairs):
+    """
+    {gammel: {nye}} fra endringsfila → {gammel: endelig ny} for entydige
+    endringer, fulgt gjennom kjeder (A→B, B→C gir A→C). Splittinger (én
+    gammel til flere nye) gir ingen entydig mål og returneres for seg.
+    """
+    direct = {old: next(iter(new)) for old, new in pairs.items() if len(new) == 1}
+    split = {old: sorted(new) for old, new in pairs.items() if len(new) > 1}
+    final = {}
+    for old in direct:
+        seen, cur = {old}, direct[old]
+        while cur in direct and cur not in seen:
+            seen.add(cur)
+            cur = direct[cur]
+        if cur != old:
+            final[old] = cur
+    return final, split
+
+
+def _remap_links(olds, new):
+    """PostnummerKommune: flytt koblinger uten å bryte unik (postnummer, kommune)."""
+    have = set(PostnummerKommune.objects.filter(kommune_id=new).values_list("postnummer_id", flat=True))
+    move, drop, primar = [], [], set()
+    for lid, pid, is_primar in (PostnummerKommune.objects.filter(kommune_id__in=olds)
+                                .order_by("-primar", "id").values_list("id", "postnummer_id", "primar")):
+        if pid in have:
+            drop.append(lid)
+            if is_primar:
+                primar.add(pid)
+        else:
+            have.add(pid)
+            move.append(lid)
+    if drop:
+        PostnummerKommune.objects.filter(id__in=drop).delete()
+    if move:
+        PostnummerKommune.objects.filter(id__in=move).update(kommune_id=new)
+    if primar:
+        PostnummerKommune.objects.filter(kommune_id=new, postnummer_id__in=primar).update(primar=True)
+    return len(move) + len(drop)
+
+
+@transaction.atomic
+def remap_kommuner(mapping):
+    """
+    Flytt alt som peker på en gammel kommune over til den nye.
+    `mapping` er {gammel kommune-id: ny kommune-id}. Gir {tabell: antall}.
+    """
+    by_target = defaultdict(list)
+    for old, new in mapping.items():
+        if old != new:
+            by_target[new].append(old)
+    moved = defaultdict(int)
+    # også skjulte relasjoner (related_name="+", f.eks. Campaign.maal_kommune),
+    # som ikke er med i _meta.related_objects
+    for rel in Kommune._meta.get_fields(include_hidden=True):
+        if not (rel.one_to_many and rel.auto_created and not rel.concrete):
+            continue
+        model, attname = rel.related_model, rel.field.attname
+        label = model._meta.label_lower
+        for new, olds in by_target.items():
+            if model is PostnummerKommune:
+                moved[label] += _remap_links(olds, new)
+            else:
+                moved[label] += model._base_manager.filter(**{f"{attname}__in": olds}).update(**{attname: new})
+    return dict(moved)
@@ -1,3 +1,73 @@
 from django.test import TestCase
 
-# Create your tests here.
+from mailings.models import Campaign, EmailTemplate
+from members.models import Lokallag, Medlem
+from .loading import diff, protected_ids
+from .models import Fylke, Kommune, Postnummer, PostnummerKommune
+from .sync import remap_kommuner, resolve_chains
+
+
+class RemapKommunerTests(TestCase):
+    def setUp(self):
+        fylke = Fylke.objects.create(navn="Vestfold", slug="vestfold")
+        self.gamle = [Kommune.objects.create(nummer=nr, navn=nr, fylke=fylke) for nr in ("0701", "0704")]
+        self.ny = Kommune.objects.create(nummer="3903", navn="Horten", fylke=fylke)
+        self.medlem = Medlem.objects.create(fornavn="Ola", etternavn="Berg", telefon="90000000",
+                                            kommune=self.gamle[0])
+        self.lag = Lokallag.objects.create(navn="Horten", fylke=fylke, kommune=self.gamle[1], slug="horten")
+        template = EmailTemplate.objects.create(navn="t", subject="s", html_body="b")
+        self.campaign = Campaign.objects.create(navn="c", template=template, maal_kommune=self.gamle[0])
+
+        # 3185 ligger i begge de gamle kommunene og i den nye; 3186 bare i en gammel
+        self.pn_felles = Postnummer.objects.create(nummer="3185", poststed="SKOPPUM")
+        self.pn_gammel = Postnummer.objects.create(nummer="3186", poststed="HORTEN")
+        PostnummerKommune.objects.create(postnummer=self.pn_felles, kommune=self.ny)
+        PostnummerKommune.objects.create(postnummer=self.pn_felles, kommune=self.gamle[0], primar=True)
+        PostnummerKommune.objects.create(postnummer=self.pn_felles, kommune=self.gamle[1])
+        PostnummerKommune.objects.create(postnummer=self.pn_gammel, kommune=self.gamle[1], primar=True)
+
+    def test_flytter_alle_koblinger(self):
+        moved = remap_kommuner({k.id: self.ny.id for k in self.gamle})
+        self.assertEqual(moved["members.medlem"], 1)
+        self.assertEqual(moved["members.lokallag"], 1)
+        self.assertEqual(moved["mailings.campaign"], 1)
+        self.assertEqual(moved["geo.postnummerkommune"], 3)
+
+        for obj in (self.medlem, self.lag, self.campaign):
+            obj.refresh_from_db()
+        self.assertEqual(self.medlem.kommune_id, self.ny.id)
+        self.assertEqual(self.lag.kommune_id, self.ny.id)
+        # skjult relasjon (related_name="+")
+        self.assertEqual(self.campaign.maal_kommune_id, self.ny.id)
+
+        # unik (postnummer, kommune) holder, og primærflagget følger med
+        self.assertFalse(PostnummerKommune.objects.filter(kommune__in=self.gamle).exists())
+        self.assertEqual(
+            set(PostnummerKommune.objects.values_list("postnummer__nummer", "kommune_id", "primar")),
+            {("3185", self.ny.id, True), ("3186", self.ny.id, True)},
+        )
+
+    def test_samme_kommune_er_ingen_endring(self):
+        self.assertEqual(remap_kommuner({self.ny.id: self.ny.id}), {})
+
+
+class ResolveChainsTests(TestCase):
+    def test_kjeder_og_splittinger(self):
+        final, split = resolve_chains({"A": {"B"}, "B": {"C"}, "D": {"E", "F"}, "G": {"G"}})
+        self.assertEqual(final, {"A": "C", "B": "C"})
+        self.assertEqual(split, {"D": ["E", "F"]})
+
+
+class DiffTests(TestCase):
+    def test_diff(self):
+        current = {"0301": ("Oslo", "03"), "1101": ("Eigersund", "11"), "0704": ("Tønsberg", "07")}
+        incoming = {"0301": ("Oslo", "03"), "1101": ("Eigersund", "11 "), "3905": ("Tønsberg", "39")}
+        self.assertEqual(diff(current, incoming), (["3905"], ["1101"], ["0704"]))
+        self.assertEqual(diff(current, dict(current)), ([], [], []))
+
+    def test_protected_ids(self):
+        fylke = Fylke.objects.create(navn="Oslo", slug="oslo")
+        brukt, ledig = (Kommune.objects.create(nummer=nr, navn=nr, fylke=fylke) for nr in ("0301", "0302"))
+        Medlem.objects.create(fornavn="Ola", etternavn="Berg", telefon="90000000", kommune=brukt)
+        self.assertEqual(protected_ids(Kommune, [brukt.id, ledig.id]), {brukt.id})
+        self.assertEqual(protected_ids(Kommune, []), set())
@@ -160,3 +160,24 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Mailings – struping/batch
 MAILINGS_BATCH_SIZE = 200
 MAILINGS_MAX_PER_MINUTE = 120
+MAILINGS_WORKERS = 1            # sender-tråder (send_mailings --workers overstyrer)
+MAILINGS_LEASE_SECONDS = 600    # hvor lenge en sender holder en Outbox-rad (utløpt = ledig igjen)
+MAILINGS_TEMPLATE_CACHE_SIZE = 64  # kompilerte e-postmaler per prosess (LRU)
+MAILINGS_RETRY_BASE_SECONDS = 300       # første ventetid etter feil; dobles per forsøk
+MAILINGS_RETRY_MAX_SECONDS = 6 * 3600
+MAILINGS_MAX_ATTEMPTS = 6               # deretter gis raden opp (som ved 5xx)
+MAILINGS_LOG_RETENTION_DAYS = 180       # prune_email_logs: eldre EmailLog rulles opp i EmailLogSummary
+
+# Geo – nedtrekk-fragmenter (members/hx/*) og versjonsstempel
+GEO_STAMP_TTL = 5                   # sekunder mellom hver sjekk av GeoStamp per prosess
+GEO_FRAGMENT_MAX_AGE = 24 * 3600    # Cache-Control max-age for kommune/postnummer-fragmenter
+
+# Varsler (members.Varsel) – sendes av send_varsler, ikke i web-forespørselen
+VARSEL_BATCH_SIZE = 200             # varsler per kjøring av løkka (og største sammendrag)
+VARSEL_MAX_ATTEMPTS = 8             # deretter gis varselet opp (kan sendes på nytt fra admin)
+VARSEL_RETRY_BASE_SECONDS = 60      # første ventetid etter feil; dobles per forsøk
+VARSEL_RETRY_MAX_SECONDS = 3600
+VARSEL_LEASE_SECONDS = 300
+VARSEL_POLL_SECONDS = 5             # send_varsler --loop: pause når køen er tom
+VARSEL_DIGEST_MINUTES = 0           # > 0: ett sammendrag per mottaker per vindu i stedet for én e-post per registrering
+KONTAKTRUTE_TTL = 300               # sekunder kontaktrutene (members.Kontaktrute) holdes i prosessen
@@ -5,7 +5,9 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.http import HttpResponseForbidden
 from django.db.models import Prefetch
-from members.models import Lokallag, Medlem, Medlemskap
+from members.models import Lokallag, Medlem
+from members.queries import has_lag_access, in_lokallag
+from members.routing import contact_routes
 
 def _get_lag(slug: str) -> Lokallag:
     # Om du har et "public"-flagg på lokallag senere, filtrer på det her
@@ -25,32 +27,31 @@ def lag_home(request, slug):
 
 def lag_home(request, slug):
     lag = get_object_or_404(Lokallag, slug=slug)
-    return render(request, "laghub/lag_home.html", {"lag": lag})
+    return render(request, "laghub/lag_home.html", {
+        "lag": lag,
+        # lagets egen adresse, ellers fylkeslagets/fylkets (members.Kontaktrute)
+        "kontakt_epost": contact_routes().for_lokallag(lag.id),
+    })
 
 @login_required
 def lag_medlemmer(request, slug):
     lag = _get_lag(slug)
     # Tilgang: superuser ELLER er medlem som har Medlemskap i dette laget
-    has_access = request.user.is_superuser or Medlemskap.objects.filter(
-        medlem__user=request.user, lokallag_id=lag.id
-    ).exists()
+    has_access = has_lag_access(request.user, lag.id)
     if not has_access:
         return HttpResponseForbidden("Du har ikke tilgang til dette lokallaget.")
 
     medlemmer = (Medlem.objects
-                 .filter(lokallag__id=lag.id)
+                 .filter(in_lokallag(lag.id))
                  .select_related("kommune", "kommune__fylke")
-                 .order_by("etternavn", "fornavn")
-                 .distinct())
+                 .order_by("etternavn", "fornavn"))
     return render(request, "laghub/medlemmer.html", {"lag": lag, "medlemmer": medlemmer})
 
 @login_required
 def lag_docs(request, slug):
     lag = _get_lag(slug)
     # Samme tilgangsregel som over
-    has_access = request.user.is_superuser or Medlemskap.objects.filter(
-        medlem__user=request.user, lokallag_id=lag.id
-    ).exists()
+    has_access = has_lag_access(request.user, lag.id)
     if not has_access:
         return HttpResponseForbidden("Du har ikke tilgang til dette lokallaget.")
     # Placeholder – kobles til docs-appen senere
@@ -1,9 +1,16 @@
 from django.contrib import admin, messages
+from django.db.models import F
+from django.http import Http404, JsonResponse
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
 from django.utils.safestring import mark_safe
 from django.template import Context
 from django.conf import settings
-from .models import EmailTemplate, Campaign, Outbox, EmailLog
-from .services import render_template, send_one
+from members.routing import RouteMap
+from .models import EmailTemplate, Campaign, Outbox, EmailLog, EmailLogSummary
+from .retention import unpack_messages
+from .services import campaign_progress, render_template, send_one
+from .audience import audience_qs, queue_campaign
 
 @admin.register(EmailTemplate)
 class EmailTemplateAdmin(admin.ModelAdmin):
@@ -19,7 +26,7 @@ class EmailTemplateAdmin(admin.ModelAdmin):
             return
         sent = 0
         for tmpl in queryset:
-            ctx = Context({"user": request.user, "campaign": None, "medlem": None})
+            ctx = Context({"user": request.user, "campaign": None, "medlem": None, "kontakt_epost": RouteMap.default()})
             subject, text, html = render_template(tmpl, ctx)
             try:
                 send_one(user_email, f"[TEST] {subject}", text, html)
@@ -33,16 +40,77 @@ class EmailTemplateAdmin(admin.ModelAdmin):
         tmpl = queryset.first()
         if not tmpl:
             return
-        ctx = Context({"user": request.user, "campaign": None, "medlem": None})
+        ctx = Context({"user": request.user, "campaign": None, "medlem": None, "kontakt_epost": RouteMap.default()})
         _, _, html = render_template(tmpl, ctx)
         self.message_user(request, mark_safe(f"<div style='max-width:700px;border:1px solid #ddd;padding:8px'>{html}</div>"))
 
 @admin.register(Campaign)
 class CampaignAdmin(admin.ModelAdmin):
-    list_display = ("navn", "status", "opprettet_av", "opprettet")
+    list_display = ("navn", "status", "queued_count", "sent_count", "failed_count", "send_rate", "deferred_count",
+                    "parked_count", "backoff_until", "opprettet_av", "opprettet")
     list_filter = ("status",)
+    readonly_fields = ("fremdrift", "queued_count", "sent_count", "failed_count", "attempts_count",
+                       "send_rate", "backoff_until", "deferred_count", "parked_count", "send_state_updated")
     search_fields = ("navn",)
-    actions = ["legg_i_ko_kun_meg", "tom_kø"]
+    actions = ["legg_i_ko_malgruppe", "legg_i_ko_kun_meg", "tom_kø"]
+    fieldsets = (
+        (None, {"fields": ("navn", "template", "status", "opprettet_av")}),
+        ("Målgruppe", {"fields": (
+            ("maal_fylke", "maal_kommune", "maal_lokallag"),
+            ("maal_fylkeslag_rolle", "maal_sentral_rolle"),
+            "maal_status",
+        )}),
+        ("Sending", {"fields": (
+            "fremdrift",
+            ("queued_count", "sent_count"),
+            ("failed_count", "attempts_count"),
+            ("send_rate", "backoff_until"),
+            ("deferred_count", "parked_count"),
+            "send_state_updated",
+        )}),
+    )
+
+    class Media:
+        js = ("mailings/campaign_progress.js",)
+
+    def get_urls(self):
+        urls = [
+            path("<int:pk>/progress/", self.admin_site.admin_view(self.progress_view),
+                 name="mailings_campaign_progress"),
+        ]
+        return urls + super().get_urls()
+
+    def progress_view(self, request, pk):
+        """JSON for fremdriftslinja – leser kun tellerne på Campaign-raden."""
+        if not self.has_view_permission(request):
+            raise Http404
+        data = campaign_progress(pk)
+        if data is None:
+            raise Http404
+        return JsonResponse(data)
+
+    @admin.display(description="Fremdrift")
+    def fremdrift(self, obj):
+        if not obj.pk:
+            return "–"
+        pct = 100.0 * obj.sent_count / obj.queued_count if obj.queued_count else 0.0
+        return format_html(
+            '<div data-progress-url="{}"><progress max="100" value="{}"></progress> '
+            '<span class="progress-text">{} av {} sendt ({}%)</span></div>',
+            reverse("admin:mailings_campaign_progress", args=[obj.pk]),
+            f"{pct:.1f}", obj.sent_count, obj.queued_count, f"{pct:.1f}",
+        )
+
+    @admin.action(description="Legg i kø → målgruppe")
+    def legg_i_ko_malgruppe(self, request, queryset):
+        for camp in queryset:
+            matched = audience_qs(camp).count()
+            created = queue_campaign(camp)
+            self.message_user(
+                request,
+                f"{camp.navn}: {matched} medlem(mer) i målgruppen, {created} nye mottaker(e) lagt i kø.",
+                level=messages.SUCCESS,
+            )
 
     @admin.action(description="Legg i kø → KUN min e-post (test)")
     def legg_i_ko_kun_meg(self, request, queryset):
@@ -57,6 +125,7 @@ class CampaignAdmin(admin.ModelAdmin):
                 created += 1
                 camp.status = "QUEUED"
                 camp.save(update_fields=["status"])
+                Campaign.objects.filter(pk=camp.pk).update(queued_count=F("queued_count") + 1)
         self.message_user(request, f"La {created} mottaker(e) i kø (din adresse).", level=messages.SUCCESS)
 
     @admin.action(description="Tøm kø for valgt kampanje")
@@ -64,20 +133,56 @@ class CampaignAdmin(admin.ModelAdmin):
         total = 0
         from django.db.models import Q
         for camp in queryset:
-            count, _ = Outbox.objects.filter(Q(campaign=camp) & Q(sent_ok=False)).delete()
-            total += count
+            count, deleted = Outbox.objects.filter(Q(campaign=camp) & Q(sent_ok=False)).delete()
+            rows = deleted.get(Outbox._meta.label, 0)  # count inkluderer EmailLog-rader (cascade)
+            total += rows
             camp.status = "DRAFT"
             camp.save(update_fields=["status"])
+            # alle usendte rader er borte, også de utsatte og de som er gitt opp
+            Campaign.objects.filter(pk=camp.pk).update(
+                queued_count=F("queued_count") - rows, deferred_count=0, parked_count=0,
+            )
         self.message_user(request, f"Slettet {total} usendte kø-rader.", level=messages.SUCCESS)
 
 @admin.register(Outbox)
 class OutboxAdmin(admin.ModelAdmin):
-    list_display = ("campaign", "to_email", "sent_ok", "attempts", "last_try", "created")
-    list_filter = ("sent_ok", "campaign")
-    search_fields = ("to_email",)
+    list_display = ("campaign", "to_email", "sent_ok", "attempts", "last_try", "next_attempt_at", "parked",
+                    "claimed_by", "lease_until", "created")
+    list_filter = ("sent_ok", "parked", "campaign")
+    search_fields = ("^to_email",)  # prefikssøk kan bruke indeksen på to_email
 
 @admin.register(EmailLog)
 class EmailLogAdmin(admin.ModelAdmin):
     list_display = ("outbox", "level", "message", "created")
     list_filter = ("level", "created")
-    search_fields = ("message",)
+    # prefikssøk på adresse (indeksert) og kampanjenavn; meldingsteksten søkes bare
+    # når loggen er avgrenset med datofilteret (LIKE '%…%' kan ikke bruke indeks)
+    search_fields = ("^outbox__to_email", "^outbox__campaign__navn")
+    search_help_text = "Adresse eller kampanjenavn (starten). Velg en dato for å søke i meldingsteksten også."
+    list_select_related = ("outbox",)
+    # ingen COUNT(*) over hele loggen ved søk/filter (tabellen holdes liten av prune_email_logs)
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # queryset er allerede filtrert (også på dato) når søket kjøres
+        qs, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term and any(k.startswith("created__") for k in request.GET):
+            qs = qs | queryset.filter(message__icontains=search_term)
+        return qs, may_have_duplicates
+
+@admin.register(EmailLogSummary)
+class EmailLogSummaryAdmin(admin.ModelAdmin):
+    list_display = ("campaign", "dag", "info_count", "warn_count", "err_count")
+    list_filter = ("campaign",)
+    date_hierarchy = "dag"
+    readonly_fields = ("campaign", "dag", "info_count", "warn_count", "err_count",
+                       "first_created", "last_created", "meldinger")
+    exclude = ("messages",)
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.display(description="Vanligste WARN/ERR")
+    def meldinger(self, obj):
+        rows = sorted(unpack_messages(obj.messages).items(), key=lambda kv: -kv[1])
+        return format_html_join(mark_safe("<br>"), "{} × {}", ((n, msg) for msg, n in rows)) or "–"
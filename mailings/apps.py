@@ -5,3 +5,6 @@ class MailingsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "mailings"
     verbose_name = "Epost"   # dette navnet vises i admin
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,201 @@
+# mailings/async_smtp.py
+"""
+Asynkron SMTP-leveranse (asyncio) – alternativ til den blokkerende
+EmailMultiAlternatives.send()-løypa i services.send_one.
+
+AsyncSMTPSession holder én langlivet SMTP-sesjon og bruker PIPELINING
+(RFC 2920) når serveren støtter det: MAIL FROM, RCPT TO og DATA sendes i
+én skriving, slik at hver melding koster to rundturer i stedet for fire.
+send_mailings --engine async kjører K slike sesjoner samtidig.
+
+Feil kastes som smtplib-unntak (SMTPResponseException m.fl.), samme typer
+som den blokkerende backenden gir.
+"""
+import asyncio
+import base64
+import re
+import smtplib
+import ssl
+from email.utils import parseaddr
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.core.mail.message import sanitize_address
+
+_DOT_LINE = re.compile(rb"(?m)^\.")
+
+
+def envelope_address(addr, encoding):
+    """Bar adresse til MAIL FROM/RCPT TO – uten visningsnavn, som smtplib.quoteaddr."""
+    return parseaddr(sanitize_address(addr, encoding))[1]
+
+
+def build_message(to_email, subject, text, html, *, from_email=None):
+    """Samme melding som services.send_one bygger, men uten å sende den."""
+    from_email = from_email or getattr(settings, "DEFAULT_FROM_EMAIL", "no-reply@localhost")
+    msg = EmailMultiAlternatives(subject, text, from_email, [to_email])
+    if html:
+        msg.attach_alternative(html, "text/html")
+    return msg
+
+
+class AsyncSMTPSession:
+    """Én SMTP-sesjon. Kobler til ved første send og på nytt etter brudd."""
+
+    def __init__(self, host=None, port=None, username=None, password=None,
+                 use_tls=None, use_ssl=None, timeout=None):
+        self.host = host or settings.EMAIL_HOST
+        self.port = int(port or settings.EMAIL_PORT)
+        self.username = settings.EMAIL_HOST_USER if username is None else username
+        self.password = settings.EMAIL_HOST_PASSWORD if password is None else password
+        self.use_tls = getattr(settings, "EMAIL_USE_TLS", False) if use_tls is None else use_tls
+        self.use_ssl = getattr(settings, "EMAIL_USE_SSL", False) if use_ssl is None else use_ssl
+        self.timeout = timeout or getattr(settings, "EMAIL_TIMEOUT", None) or 30
+        self.reader = None
+        self.writer = None
+        self.features = {}
+
+    @property
+    def connected(self):
+        return self.writer is not None and not self.writer.is_closing()
+
+    # --- protokoll ---
+    async def _reply(self):
+        """Les ett (evt. flerlinjet) svar: returnerer (kode, tekst)."""
+        lines = []
+        while True:
+            try:
+                line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+            except asyncio.TimeoutError:
+                self._abort()
+                raise smtplib.SMTPServerDisconnected("Tidsavbrudd mot SMTP-server")
+            if not line:
+                self._abort()
+                raise smtplib.SMTPServerDisconnected("SMTP-serveren lukket tilkoblingen")
+            lines.append(line[4:].strip().decode("utf-8", "replace"))
+            if line[3:4] != b"-":
+                try:
+                    code = int(line[:3])
+                except ValueError:
+                    self._abort()
+                    raise smtplib.SMTPServerDisconnected(f"Ugyldig SMTP-svar: {line!r}")
+                return code, "\n".join(lines)
+
+    async def _expect(self, *ok_codes):
+        code, text = await self._reply()
+        if code not in ok_codes:
+            raise smtplib.SMTPResponseException(code, text)
+        return text
+
+    async def _command(self, line, *ok_codes):
+        self.writer.write(line.encode("ascii") + b"\r\n")
+        await self.writer.drain()
+        return await self._expect(*ok_codes)
+
+    async def _ehlo(self):
+        text = await self._command("EHLO " + (getattr(settings, "EMAIL_HELO_NAME", None) or "localhost"), 250)
+        self.features = {}
+        for entry in text.split("\n")[1:]:
+            name, _, args = entry.partition(" ")
+            self.features[name.lower()] = args
+
+    async def connect(self):
+        ctx = ssl.create_default_context() if (self.use_ssl or self.use_tls) else None
+        try:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, ssl=ctx if self.use_ssl else None),
+                self.timeout,
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            raise smtplib.SMTPConnectError(421, f"Kunne ikke koble til {self.host}:{self.port}: {e}")
+        await self._expect(220)
+        await self._ehlo()
+        if self.use_tls and not self.use_ssl:
+            await self._command("STARTTLS", 220)
+            await self.writer.start_tls(ctx, server_hostname=self.host)
+            await self._ehlo()
+        if self.username:
+            await self._login()
+
+    async def _login(self):
+        methods = self.features.get("auth", "").upper().split()
+        if "PLAIN" in methods or not methods:
+            token = base64.b64encode(f"\0{self.username}\0{self.password}".encode()).decode()
+            await self._command(f"AUTH PLAIN {token}", 235)
+        else:
+            await self._command("AUTH LOGIN", 334)
+            await self._command(base64.b64encode(self.username.encode()).decode(), 334)
+            await self._command(base64.b64encode(self.password.encode()).decode(), 235)
+
+    async def send_bytes(self, from_addr, recipients, data):
+        """Send én ferdig melding. Kaster smtplib-unntak ved feil."""
+        if not self.connected:
+            await self.connect()
+        commands = [f"MAIL FROM:<{from_addr}>"] + [f"RCPT TO:<{r}>" for r in recipients] + ["DATA"]
+        try:
+            if "pipelining" in self.features:
+                self.writer.write("".join(c + "\r\n" for c in commands).encode("ascii"))
+                await self.writer.drain()
+                replies = [await self._reply() for _ in commands]
+                for cmd, (code, text) in zip(commands, replies):
+                    expected = (354,) if cmd == "DATA" else (250, 251)
+                    if code not in expected:
+                        if replies[-1][0] == 354:
+                            # DATA ble godtatt selv om MAIL/RCPT feilet: avslutt tom melding
+                            self.writer.write(b".\r\n")
+                            await self.writer.drain()
+                            await self._reply()
+                        raise smtplib.SMTPResponseException(code, text)
+            else:
+                await self._command(commands[0], 250)
+                for cmd in commands[1:-1]:
+                    await self._command(cmd, 250, 251)
+                await self._command("DATA", 354)
+            if not data.endswith(b"\r\n"):
+                data += b"\r\n"
+            self.writer.write(_DOT_LINE.sub(b"..", data) + b".\r\n")
+            await self.writer.drain()
+            await self._expect(250)
+        except smtplib.SMTPResponseException:
+            # avbryt transaksjonen slik at sesjonen kan gjenbrukes
+            if self.connected:
+                try:
+                    await self._command("RSET", 250)
+                except (smtplib.SMTPException, OSError):
+                    self._abort()
+            raise
+        except OSError as e:
+            self._abort()
+            raise smtplib.SMTPServerDisconnected(str(e))
+
+    async def send_message(self, msg):
+        encoding = msg.encoding or settings.DEFAULT_CHARSET
+        from_addr = envelope_address(msg.from_email, encoding)
+        recipients = [envelope_address(a, encoding) for a in msg.recipients()]
+        await self.send_bytes(from_addr, recipients, msg.message().as_bytes(linesep="\r\n"))
+
+    def _abort(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def close(self):
+        if self.connected:
+            try:
+                await self._command("QUIT", 221)
+            except (smtplib.SMTPException, OSError):
+                pass
+        self._abort()
+
+
+async def send_one_async(to_email, subject, text, html, *, from_email=None, connection=None):
+    """Asynkron utgave av services.send_one; `connection` er en AsyncSMTPSession."""
+    msg = build_message(to_email, subject, text, html, from_email=from_email)
+    if connection is None:
+        connection = AsyncSMTPSession()
+        try:
+            await connection.send_message(msg)
+        finally:
+            await connection.close()
+    else:
+        await connection.send_message(msg)
@@ -0,0 +1,86 @@
+# mailings/audience.py
+"""
+Målgruppe for en kampanje: Campaign.maal_* → Medlem-queryset → Outbox-rader.
+
+queue_campaign() fyller Outbox med én INSERT ... SELECT i databasen, i stedet
+for get_or_create per mottaker. Duplikate e-poster (samme adresse på flere
+medlemmer, eller allerede i kø) hoppes over via uniq_campaign_email.
+"""
+from django.db import connection, transaction
+from django.db.models import Exists, F, Min, OuterRef, Q
+from django.db.models.constants import OnConflict
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from members.models import Fylkeslagsmedlemskap, Medlem, Medlemskap, SentralstyreMedlemskap
+from members.queries import PENDING_Q
+from .models import Campaign, Outbox
+
+
+def audience_qs(campaign):
+    """Medlemmer som treffes av kampanjens målgruppe (uten e-post-dedup)."""
+    qs = Medlem.objects.exclude(epost="")
+    if campaign.maal_fylke_id:
+        qs = qs.filter(kommune__fylke_id=campaign.maal_fylke_id)
+    if campaign.maal_kommune_id:
+        qs = qs.filter(kommune_id=campaign.maal_kommune_id)
+    if campaign.maal_lokallag_id:
+        qs = qs.filter(Exists(Medlemskap.objects.filter(
+            medlem_id=OuterRef("pk"), lokallag_id=campaign.maal_lokallag_id,
+        )))
+    if campaign.maal_fylkeslag_rolle:
+        roller = Fylkeslagsmedlemskap.objects.filter(
+            medlem_id=OuterRef("pk"), rolle=campaign.maal_fylkeslag_rolle,
+        )
+        if campaign.maal_fylke_id:
+            roller = roller.filter(fylkeslag__fylke_id=campaign.maal_fylke_id)
+        qs = qs.filter(Exists(roller))
+    if campaign.maal_sentral_rolle_id:
+        today = timezone.now().date()
+        qs = qs.filter(Exists(SentralstyreMedlemskap.objects.filter(
+            medlem_id=OuterRef("pk"), rolle_id=campaign.maal_sentral_rolle_id,
+        ).filter(Q(sluttdato__isnull=True) | Q(sluttdato__gte=today))))
+    if campaign.maal_status == "approved":
+        qs = qs.exclude(PENDING_Q)
+    elif campaign.maal_status == "pending":
+        qs = qs.filter(PENDING_Q)
+    return qs
+
+
+def queue_campaign(campaign):
+    """
+    Legg hele målgruppen i kø med én INSERT ... SELECT. Én rad per (små bokstaver)
+    e-postadresse; medlem_id er laveste medlem-id med adressen.
+    Returnerer antall nye Outbox-rader.
+    """
+    source = (audience_qs(campaign)
+              .annotate(email=Lower("epost"))
+              .values("email")
+              .annotate(first_id=Min("id"))
+              .order_by())
+    select_sql, select_params = source.query.sql_with_params()
+
+    ops = connection.ops
+    fields = [Outbox._meta.get_field(name) for name in (
+        "campaign", "to_email", "medlem_id", "sent_ok", "attempts", "created", "claimed_by",
+    )]
+    columns = ", ".join(ops.quote_name(f.column) for f in fields)
+    created = fields[5].get_db_prep_value(timezone.now(), connection)
+    sql = (
+        f"{ops.insert_statement(on_conflict=OnConflict.IGNORE)} {ops.quote_name(Outbox._meta.db_table)} ({columns}) "
+        f"SELECT %s, a.email, a.first_id, %s, 0, %s, '' FROM ({select_sql}) a"
+    )
+    suffix = ops.on_conflict_suffix_sql(fields, OnConflict.IGNORE, None, None)
+    if suffix:
+        sql = f"{sql} {suffix}"
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, (campaign.pk, False, created, *select_params))
+            made = cursor.rowcount
+        if made:
+            Campaign.objects.filter(pk=campaign.pk).update(queued_count=F("queued_count") + made)
+            if campaign.status == "DRAFT":
+                campaign.status = "QUEUED"
+                campaign.save(update_fields=["status"])
+    return made
@@ -0,0 +1,89 @@
+import asyncio
+import time
+from django.core.mail.backends.smtp import EmailBackend
+from django.core.management.base import BaseCommand, CommandError
+from django.template import engines
+from django.utils.html import strip_tags
+from mailings.async_smtp import AsyncSMTPSession, send_one_async
+from mailings.models import EmailTemplate
+from mailings.services import render_template, send_one
+from mailings.smtp_sink import SinkServer
+
+
+class Command(BaseCommand):
+    help = "Mål ytelsen i e-postløypa (ingen DB-skriving, ingen ekte sending)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("what", choices=["render", "smtp"], help="Hva som skal måles")
+        parser.add_argument("--template-id", type=int, help="EmailTemplate å bruke (default: siste endrede)")
+        parser.add_argument("-n", type=int, default=2000, help="Antall meldinger")
+        parser.add_argument("--latency", type=float, default=20, help="smtp: simulert svartid i ms per rundtur")
+        parser.add_argument("--sessions", type=int, default=4, help="smtp: samtidige sesjoner i async-motoren")
+
+    def handle(self, *args, **opts):
+        getattr(self, f"bench_{opts['what']}")(opts)
+
+    def _report(self, label, n, dur):
+        per = dur / n * 1e6 if n else 0.0
+        self.stdout.write(f"{label:<28} {n} stk på {dur:.3f}s  ({per:.0f} µs/melding)")
+
+    def bench_render(self, opts):
+        n = opts["n"]
+        qs = EmailTemplate.objects.order_by("-sist_endret")
+        tmpl = qs.filter(pk=opts["template_id"]).first() if opts.get("template_id") else qs.first()
+        if not tmpl:
+            raise CommandError("Fant ingen EmailTemplate.")
+        ctx = {"user": None, "campaign": None, "medlem": None}
+
+        # før: from_string() på subject og html for hver mottaker
+        dj = engines["django"]
+        t0 = time.perf_counter()
+        for _ in range(n):
+            subject = dj.from_string(tmpl.subject).render(ctx).strip()
+            html = dj.from_string(tmpl.html_body).render(ctx)
+            text = tmpl.text_body.strip() if tmpl.text_body else strip_tags(html)
+        self._report("uten cache (from_string)", n, time.perf_counter() - t0)
+
+        # etter: kompilert én gang, kun kontekst-substitusjon per mottaker
+        t0 = time.perf_counter()
+        for _ in range(n):
+            render_template(tmpl, ctx)
+        self._report("med cache (render_template)", n, time.perf_counter() - t0)
+
+    def bench_smtp(self, opts):
+        """Blokkerende EmailMultiAlternatives.send vs. async-motoren, mot et lokalt SMTP-sluk."""
+        n, k = opts["n"], max(1, opts["sessions"])
+        latency = opts["latency"] / 1000.0
+        msg = ("Test", "Hei", "<p>Hei</p>")
+        self.stdout.write(f"Lokal SMTP-sluk med {opts['latency']:.0f} ms svartid, {n} meldinger")
+
+        with SinkServer(latency=latency) as sink:
+            backend = EmailBackend(host=sink.host, port=sink.port, username="", password="",
+                                   use_tls=False, use_ssl=False, timeout=10)
+            backend.open()
+            t0 = time.perf_counter()
+            for i in range(n):
+                send_one(f"m{i}@example.invalid", *msg, connection=backend)
+            self._report("blokkerende, 1 tilkobling", n, time.perf_counter() - t0)
+            backend.close()
+
+            async def run_async(k):
+                sessions = [AsyncSMTPSession(host=sink.host, port=sink.port, username="", password="",
+                                             use_tls=False, use_ssl=False, timeout=10) for _ in range(k)]
+                jobs = asyncio.Queue()
+                for i in range(n):
+                    jobs.put_nowait(f"m{i}@example.invalid")
+
+                async def worker(session):
+                    while not jobs.empty():
+                        await send_one_async(jobs.get_nowait(), *msg, connection=session)
+
+                t0 = time.perf_counter()
+                await asyncio.gather(*(worker(s) for s in sessions))
+                dur = time.perf_counter() - t0
+                await asyncio.gather(*(s.close() for s in sessions))
+                return dur
+
+            self._report("async, 1 sesjon", n, asyncio.run(run_async(1)))
+            self._report(f"async, {k} sesjoner", n, asyncio.run(run_async(k)))
+            self.stdout.write(f"Sluket mottok {sink.received} meldinger")
@@ -0,0 +1,20 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from mailings.retention import RETENTION_DAYS, prune_logs
+
+
+class Command(BaseCommand):
+    help = "Rull gamle EmailLog-rader opp i EmailLogSummary (per kampanje og dag) og slett dem"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=RETENTION_DAYS,
+                            help=f"Behold logglinjer nyere enn dette (default {RETENTION_DAYS})")
+        parser.add_argument("--chunk", type=int, default=5000, help="Rader per transaksjon")
+        parser.add_argument("--dry-run", action="store_true", help="Bare tell, ikke endre noe")
+
+    def handle(self, *args, **opts):
+        before = timezone.now() - timedelta(days=opts["days"])
+        count = prune_logs(before, chunk=max(1, opts["chunk"]), dry_run=opts["dry_run"])
+        verb = "Ville rullet opp" if opts["dry_run"] else "Rullet opp og slettet"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {count} logglinjer eldre enn {before:%Y-%m-%d %H:%M}."))
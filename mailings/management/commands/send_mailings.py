@@ -1,13 +1,234 @@
+import asyncio
+import queue
+import signal
+import smtplib
+import sys
+import threading
 import time
 from django.core.management.base import BaseCommand
+from django.core.mail import get_connection
 from django.utils import timezone
 from django.conf import settings
-from django.db import transaction
-from mailings.models import Outbox, EmailLog
-from mailings.services import render_template, send_one
+from django.db import connection as db_connection
+from mailings.async_smtp import AsyncSMTPSession, send_one_async
+from members.routing import contact_routes
+from mailings.services import (
+    MAX_ATTEMPTS, AdaptiveRateLimiter, DeliveryBuffer, claim_batch, is_transient, prefetch_members, release_claims,
+    render_template, retry_delay, send_one, sender_id, update_send_state,
+)
 
 BATCH_SIZE = int(getattr(settings, "MAILINGS_BATCH_SIZE", 200))
 MAX_PER_MIN = int(getattr(settings, "MAILINGS_MAX_PER_MINUTE", 120))
+WORKERS = int(getattr(settings, "MAILINGS_WORKERS", 1))
+
+
+class WorkerStats:
+    """Teller for én sender-tråd (vises i sluttrapporten)."""
+
+    def __init__(self, nr):
+        self.nr = nr
+        self.ok = 0
+        self.failed = 0
+        self.deferred = 0  # midlertidige feil (4xx), del av failed
+        self.busy = 0.0  # sekunder brukt på render + SMTP (uten struping)
+
+    @property
+    def rate(self):
+        return (self.ok + self.failed) / self.busy if self.busy else 0.0
+
+
+def _context(ob, medlem):
+    routes = contact_routes()
+    return {
+        "user": ob.campaign.opprettet_av,
+        "campaign": ob.campaign,
+        "medlem": medlem,  # forhåndslastet per batch (None for adresser uten medlem)
+        # lokallagets/fylkets varslingsadresse (members.Kontaktrute, cachet i prosessen)
+        "kontakt_epost": routes.for_medlem(medlem) if medlem else routes.default(),
+    }
+
+
+def _record_ok(ob, dry, buffer, stats, subject, limiter):
+    if dry:
+        buffer.record(ob, "INFO", f"[DRY] Ville sendt til {ob.to_email}: {subject}")
+    else:
+        # en utsatt rad som nå er sendt er ikke lenger utsatt
+        deferred = -1 if ob.next_attempt_at is not None else 0
+        ob.sent_ok = True
+        ob.lease_until = None
+        ob.next_attempt_at = None
+        limiter.success()
+        buffer.count(ob.campaign_id, sent=1, attempts=1, deferred=deferred)
+        # dry-run rører ikke forsøkstellingen, så en ekte sending etterpå tar raden som før
+        ob.attempts += 1
+        ob.last_try = timezone.now()
+    buffer.record(ob, "INFO", "Sendt OK" if not dry else "DRY OK")
+    stats.ok += 1
+
+
+def _record_failed(ob, error, dry, buffer, stats, limiter):
+    if dry:
+        # bare logg – raden skal kunne sendes som før av en ekte kjøring
+        buffer.record(ob, "WARN", f"[DRY] Feil for {ob.to_email}: {error}")
+        stats.failed += 1
+        return
+    was_deferred = ob.next_attempt_at is not None
+    ob.attempts += 1
+    ob.last_try = timezone.now()
+    ob.lease_until = None
+    transient = is_transient(error)
+    if transient:
+        limiter.transient_failure()
+    if transient and ob.attempts < MAX_ATTEMPTS:
+        # midlertidig feil: raden planlegges på nytt (eksponentielt)
+        ob.next_attempt_at = ob.last_try + retry_delay(ob.attempts)
+        buffer.count(ob.campaign_id, failed=1, attempts=1, deferred=0 if was_deferred else 1)
+        stats.deferred += 1
+        buffer.record(ob, "WARN", f"Utsatt til {ob.next_attempt_at:%Y-%m-%d %H:%M}: {error}")
+    else:
+        # permanent feil (5xx, ugyldig adresse) eller for mange forsøk: gis opp
+        ob.next_attempt_at = None
+        ob.parked = True
+        buffer.count(ob.campaign_id, failed=1, attempts=1, parked=1, deferred=-1 if was_deferred else 0)
+        buffer.record(ob, "ERR", f"Gitt opp etter {ob.attempts} forsøk: {error}")
+    stats.failed += 1
+
+
+def _connection_lost(error):
+    # SMTPException arver OSError; bare brudd/nettverksfeil betyr død tilkobling
+    return isinstance(error, smtplib.SMTPServerDisconnected) or (
+        isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+    )
+
+
+class ThreadEngine:
+    """N tråder med hver sin langlivede SMTP-tilkobling (EmailMultiAlternatives.send)."""
+
+    def __init__(self, stats, bucket, buffer, dry):
+        self.bucket, self.buffer, self.dry = bucket, buffer, dry
+        self.jobs = queue.Queue()
+        self.threads = [threading.Thread(target=self._worker, args=(s,), daemon=True) for s in stats]
+        for t in self.threads:
+            t.start()
+
+    def run_batch(self, items):
+        for item in items:
+            self.jobs.put(item)
+        self.jobs.join()
+
+    def close(self):
+        # avbrutt midt i en batch: dropp det som ikke er startet
+        while True:
+            try:
+                self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            self.jobs.task_done()
+        for _ in self.threads:
+            self.jobs.put(None)
+        for t in self.threads:
+            t.join()
+
+    def _worker(self, stats):
+        connection = get_connection()
+        try:
+            if not self.dry:
+                connection.open()
+            while True:
+                job = self.jobs.get()
+                try:
+                    if job is None:
+                        break
+                    ob, medlem = job
+                    self.bucket.acquire()
+                    t0 = time.time()
+                    self._deliver(ob, medlem, connection, stats)
+                    stats.busy += time.time() - t0
+                finally:
+                    self.jobs.task_done()
+        finally:
+            connection.close()
+            # tråden har sin egen DB-tilkobling – lukk den eksplisitt
+            db_connection.close()
+
+    def _deliver(self, ob, medlem, connection, stats):
+        # ingen DB-skriving her – alt går via buffer og flushes per batch
+        try:
+            subject, text, html = render_template(ob.campaign.template, _context(ob, medlem))
+            if not self.dry:
+                send_one(ob.to_email, subject, text, html, connection=connection)
+            _record_ok(ob, self.dry, self.buffer, stats, subject, self.bucket)
+        except Exception as e:
+            _record_failed(ob, e, self.dry, self.buffer, stats, self.bucket)
+            if _connection_lost(e):
+                # raden er utsatt; åpne ny tilkobling for resten av køen i denne tråden
+                connection.close()
+                try:
+                    connection.open()
+                except Exception:
+                    pass  # relayen er nede: feilen registreres på neste rad som prøves
+
+
+class AsyncEngine:
+    """
+    K samtidige SMTP-sesjoner i én asyncio-løkke (mailings.async_smtp).
+    Malene rendres synkront før løkka startes, så ORM-oppslag i malene
+    fungerer som i tråd-motoren.
+    """
+
+    def __init__(self, stats, bucket, buffer, dry):
+        self.stats, self.bucket, self.buffer, self.dry = stats, bucket, buffer, dry
+        self.loop = asyncio.new_event_loop()
+        self.sessions = [AsyncSMTPSession() for _ in stats]
+
+    def run_batch(self, items):
+        rendered = []
+        for ob, medlem in items:
+            try:
+                rendered.append((ob, render_template(ob.campaign.template, _context(ob, medlem))))
+            except Exception as e:
+                _record_failed(ob, e, self.dry, self.buffer, self.stats[0], self.bucket)
+        self.loop.run_until_complete(self._run(rendered))
+
+    async def _run(self, rendered):
+        jobs = asyncio.Queue()
+        for item in rendered:
+            jobs.put_nowait(item)
+        await asyncio.gather(*(
+            self._worker(jobs, session, stats) for session, stats in zip(self.sessions, self.stats)
+        ))
+
+    async def _worker(self, jobs, session, stats):
+        while not jobs.empty():
+            ob, (subject, text, html) = jobs.get_nowait()
+            await self.bucket.acquire_async()
+            t0 = time.time()
+            try:
+                if not self.dry:
+                    await send_one_async(ob.to_email, subject, text, html, connection=session)
+                _record_ok(ob, self.dry, self.buffer, stats, subject, self.bucket)
+            except Exception as e:
+                _record_failed(ob, e, self.dry, self.buffer, stats, self.bucket)
+            stats.busy += time.time() - t0
+
+    async def _shutdown(self):
+        # avbrutt midt i en batch: stopp sendingen før sesjonene lukkes
+        current = asyncio.current_task()
+        pending = [t for t in asyncio.all_tasks() if t is not current]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        await asyncio.gather(*(s.close() for s in self.sessions))
+
+    def close(self):
+        try:
+            self.loop.run_until_complete(self._shutdown())
+        finally:
+            self.loop.close()
+
+
+ENGINES = {"smtp": ThreadEngine, "async": AsyncEngine}
+
 
 class Command(BaseCommand):
     help = "Sender e-post fra Outbox i batches"
@@ -15,60 +236,64 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("--campaign-id", type=int, help="Begrens til én kampanje")
         parser.add_argument("--dry-run", action="store_true", help="Ikke send, bare logg")
+        parser.add_argument(
+            "--workers", type=int, default=WORKERS,
+            help="Antall parallelle SMTP-tilkoblinger (tråder, eller sesjoner med --engine async); felles struping",
+        )
+        parser.add_argument(
+            "--engine", choices=sorted(ENGINES), default="smtp",
+            help="smtp = Djangos blokkerende backend i tråder, async = asyncio med pipelining",
+        )
 
     def handle(self, *args, **opts):
         campaign_id = opts.get("campaign_id")
         dry = opts.get("dry_run", False)
+        workers = max(1, opts.get("workers") or 1)
+        engine_name = opts.get("engine") or "smtp"
 
-        qs = Outbox.objects.filter(sent_ok=False).order_by("created")
-        if campaign_id:
-            qs = qs.filter(campaign_id=campaign_id)
+        me = sender_id()
+        # MAX_PER_MIN er taket; raten tilpasses etter svarene fra relayen
+        bucket = AdaptiveRateLimiter(MAX_PER_MIN)
+        buffer = DeliveryBuffer()
+        stats = [WorkerStats(i + 1) for i in range(workers)]
+        engine = ENGINES[engine_name](stats, bucket, buffer, dry)
 
-        count = 0
         start = time.time()
-        self.stdout.write(self.style.NOTICE(f"Starter sending (batch={BATCH_SIZE}, max/min={MAX_PER_MIN})"))
-        while True:
-            batch = list(qs.select_related("campaign", "campaign__template")[:BATCH_SIZE])
-            if not batch:
-                break
-
-            # én SMTP-tilkobling per batch
-            from django.core.mail import get_connection
-            connection = get_connection()
-            connection.open()
-            try:
-                for ob in batch:
-                    t0 = time.time()
-                    try:
-                        ctx = {
-                            "user": ob.campaign.opprettet_av,
-                            "campaign": ob.campaign,
-                            "medlem": None,  # senere: faktisk medlem
-                        }
-                        subject, text, html = render_template(ob.campaign.template, ctx)
-                        if dry:
-                            EmailLog.objects.create(outbox=ob, level="INFO", message=f"[DRY] Ville sendt til {ob.to_email}: {subject}")
-                        else:
-                            send_one(ob.to_email, subject, text, html, connection=connection)
-                            ob.sent_ok = True
-                        ob.attempts += 1
-                        ob.last_try = timezone.now()
-                        ob.save(update_fields=["sent_ok", "attempts", "last_try"])
-                        EmailLog.objects.create(outbox=ob, level="INFO", message="Sendt OK" if not dry else "DRY OK")
-                        count += 1
-                    except Exception as e:
-                        EmailLog.objects.create(outbox=ob, level="ERR", message=str(e))
-                        ob.attempts += 1
-                        ob.last_try = timezone.now()
-                        ob.save(update_fields=["attempts", "last_try"])
-
-                    # struping for å holde oss under MAX_PER_MIN
-                    elapsed = time.time() - t0
-                    min_interval = 60.0 / MAX_PER_MIN if MAX_PER_MIN > 0 else 0
-                    if elapsed < min_interval:
-                        time.sleep(min_interval - elapsed)
-            finally:
-                connection.close()
+        started_at = timezone.now()
+        self.stdout.write(self.style.NOTICE(
+            f"Starter sending (batch={BATCH_SIZE}, max/min={MAX_PER_MIN}, workers={workers}, "
+            f"engine={engine_name}, sender={me})"
+        ))
+        # SIGTERM (systemd/cron-timeout) → samme opprydding som Ctrl-C
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+        try:
+            while True:
+                # reserverer radene (lease) – andre sendere hopper over dem;
+                # feilede rader slipper leasen og hentes igjen når next_attempt_at er passert
+                # (midlertidige feil), eller aldri (gitt opp, parked)
+                batch = claim_batch(me, BATCH_SIZE, campaign_id=campaign_id)
+                if not batch:
+                    break
+                medlemmer = prefetch_members(batch)
+                engine.run_batch([(ob, medlemmer.get(ob.medlem_id)) for ob in batch])
+                # sjekkpunkt: status og logg for hele batchen i én transaksjon
+                buffer.flush()
+                update_send_state([ob.campaign_id for ob in batch], bucket)
+                self.stdout.write(f"  batch {len(batch)}: {bucket.describe()}")
+        finally:
+            engine.close()
+            buffer.flush()
+            # dry-run skal ikke blokkere en ekte sending etterpå
+            release_claims(me, None if dry else started_at)
 
         dur = time.time() - start
-        self.stdout.write(self.style.SUCCESS(f"Ferdig: {count} forsøk på {dur:.1f}s"))
+        for s in stats:
+            self.stdout.write(
+                f"  worker {s.nr}: {s.ok} OK, {s.failed} feil ({s.deferred} utsatt), {s.rate:.1f} msg/s"
+            )
+        total = sum(s.ok + s.failed for s in stats)
+        count = sum(s.ok for s in stats)
+        rate = total / dur if dur else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Ferdig: {count} av {total} forsøk OK på {dur:.1f}s ({rate:.1f} msg/s totalt; {bucket.describe()})"
+        ))
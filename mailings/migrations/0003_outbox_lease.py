@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailings', '0002_alter_campaign_opprettet_av_alter_campaign_status_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outbox',
+            name='claimed_by',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='outbox',
+            name='lease_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='outbox',
+            index=models.Index(fields=['sent_ok', 'lease_until'], name='mailings_ou_sent_ok_ac14f3_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geo', '0006_fill_homepage_title'),
+        ('mailings', '0003_outbox_lease'),
+        ('members', '0013_medlem_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='maal_fylke',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='geo.fylke', verbose_name='Fylke'),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='maal_fylkeslag_rolle',
+            field=models.CharField(blank=True, choices=[('leder', 'Leder'), ('styre', 'Styremedlem'), ('medlem', 'Medlem')], max_length=20, verbose_name='Fylkeslag-rolle'),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='maal_kommune',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='geo.kommune', verbose_name='Kommune'),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='maal_lokallag',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='members.lokallag', verbose_name='Lokallag'),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='maal_sentral_rolle',
+            field=models.ForeignKey(blank=True, limit_choices_to={'scope': 'sentral'}, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='members.rolle', verbose_name='Sentralstyre-rolle'),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='maal_status',
+            field=models.CharField(choices=[('approved', 'Kun godkjente'), ('pending', 'Kun til godkjenning'), ('all', 'Alle')], default='approved', max_length=10, verbose_name='Medlemsstatus'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:20
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def reschedule_failed(apps, schema_editor):
+    # Den gamle senderen prøvde feilede rader på nytt uten next_attempt_at; de som
+    # ikke har brukt opp forsøkene (MAILINGS_MAX_ATTEMPTS) planlegges nå.
+    Outbox = apps.get_model("mailings", "Outbox")
+    max_attempts = int(getattr(settings, "MAILINGS_MAX_ATTEMPTS", 6))
+    (Outbox.objects
+     .filter(sent_ok=False, attempts__gt=0, attempts__lt=max_attempts, next_attempt_at__isnull=True)
+     .update(next_attempt_at=timezone.now()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailings', '0004_campaign_audience'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='backoff_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Backoff til'),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='deferred_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Utsatt'),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='send_rate',
+            field=models.FloatField(blank=True, null=True, verbose_name='Rate (per min)'),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='send_state_updated',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Sist oppdatert'),
+        ),
+        migrations.AddField(
+            model_name='outbox',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='outbox',
+            index=models.Index(fields=['sent_ok', 'next_attempt_at'], name='mailings_ou_sent_ok_b1d266_idx'),
+        ),
+        migrations.RunPython(reschedule_failed, migrations.RunPython.noop),
+    ]
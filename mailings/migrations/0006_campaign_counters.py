@@ -0,0 +1,53 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:22
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def fill_counters(apps, schema_editor):
+    # Engangs-opptelling; deretter holdes tellerne ved like av senderen
+    Campaign = apps.get_model("mailings", "Campaign")
+    Outbox = apps.get_model("mailings", "Outbox")
+    totals = (Outbox.objects
+              .values("campaign_id")
+              .annotate(queued=Count("id"), sent=Count("id", filter=Q(sent_ok=True)), attempts=Sum("attempts"))
+              .order_by())
+    for t in totals:
+        attempts = t["attempts"] or 0
+        Campaign.objects.filter(pk=t["campaign_id"]).update(
+            queued_count=t["queued"],
+            sent_count=t["sent"],
+            attempts_count=attempts,
+            failed_count=max(0, attempts - t["sent"]),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailings', '0005_adaptive_sending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='attempts_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Forsøk'),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='failed_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Feilede forsøk'),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='queued_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='I kø'),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='sent_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Sendt'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailings', '0006_campaign_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailLogSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dag', models.DateField()),
+                ('info_count', models.PositiveIntegerField(default=0, verbose_name='INFO')),
+                ('warn_count', models.PositiveIntegerField(default=0, verbose_name='WARN')),
+                ('err_count', models.PositiveIntegerField(default=0, verbose_name='ERR')),
+                ('first_created', models.DateTimeField(verbose_name='Første')),
+                ('last_created', models.DateTimeField(verbose_name='Siste')),
+                ('messages', models.BinaryField(blank=True, default=b'', verbose_name='Feilmeldinger (komprimert)')),
+            ],
+            options={
+                'verbose_name': 'Logg-sammendrag',
+                'verbose_name_plural': 'Logg-sammendrag',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='emaillog',
+            index=models.Index(fields=['outbox', 'created'], name='mailings_em_outbox__c82858_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emaillog',
+            index=models.Index(fields=['created'], name='mailings_em_created_b36b22_idx'),
+        ),
+        migrations.AddField(
+            model_name='emaillogsummary',
+            name='campaign',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='log_summaries', to='mailings.campaign'),
+        ),
+        migrations.AddConstraint(
+            model_name='emaillogsummary',
+            constraint=models.UniqueConstraint(fields=('campaign', 'dag'), name='uniq_logsummary_campaign_day'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:57
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_counts(apps, schema_editor):
+    # Engangs-opptelling; deretter holdes deferred_count og parked_count av senderen.
+    # Feilede rader fra den gamle senderen som brukte opp forsøkene (se 0005) er gitt opp.
+    Campaign = apps.get_model("mailings", "Campaign")
+    Outbox = apps.get_model("mailings", "Outbox")
+    Campaign.objects.update(deferred_count=0, parked_count=0)
+    for field, rows in (
+        ("deferred_count", Outbox.objects.filter(sent_ok=False, next_attempt_at__isnull=False)),
+        ("parked_count", Outbox.objects.filter(sent_ok=False, attempts__gt=0, next_attempt_at__isnull=True)),
+    ):
+        for t in rows.values("campaign_id").annotate(n=Count("id")).order_by():
+            Campaign.objects.filter(pk=t["campaign_id"]).update(**{field: t["n"]})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailings', '0007_email_log_retention'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='parked_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Gitt opp'),
+        ),
+        migrations.RunPython(fill_counts, migrations.RunPython.noop),
+    ]
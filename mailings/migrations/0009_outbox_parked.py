@@ -0,0 +1,47 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:05
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F
+from django.utils import timezone
+
+
+def mark_parked(apps, schema_editor):
+    # Før parked-flagget betydde "next_attempt_at NULL etter minst ett forsøk" gitt opp.
+    # Rader med forsøk igjen (også de en --dry-run telte opp) planlegges på nytt,
+    # resten flagges; deretter telles kampanjene opp igjen.
+    Campaign = apps.get_model("mailings", "Campaign")
+    Outbox = apps.get_model("mailings", "Outbox")
+    max_attempts = int(getattr(settings, "MAILINGS_MAX_ATTEMPTS", 6))
+    unsent = Outbox.objects.filter(sent_ok=False, attempts__gt=0, next_attempt_at__isnull=True)
+    unsent.filter(attempts__lt=max_attempts).update(next_attempt_at=timezone.now())
+    unsent.filter(attempts__gte=max_attempts).update(parked=True)
+
+    Campaign.objects.update(deferred_count=0, parked_count=0)
+    for field, rows in (
+        ("deferred_count", Outbox.objects.filter(sent_ok=False, next_attempt_at__isnull=False)),
+        ("parked_count", Outbox.objects.filter(sent_ok=False, parked=True)),
+    ):
+        for t in rows.values("campaign_id").annotate(n=Count("id")).order_by():
+            Campaign.objects.filter(pk=t["campaign_id"]).update(**{field: t["n"]})
+    # kampanjer der alt er sendt eller gitt opp blir aldri flushet av senderen igjen
+    (Campaign.objects
+     .filter(status__in=["QUEUED", "SENDING"], queued_count__gt=0,
+             queued_count__lte=F("sent_count") + F("parked_count"))
+     .update(status="SENT"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailings', '0008_campaign_parked_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outbox',
+            name='parked',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_parked, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailings', '0009_outbox_parked'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='outbox',
+            index=models.Index(fields=['to_email'], name='mailings_ou_to_emai_11e2dc_idx'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from geo.models import Fylke, Kommune
+from members.models import FYLKESLAG_ROLLER
 
 User = get_user_model()
 
@@ -26,7 +28,35 @@ class Campaign(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="DRAFT")
     opprettet = models.DateTimeField(auto_now_add=True)
 
-    # (kommer senere: scope/filtre per rolle – vi begynner enkelt)
+    # Målgruppe (tomt felt = ingen begrensning), se mailings.audience
+    MAAL_STATUS_CHOICES = [
+        ("approved", "Kun godkjente"),
+        ("pending", "Kun til godkjenning"),
+        ("all", "Alle"),
+    ]
+    maal_fylke = models.ForeignKey(Fylke, on_delete=models.SET_NULL, null=True, blank=True, related_name="+", verbose_name="Fylke")
+    maal_kommune = models.ForeignKey(Kommune, on_delete=models.SET_NULL, null=True, blank=True, related_name="+", verbose_name="Kommune")
+    maal_lokallag = models.ForeignKey("members.Lokallag", on_delete=models.SET_NULL, null=True, blank=True, related_name="+", verbose_name="Lokallag")
+    maal_fylkeslag_rolle = models.CharField("Fylkeslag-rolle", max_length=20, choices=FYLKESLAG_ROLLER, blank=True)
+    maal_sentral_rolle = models.ForeignKey(
+        "members.Rolle", on_delete=models.SET_NULL, null=True, blank=True, related_name="+",
+        limit_choices_to={"scope": "sentral"}, verbose_name="Sentralstyre-rolle",
+    )
+    maal_status = models.CharField("Medlemsstatus", max_length=10, choices=MAAL_STATUS_CHOICES, default="approved")
+
+    # Fremdrift (denormalisert, se services.DeliveryBuffer.flush og audience.queue_campaign)
+    queued_count = models.PositiveIntegerField("I kø", default=0)
+    sent_count = models.PositiveIntegerField("Sendt", default=0)
+    failed_count = models.PositiveIntegerField("Feilede forsøk", default=0)
+    attempts_count = models.PositiveIntegerField("Forsøk", default=0)
+
+    # Sendetilstand, oppdateres av send_mailings etter hver batch
+    send_rate = models.FloatField("Rate (per min)", null=True, blank=True)
+    backoff_until = models.DateTimeField("Backoff til", null=True, blank=True)
+    deferred_count = models.PositiveIntegerField("Utsatt", default=0)
+    parked_count = models.PositiveIntegerField("Gitt opp", default=0)
+    send_state_updated = models.DateTimeField("Sist oppdatert", null=True, blank=True)
+
     def __str__(self):
         return f"{self.navn} ({self.status})"
 
@@ -39,6 +69,13 @@ class Outbox(models.Model):
     attempts = models.PositiveSmallIntegerField(default=0)
     last_try = models.DateTimeField(null=True, blank=True)
     created = models.DateTimeField(auto_now_add=True)
+    # lease: hvilken sender som har raden nå, og til når (utløpt lease = ledig igjen)
+    claimed_by = models.CharField(max_length=100, blank=True)
+    lease_until = models.DateTimeField(null=True, blank=True)
+    # neste forsøk etter midlertidig feil (eksponentiell backoff); NULL = ikke forsøkt ennå
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    # gitt opp (permanent feil / MAILINGS_MAX_ATTEMPTS) – hentes ikke av senderen
+    parked = models.BooleanField(default=False)
 
     class Meta:
         constraints = [
@@ -46,6 +83,9 @@ class Outbox(models.Model):
         ]
         indexes = [
             models.Index(fields=["campaign", "sent_ok"]),
+            models.Index(fields=["sent_ok", "lease_until"]),
+            models.Index(fields=["sent_ok", "next_attempt_at"]),
+            models.Index(fields=["to_email"]),  # søk i admin (Outbox og EmailLog)
         ]
 
     def __str__(self):
@@ -58,5 +98,37 @@ class EmailLog(models.Model):
     message = models.TextField()
     created = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["outbox", "created"]),
+            models.Index(fields=["created"]),  # retention: prune_email_logs skanner på dato
+        ]
+
     def __str__(self):
         return f"{self.created:%Y-%m-%d %H:%M} {self.level}: {self.message[:60]}"
+
+
+class EmailLogSummary(models.Model):
+    """
+    Sammendrag av EmailLog-rader som er slettet av prune_email_logs: én rad per
+    kampanje og dag, med antall per nivå og de vanligste feilmeldingene
+    (zlib-komprimert JSON, se mailings.retention).
+    """
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name="log_summaries")
+    dag = models.DateField()
+    info_count = models.PositiveIntegerField("INFO", default=0)
+    warn_count = models.PositiveIntegerField("WARN", default=0)
+    err_count = models.PositiveIntegerField("ERR", default=0)
+    first_created = models.DateTimeField("Første")
+    last_created = models.DateTimeField("Siste")
+    messages = models.BinaryField("Feilmeldinger (komprimert)", blank=True, default=b"")
+
+    class Meta:
+        verbose_name = "Logg-sammendrag"
+        verbose_name_plural = "Logg-sammendrag"
+        constraints = [
+            models.UniqueConstraint(fields=["campaign", "dag"], name="uniq_logsummary_campaign_day")
+        ]
+
+    def __str__(self):
+        return f"{self.campaign_id} {self.dag}: {self.info_count}/{self.warn_count}/{self.err_count}"
@@ -0,0 +1,102 @@
+# mailings/retention.py
+"""
+Retention for EmailLog: gamle logglinjer rulles opp i EmailLogSummary (én rad
+per kampanje og dag) og slettes. Tellere per nivå bevares eksakt; WARN/ERR-
+meldingene lagres som {melding: antall} – de MAX_MESSAGES vanligste – i en
+zlib-komprimert JSON-blob.
+
+Arbeidet gjøres i biter på `chunk` rader (id-rekkefølge), hver i sin egen
+transaksjon, så låsene holdes kort og jobben kan avbrytes og startes på nytt.
+"""
+import json
+import zlib
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import EmailLog, EmailLogSummary
+
+RETENTION_DAYS = int(getattr(settings, "MAILINGS_LOG_RETENTION_DAYS", 180))
+MAX_MESSAGES = 50
+MESSAGE_LEN = 300
+LEVEL_FIELDS = {"INFO": "info_count", "WARN": "warn_count", "ERR": "err_count"}
+
+
+def pack_messages(counter):
+    top = dict(Counter(counter).most_common(MAX_MESSAGES))
+    return zlib.compress(json.dumps(top, ensure_ascii=False).encode("utf-8"), 9) if top else b""
+
+
+def unpack_messages(blob):
+    """{melding: antall} fra EmailLogSummary.messages."""
+    if not blob:
+        return {}
+    return json.loads(zlib.decompress(bytes(blob)).decode("utf-8"))
+
+
+def _summarise(rows):
+    """rows: (created, level, message, campaign_id) → {(campaign_id, dag): dict}"""
+    groups = defaultdict(lambda: {"levels": Counter(), "messages": Counter(), "first": None, "last": None})
+    for created, level, message, campaign_id in rows:
+        g = groups[(campaign_id, timezone.localdate(created))]
+        g["levels"][level] += 1
+        if level != "INFO":
+            g["messages"][message[:MESSAGE_LEN]] += 1
+        g["first"] = created if g["first"] is None else min(g["first"], created)
+        g["last"] = created if g["last"] is None else max(g["last"], created)
+    return groups
+
+
+def _merge(groups):
+    existing = {
+        (s.campaign_id, s.dag): s
+        for s in EmailLogSummary.objects.select_for_update().filter(
+            campaign_id__in={cid for cid, _ in groups}, dag__in={dag for _, dag in groups},
+        )
+    }
+    new, changed = [], []
+    for (cid, dag), g in groups.items():
+        s = existing.get((cid, dag))
+        if s is None:
+            s = EmailLogSummary(campaign_id=cid, dag=dag, first_created=g["first"], last_created=g["last"])
+            new.append(s)
+        else:
+            s.first_created = min(s.first_created, g["first"])
+            s.last_created = max(s.last_created, g["last"])
+            changed.append(s)
+        for level, field in LEVEL_FIELDS.items():
+            setattr(s, field, getattr(s, field) + g["levels"][level])
+        if g["messages"]:
+            s.messages = pack_messages(Counter(unpack_messages(s.messages)) + g["messages"])
+    EmailLogSummary.objects.bulk_create(new)
+    EmailLogSummary.objects.bulk_update(
+        changed, ["info_count", "warn_count", "err_count", "first_created", "last_created", "messages"],
+    )
+
+
+def prune_logs(before, *, chunk=5000, dry_run=False):
+    """
+    Rull opp og slett EmailLog-rader eldre enn `before`. Returnerer antall
+    rader som er (eller ville blitt, med dry_run) slettet.
+    """
+    old = EmailLog.objects.filter(created__lt=before)
+    if dry_run:
+        return old.count()
+    total, last_id = 0, 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                old.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", "created", "level", "message", "outbox__campaign_id")[:chunk]
+            )
+            if not rows:
+                break
+            _merge(_summarise(r[1:] for r in rows))
+            ids = [r[0] for r in rows]
+            EmailLog.objects.filter(id__in=ids).delete()
+        total += len(ids)
+        last_id = ids[-1]
+    return total
@@ -1,12 +1,72 @@
+import asyncio
+import os
+import smtplib
+import socket
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from datetime import timedelta
+
 from django.conf import settings
 from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F, Prefetch, Q
 from django.template import engines
+from django.utils import timezone
 from django.utils.html import strip_tags
 
-def render_template(template, context):
+from members.models import Lokallag, Medlem
+from .models import Campaign, EmailLog, Outbox
+
+LEASE_SECONDS = int(getattr(settings, "MAILINGS_LEASE_SECONDS", 600))
+RETRY_BASE_SECONDS = int(getattr(settings, "MAILINGS_RETRY_BASE_SECONDS", 300))
+RETRY_MAX_SECONDS = int(getattr(settings, "MAILINGS_RETRY_MAX_SECONDS", 6 * 3600))
+MAX_ATTEMPTS = int(getattr(settings, "MAILINGS_MAX_ATTEMPTS", 6))
+TEMPLATE_CACHE_SIZE = int(getattr(settings, "MAILINGS_TEMPLATE_CACHE_SIZE", 64))
+
+# (EmailTemplate.pk, sist_endret) -> (kompilert subject, kompilert html); LRU per prosess
+_compiled = OrderedDict()
+_compiled_lock = threading.Lock()
+
+
+def _compile(template):
     dj = engines["django"]
-    subject = dj.from_string(template.subject).render(context).strip()
-    html = dj.from_string(template.html_body).render(context)
+    return dj.from_string(template.subject), dj.from_string(template.html_body)
+
+
+def compiled_template(template):
+    """
+    Kompilerte (subject, html)-maler for en EmailTemplate. Nøkkelen inneholder
+    sist_endret, så en endret mal gir alltid ny kompilering.
+    """
+    if template.pk is None:
+        return _compile(template)
+    key = (template.pk, template.sist_endret)
+    with _compiled_lock:
+        hit = _compiled.get(key)
+        if hit is not None:
+            _compiled.move_to_end(key)
+            return hit
+    compiled = _compile(template)
+    with _compiled_lock:
+        _compiled[key] = compiled
+        _compiled.move_to_end(key)
+        while len(_compiled) > TEMPLATE_CACHE_SIZE:
+            _compiled.popitem(last=False)
+    return compiled
+
+
+def invalidate_template(pk):
+    """Fjern alle kompilerte versjoner av malen (kalles når den lagres/slettes)."""
+    with _compiled_lock:
+        for key in [k for k in _compiled if k[0] == pk]:
+            del _compiled[key]
+
+
+def render_template(template, context):
+    subject_tpl, html_tpl = compiled_template(template)
+    subject = subject_tpl.render(context).strip()
+    html = html_tpl.render(context)
     text = template.text_body.strip() if template.text_body else strip_tags(html)
     return subject, text, html
 
@@ -18,3 +78,291 @@ def send_one(to_email, subject, text, html, *, from_email=None, connection=None)
     # Valgfritt: List-Unsubscribe header
     # msg.extra_headers = {"List-Unsubscribe": "<mailto:no-reply@q1.no?subject=unsubscribe>"}
     msg.send(fail_silently=False)
+
+
+class TokenBucket:
+    """
+    Felles struping for alle sender-tråder: `rate_per_min` tokens fylles på
+    jevnt, og hver melding bruker ett. `burst` er hvor mange som kan gå rett
+    etter hverandre etter en pause. rate_per_min <= 0 betyr ingen struping.
+    """
+
+    def __init__(self, rate_per_min, burst=1):
+        self.rate = rate_per_min / 60.0
+        self.capacity = max(1, int(burst))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _take(self):
+        """Ta et token hvis ledig (0.0), ellers sekunder til neste blir ledig."""
+        with self._lock:
+            if self.rate <= 0:
+                return 0.0
+            self._refill(time.monotonic())
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """Blokkerer til et token er ledig. Returnerer ventetiden i sekunder."""
+        waited = 0.0
+        while True:
+            wait = self._take()
+            if not wait:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    async def acquire_async(self):
+        """Som acquire(), men for asyncio-motoren (blokkerer ikke løkka)."""
+        waited = 0.0
+        while True:
+            wait = self._take()
+            if not wait:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+
+def smtp_code(error):
+    """SMTP-statuskoden i et smtplib-unntak, eller None."""
+    code = getattr(error, "smtp_code", None)
+    if code is None and isinstance(error, smtplib.SMTPRecipientsRefused) and error.recipients:
+        code = next(iter(error.recipients.values()))[0]
+    return code
+
+
+def is_transient(error):
+    """4xx (421/450/451/452 …) og brutte tilkoblinger er midlertidige; 5xx er ikke."""
+    code = smtp_code(error)
+    if code is None:
+        return isinstance(error, (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError))
+    return 400 <= code < 500
+
+
+class AdaptiveRateLimiter(TokenBucket):
+    """
+    TokenBucket som justerer seg etter svarene fra relayen (AIMD):
+    midlertidig feil (4xx) halverer raten og gir en pause som dobles for hver
+    feil på rad; hver vellykket sending øker raten litt igjen, opp til taket
+    `max_per_min`. Uten tak (<= 0) brukes bare pausene.
+    """
+    RAMP = 0.05           # økning per OK, andel av taket
+    BACKOFF_BASE = 2.0    # sekunder pause ved første 4xx
+    BACKOFF_MAX = 300.0
+
+    def __init__(self, max_per_min, min_per_min=None, burst=1):
+        super().__init__(max_per_min, burst)
+        self.max_rate = self.rate
+        self.min_rate = (min_per_min or max(1.0, max_per_min / 20)) / 60.0
+        self.failures = 0       # 4xx på rad
+        self.backoff = 0.0      # siste pause i sekunder
+        self.paused_until = 0.0  # time.monotonic()
+        self.deferred = 0       # antall utsatte meldinger i denne kjøringen
+
+    @property
+    def rate_per_min(self):
+        return self.rate * 60.0
+
+    @property
+    def backoff_remaining(self):
+        return max(0.0, self.paused_until - time.monotonic())
+
+    def _take(self):
+        with self._lock:
+            pause = self.paused_until - time.monotonic()
+        if pause > 0:
+            return pause
+        return super()._take()
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            if self.max_rate > 0:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * self.RAMP)
+
+    def transient_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.deferred += 1
+            if self.max_rate > 0:
+                self.rate = max(self.min_rate, self.rate / 2)
+            self.backoff = min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** min(self.failures - 1, 16))
+            self.paused_until = max(self.paused_until, time.monotonic() + self.backoff)
+
+    def describe(self):
+        state = f"rate {self.rate_per_min:.0f}/min"
+        if self.backoff_remaining:
+            state += f", backoff {self.backoff_remaining:.0f}s ({self.failures} 4xx på rad)"
+        return state + f", utsatt {self.deferred}"
+
+
+def retry_delay(attempts):
+    """Eksponentiell ventetid før neste forsøk på en Outbox-rad."""
+    return timedelta(seconds=min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** max(0, attempts - 1)))
+
+
+def sender_id():
+    """Identifiserer denne sender-prosessen i Outbox.claimed_by."""
+    return f"{socket.gethostname()}:{os.getpid()}"[:100]
+
+
+def claim_batch(claimed_by, limit, *, campaign_id=None, lease_seconds=LEASE_SECONDS):
+    """
+    Reserver opptil `limit` usendte Outbox-rader for `claimed_by`.
+
+    Radene låses med SELECT ... FOR UPDATE SKIP LOCKED (MySQL 8), så flere
+    sendere kan kjøre samtidig uten å ta de samme radene. Rader med utløpt
+    lease (sender som døde) blir ledige igjen. Utsatte rader venter til
+    next_attempt_at; nye rader (uten next_attempt_at) tas først. Rader som
+    er gitt opp (parked) hentes ikke.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        qs = (Outbox.objects
+              .select_for_update(skip_locked=True)
+              .filter(sent_ok=False, parked=False)
+              .filter(Q(lease_until__isnull=True) | Q(lease_until__lt=now))
+              .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+              .order_by(F("next_attempt_at").asc(nulls_first=True), "id"))
+        if campaign_id:
+            qs = qs.filter(campaign_id=campaign_id)
+        ids = list(qs.values_list("id", flat=True)[:limit])
+        if not ids:
+            return []
+        Outbox.objects.filter(id__in=ids).update(
+            claimed_by=claimed_by,
+            lease_until=now + timedelta(seconds=lease_seconds),
+        )
+    return list(Outbox.objects
+                .filter(id__in=ids, claimed_by=claimed_by)
+                .select_related("campaign", "campaign__template", "campaign__opprettet_av")
+                .order_by("id"))
+
+
+def release_claims(claimed_by, since):
+    """
+    Slipp leasen på rader vi holder, men ikke har forsøkt siden `since`
+    (f.eks. ved Ctrl-C midt i en batch). Feilede forsøk har allerede fått
+    next_attempt_at. since=None slipper alle usendte rader vi holder.
+    """
+    qs = Outbox.objects.filter(claimed_by=claimed_by, sent_ok=False)
+    if since is not None:
+        qs = qs.filter(Q(last_try__isnull=True) | Q(last_try__lt=since))
+    return qs.update(claimed_by="", lease_until=None)
+
+
+def prefetch_members(batch):
+    """
+    Hent Medlem for alle Outbox-rader i batchen med én in_bulk() (+ én
+    prefetch av lokallag), slik at malene kan bruke {{ medlem.fornavn }},
+    medlem.kommune.fylke og medlem.lokallag.all uten spørring per mottaker.
+    Returnerer {medlem_id: Medlem}.
+    """
+    ids = {ob.medlem_id for ob in batch if ob.medlem_id}
+    if not ids:
+        return {}
+    return (Medlem.objects
+            .select_related("kommune__fylke", "postnummer")
+            .prefetch_related(Prefetch("lokallag", queryset=Lokallag.objects.select_related("fylke")))
+            .in_bulk(ids))
+
+
+class DeliveryBuffer:
+    """
+    Samler statusendringer (Outbox), logglinjer (EmailLog) og teller-endringer
+    (Campaign) fra sender-trådene i minnet, og skriver alt med bulk_update/
+    bulk_create/F()-oppdateringer i én transaksjon per flush(). Senderen
+    flusher etter hver batch, så en drept prosess mister høyst én batch med
+    bokføring – og tellerne er alltid i takt med Outbox.
+    """
+    FIELDS = ["sent_ok", "attempts", "last_try", "lease_until", "next_attempt_at", "parked"]
+    COUNTERS = {"sent": "sent_count", "failed": "failed_count", "attempts": "attempts_count",
+                "deferred": "deferred_count", "parked": "parked_count"}
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._outbox = {}
+        self._logs = []
+        self._counts = defaultdict(Counter)
+
+    def record(self, ob, level, message):
+        with self._lock:
+            self._outbox[ob.pk] = ob
+            self._logs.append(EmailLog(outbox=ob, level=level, message=message))
+
+    def count(self, campaign_id, **deltas):
+        """Endre kampanjetellere, f.eks. count(cid, sent=1, attempts=1, deferred=-1)."""
+        with self._lock:
+            self._counts[campaign_id].update(deltas)
+
+    def flush(self):
+        """Skriv alt som er samlet opp. Returnerer antall Outbox-rader."""
+        with self._lock:
+            rows, logs, counts = list(self._outbox.values()), self._logs, self._counts
+            self._outbox, self._logs, self._counts = {}, [], defaultdict(Counter)
+        if not rows and not logs and not counts:
+            return 0
+        with transaction.atomic():
+            Outbox.objects.bulk_update(rows, self.FIELDS, batch_size=500)
+            EmailLog.objects.bulk_create(logs, batch_size=500)
+            for cid, deltas in counts.items():
+                changes = {self.COUNTERS[k]: F(self.COUNTERS[k]) + v for k, v in deltas.items() if v}
+                if changes:
+                    Campaign.objects.filter(pk=cid).update(**changes)
+            if counts:
+                ids = list(counts)
+                Campaign.objects.filter(pk__in=ids, status="QUEUED").update(status="SENDING")
+                (Campaign.objects
+                 .filter(pk__in=ids, status="SENDING", queued_count__gt=0,
+                         queued_count__lte=F("sent_count") + F("parked_count"))
+                 .update(status="SENT"))
+        return len(rows)
+
+
+def campaign_progress(campaign_id):
+    """Fremdrift for én kampanje som dict (én PK-oppslag, ingen COUNT over Outbox)."""
+    row = (Campaign.objects
+           .filter(pk=campaign_id)
+           .values("id", "navn", "status", "queued_count", "sent_count", "failed_count", "attempts_count",
+                   "send_rate", "deferred_count", "parked_count", "backoff_until", "send_state_updated")
+           .first())
+    if row is None:
+        return None
+    queued, sent, parked = row["queued_count"], row["sent_count"], row["parked_count"]
+    return {
+        "id": row["id"],
+        "navn": row["navn"],
+        "status": row["status"],
+        "queued": queued,
+        "sent": sent,
+        "remaining": max(0, queued - sent - parked),
+        "failed_attempts": row["failed_count"],
+        "attempts": row["attempts_count"],
+        "percent": round(100.0 * sent / queued, 1) if queued else 0.0,
+        "send_rate": row["send_rate"],
+        "deferred": row["deferred_count"],
+        "parked": parked,
+        "backoff_until": row["backoff_until"].isoformat() if row["backoff_until"] else None,
+        "updated": row["send_state_updated"].isoformat() if row["send_state_updated"] else None,
+    }
+
+
+def update_send_state(campaign_ids, limiter):
+    """
+    Lagre limiterens tilstand på kampanjene (vises i admin). deferred_count
+    holdes av DeliveryBuffer sammen med de andre tellerne.
+    """
+    now = timezone.now()
+    backoff = limiter.backoff_remaining
+    Campaign.objects.filter(pk__in=set(campaign_ids)).update(
+        send_rate=round(limiter.rate_per_min, 1),
+        backoff_until=now + timedelta(seconds=backoff) if backoff else None,
+        send_state_updated=now,
+    )
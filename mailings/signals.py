@@ -0,0 +1,13 @@
+# mailings/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import EmailTemplate
+from .services import invalidate_template
+
+
+@receiver(post_save, sender=EmailTemplate)
+@receiver(post_delete, sender=EmailTemplate)
+def emailtemplate_changed(sender, instance, **kwargs):
+    # kompilert mal-cache (services.compiled_template) er per prosess
+    invalidate_template(instance.pk)
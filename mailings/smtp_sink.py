@@ -0,0 +1,129 @@
+# mailings/smtp_sink.py
+"""
+Lokal SMTP-"sluk" for benchmark og manuell testing (à la aiosmtpd): godtar
+alt, teller meldinger og kaster innholdet. `latency` forsinker hvert svar
+for å etterligne rundturtiden mot en ekte relay; kommandoer som kommer i
+samme skriving (PIPELINING) besvares samlet etter én forsinkelse.
+`tempfail_every=N` gir 451 på hver N-te MAIL FROM (for å teste backoff).
+`pipelined` teller meldinger der MAIL FROM og DATA kom i samme skriving,
+og drop() lukker alle åpne tilkoblinger (for å teste gjenoppkobling).
+
+    with SinkServer(latency=0.02) as sink:
+        ... send til 127.0.0.1:sink.port ...
+        print(sink.received)
+"""
+import asyncio
+import threading
+
+
+class _SinkProtocol(asyncio.Protocol):
+    def __init__(self, server):
+        self.server = server
+        self.buffer = b""
+        self.in_data = False
+        self.in_mail = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.server.connections += 1
+        self.server._transports.add(transport)
+        self._reply([b"220 sink ESMTP"])
+
+    def connection_lost(self, exc):
+        self.server._transports.discard(self.transport)
+
+    def _reply(self, lines, close=False):
+        payload = b"".join(line + b"\r\n" for line in lines)
+        loop = asyncio.get_running_loop()
+
+        def send():
+            if not self.transport.is_closing():
+                self.transport.write(payload)
+                if close:
+                    self.transport.close()
+        loop.call_later(self.server.latency, send)
+
+    def data_received(self, data):
+        self.buffer += data
+        replies, close, mail = [], False, False
+        while b"\r\n" in self.buffer:
+            line, self.buffer = self.buffer.split(b"\r\n", 1)
+            if self.in_data:
+                if line == b".":
+                    self.in_data = self.in_mail = False
+                    self.server.received += 1
+                    replies.append(b"250 OK queued")
+                continue
+            verb = line[:4].upper()
+            if verb == b"EHLO":
+                replies += [b"250-sink", b"250-PIPELINING", b"250 8BITMIME"]
+            elif verb == b"MAIL":
+                self.server.mail_from += 1
+                mail = True
+                n = self.server.tempfail_every
+                self.in_mail = not (n and self.server.mail_from % n == 0)
+                replies.append(b"250 OK" if self.in_mail else b"451 Try again later")
+            elif verb in (b"RCPT", b"DATA") and not self.in_mail:
+                replies.append(b"503 Bad sequence of commands")
+            elif verb == b"RSET":
+                self.in_mail = False
+                replies.append(b"250 OK")
+            elif verb in (b"HELO", b"RCPT", b"NOOP"):
+                replies.append(b"250 OK")
+            elif verb == b"DATA":
+                self.in_data = True
+                self.server.pipelined += mail
+                replies.append(b"354 End data with <CR><LF>.<CR><LF>")
+            elif verb == b"QUIT":
+                replies.append(b"221 Bye")
+                close = True
+            else:
+                replies.append(b"502 Command not implemented")
+        if replies:
+            self._reply(replies, close=close)
+
+
+class SinkServer:
+    """Kjører sluket i en egen tråd med egen event-løkke."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, tempfail_every=0):
+        self.host, self.port, self.latency = host, port, latency
+        self.tempfail_every = tempfail_every
+        self.received = 0
+        self.mail_from = 0
+        self.pipelined = 0
+        self.connections = 0
+        self._transports = set()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        server = asyncio.run_coroutine_threadsafe(
+            self._loop.create_server(lambda: _SinkProtocol(self), self.host, self.port), self._loop,
+        ).result()
+        self._server = server
+        self.port = server.sockets[0].getsockname()[1]
+        return self
+
+    def drop(self):
+        """Lukk alle åpne tilkoblinger fra serversiden (som en relay med idle-timeout)."""
+        async def close():
+            for transport in list(self._transports):
+                transport.close()
+        asyncio.run_coroutine_threadsafe(close(), self._loop).result(timeout=5)
+
+    def stop(self):
+        async def shutdown():
+            self._server.close()
+            await self._server.wait_closed()
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,32 @@
+// Oppdaterer fremdriftslinja på kampanjesiden i admin (CampaignAdmin.fremdrift).
+// Endepunktet leser bare tellerne på Campaign-raden, så hyppig polling er billig.
+(function () {
+  "use strict";
+  var INTERVAL_MS = 5000;
+
+  function poll(el) {
+    var url = el.getAttribute("data-progress-url");
+    var bar = el.querySelector("progress");
+    var text = el.querySelector(".progress-text");
+    function tick() {
+      fetch(url, { credentials: "same-origin", headers: { Accept: "application/json" } })
+        .then(function (r) { return r.ok ? r.json() : null; })
+        .then(function (d) {
+          if (!d) return;
+          bar.value = d.percent;
+          var parts = [d.sent + " av " + d.queued + " sendt (" + d.percent + "%)"];
+          if (d.failed_attempts) parts.push(d.failed_attempts + " feilede forsøk");
+          if (d.deferred) parts.push(d.deferred + " utsatt");
+          if (d.send_rate) parts.push(Math.round(d.send_rate) + "/min");
+          text.textContent = parts.join(" · ");
+          if (d.status !== "SENT" && d.status !== "DRAFT") window.setTimeout(tick, INTERVAL_MS);
+        })
+        .catch(function () { window.setTimeout(tick, INTERVAL_MS * 4); });
+    }
+    tick();
+  }
+
+  document.addEventListener("DOMContentLoaded", function () {
+    document.querySelectorAll("[data-progress-url]").forEach(poll);
+  });
+})();
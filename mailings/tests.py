@@ -1,3 +1,193 @@
-from django.test import TestCase
+import asyncio
+import smtplib
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .async_smtp import AsyncSMTPSession, send_one_async
+from .management.commands import send_mailings
+from .models import Campaign, EmailTemplate, Outbox
+from .services import AdaptiveRateLimiter, DeliveryBuffer, claim_batch, is_transient, release_claims
+from .smtp_sink import SinkServer
+
+
+def make_campaign(n, **kwargs):
+    template = EmailTemplate.objects.create(navn="t", subject="Hei {{ campaign.navn }}", html_body="<p>Hei</p>")
+    camp = Campaign.objects.create(navn="c", template=template, status="QUEUED", queued_count=n, **kwargs)
+    Outbox.objects.bulk_create([Outbox(campaign=camp, to_email=f"m{i}@example.com") for i in range(n)])
+    return camp
+
+
+def run_send_mailings(*args):
+    # ingen struping i testene
+    with mock.patch.object(send_mailings, "MAX_PER_MIN", 0):
+        call_command("send_mailings", *args, stdout=StringIO())
+
+
+class ClaimTests(TestCase):
+    def test_lease_holder_radene_for_andre_sendere(self):
+        make_campaign(3)
+        first = claim_batch("a", 2)
+        self.assertEqual(len(first), 2)
+        self.assertTrue(all(ob.claimed_by == "a" and ob.lease_until for ob in first))
+        rest = claim_batch("b", 10)
+        self.assertEqual(len(rest), 1)
+        self.assertNotIn(rest[0].pk, {ob.pk for ob in first})
+        self.assertEqual(claim_batch("c", 10), [])
+
+    def test_utlopt_lease_kan_tas_igjen(self):
+        make_campaign(2)
+        claimed = claim_batch("a", 10, lease_seconds=60)
+        Outbox.objects.filter(pk=claimed[0].pk).update(lease_until=timezone.now() - timedelta(seconds=1))
+        again = claim_batch("b", 10)
+        self.assertEqual([ob.pk for ob in again], [claimed[0].pk])
+        self.assertEqual(again[0].claimed_by, "b")
+
+    def test_release_claims_slipper_uforsokte_rader(self):
+        make_campaign(3)
+        started = timezone.now()
+        a, b, c = claim_batch("a", 10)
+        Outbox.objects.filter(pk=a.pk).update(last_try=timezone.now(), attempts=1,
+                                              next_attempt_at=timezone.now() + timedelta(hours=1))
+        self.assertEqual(release_claims("a", started), 2)
+        self.assertEqual(Outbox.objects.filter(claimed_by="a").count(), 1)
+        self.assertEqual(sorted(ob.pk for ob in claim_batch("b", 10)), sorted([b.pk, c.pk]))
+
+    def test_sendte_rader_tas_ikke(self):
+        make_campaign(2)
+        Outbox.objects.filter(pk=Outbox.objects.first().pk).update(sent_ok=True)
+        self.assertEqual(len(claim_batch("a", 10)), 1)
+
+
+class SendMailingsTests(TestCase):
+    def test_dry_run_blokkerer_ikke_ekte_sending(self):
+        camp = make_campaign(3)
+        run_send_mailings("--dry-run")
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(set(Outbox.objects.values_list("attempts", "parked", "claimed_by")), {(0, False, "")})
+
+        run_send_mailings()
+        self.assertEqual(len(mail.outbox), 3)
+        camp.refresh_from_db()
+        self.assertEqual((camp.status, camp.sent_count, camp.parked_count), ("SENT", 3, 0))
+
+    def _fail(self, ob, error):
+        buffer, stats = DeliveryBuffer(), send_mailings.WorkerStats(1)
+        send_mailings._record_failed(ob, error, False, buffer, stats, AdaptiveRateLimiter(0))
+        buffer.flush()
+        ob.refresh_from_db()
+
+    def test_midlertidig_feil_utsettes(self):
+        camp = make_campaign(1)
+        ob, = claim_batch("test", 10)
+        self._fail(ob, smtplib.SMTPResponseException(451, "Try again later"))
+        self.assertFalse(ob.parked)
+        self.assertIsNotNone(ob.next_attempt_at)
+        camp.refresh_from_db()
+        self.assertEqual((camp.deferred_count, camp.parked_count), (1, 0))
+        # ikke forfalt ennå
+        self.assertEqual(claim_batch("test", 10), [])
+
+    def test_permanent_feil_gis_opp(self):
+        camp = make_campaign(1)
+        ob, = claim_batch("test", 10)
+        self._fail(ob, smtplib.SMTPRecipientsRefused({ob.to_email: (550, b"No such user")}))
+        self.assertTrue(ob.parked)
+        self.assertIsNone(ob.next_attempt_at)
+        camp.refresh_from_db()
+        self.assertEqual((camp.status, camp.parked_count), ("SENT", 1))
+        Outbox.objects.update(lease_until=None)
+        self.assertEqual(claim_batch("test", 10), [])
+
+    def test_trad_apner_ny_tilkobling_etter_brudd(self):
+        make_campaign(1)
+        ob, = claim_batch("test", 10)
+        buffer, stats = DeliveryBuffer(), send_mailings.WorkerStats(1)
+        engine = send_mailings.ThreadEngine([], AdaptiveRateLimiter(0), buffer, dry=False)
+        connection = mock.Mock()
+        with mock.patch.object(send_mailings, "send_one", side_effect=smtplib.SMTPServerDisconnected("borte")):
+            engine._deliver(ob, None, connection, stats)
+        engine.close()
+        connection.close.assert_called_once_with()
+        connection.open.assert_called_once_with()
+        self.assertEqual((stats.failed, stats.deferred), (1, 1))
+
+    def test_gis_opp_etter_max_attempts(self):
+        make_campaign(1)
+        Outbox.objects.update(attempts=send_mailings.MAX_ATTEMPTS - 1)
+        ob, = claim_batch("test", 10)
+        self._fail(ob, smtplib.SMTPResponseException(451, "Try again later"))
+        self.assertTrue(ob.parked)
+
+
+class AsyncSMTPTests(TestCase):
+    """Asynkron motor mot det lokale SMTP-sluket (mailings.smtp_sink)."""
+
+    def setUp(self):
+        self.sink = SinkServer().start()
+        self.addCleanup(self.sink.stop)
+        smtp = override_settings(EMAIL_HOST="127.0.0.1", EMAIL_PORT=self.sink.port, EMAIL_HOST_USER="",
+                                 EMAIL_HOST_PASSWORD="", EMAIL_USE_TLS=False, EMAIL_USE_SSL=False)
+        smtp.enable()
+        self.addCleanup(smtp.disable)
+
+    def test_pipelining_over_en_sesjon(self):
+        async def send():
+            session = AsyncSMTPSession()
+            for i in range(3):
+                await send_one_async(f"m{i}@example.com", "Hei", "tekst", "<p>html</p>", connection=session)
+            await session.close()
+            return session
+
+        session = asyncio.run(send())
+        self.assertIn("pipelining", session.features)
+        self.assertEqual(self.sink.received, 3)
+        self.assertEqual(self.sink.pipelined, 3)
+        self.assertEqual(self.sink.connections, 1)
+
+    def test_gjenoppkobling_etter_brudd(self):
+        async def send(session, to):
+            await send_one_async(to, "Hei", "tekst", "", connection=session)
+
+        async def run():
+            session = AsyncSMTPSession()
+            await send(session, "a@example.com")
+            self.sink.drop()
+            with self.assertRaises(smtplib.SMTPServerDisconnected) as cm:
+                await send(session, "b@example.com")
+            self.assertTrue(is_transient(cm.exception))
+            self.assertFalse(session.connected)
+            await send(session, "c@example.com")
+            await session.close()
+
+        asyncio.run(run())
+        self.assertEqual(self.sink.received, 2)
+        self.assertEqual(self.sink.connections, 2)
+
+    def test_4xx_gir_utsatt_rad(self):
+        self.sink.tempfail_every = 2
+        camp = make_campaign(4)
+        bucket, buffer = AdaptiveRateLimiter(0), DeliveryBuffer()
+        bucket.BACKOFF_BASE = 0.0  # ingen pause etter 451 i testen
+        stats = [send_mailings.WorkerStats(1)]
+        engine = send_mailings.AsyncEngine(stats, bucket, buffer, dry=False)
+        try:
+            batch = claim_batch("test", 10)
+            engine.run_batch([(ob, None) for ob in batch])
+        finally:
+            engine.close()
+        buffer.flush()
+
+        self.assertEqual(self.sink.received, 2)
+        self.assertEqual((stats[0].ok, stats[0].deferred), (2, 2))
+        deferred = Outbox.objects.filter(sent_ok=False)
+        self.assertEqual(deferred.count(), 2)
+        self.assertFalse(deferred.filter(next_attempt_at__isnull=True).exists())
+        self.assertFalse(deferred.filter(parked=True).exists())
+        camp.refresh_from_db()
+        self.assertEqual((camp.sent_count, camp.deferred_count, camp.status), (2, 2, "SENDING"))
@@ -2,8 +2,8 @@
 #print(">>> Laster FULL members.admin (prod) <<<")
 
 from django.contrib import admin, messages
-from django.db import transaction
-from django.db.models import Q, Count, Case, When, Value, IntegerField
+from django.db.models import Case, When, Value, IntegerField
+from django.utils import timezone
 from django.utils.html import format_html
 from django.urls import reverse
 from django.contrib.auth import get_user_model
@@ -80,13 +80,21 @@ def send_set_password_email(request, user):
 from .models import (
     Fylkeslag,
     Fylkeslagsmedlemskap,
+    Godkjenning,
+    Kontaktrute,
     Medlem,
     Lokallag,
     Medlemskap,
     PendingMedlem,
     Rolle,
     SentralstyreMedlemskap,
+    Varsel,
 )
+from .approval import approve
+from .pagination import CachedCountPaginator
+from .phone import is_phone_like, phone_q
+from .queries import in_lag_i_fylke, in_lokallag, pending_qs
+from .search import search_members
 from geo.models import Fylke, Kommune
 
 
@@ -148,11 +156,9 @@ class ApprovedListFilter(admin.SimpleListFilter):
     def queryset(self, request, queryset):
         v = self.value()
         if v == "yes":
-            return queryset.filter(verver_user__isnull=False)
+            return queryset.filter(status="approved")
         if v == "no":
-            return queryset.filter(verver_user__isnull=True, verve_kilde="self").filter(
-                Q(verver_navn__isnull=True) | Q(verver_navn="")
-            )
+            return queryset.filter(status="pending")
         return queryset
 
 
@@ -200,7 +206,7 @@ class LokallagListFilter(admin.SimpleListFilter):
 
     def queryset(self, request, queryset):
         v = self.value()
-        return queryset.filter(lokallag__id=v) if v else queryset
+        return queryset.filter(in_lokallag(v)) if v else queryset
 
 class FylkeslagFilter(admin.SimpleListFilter):
     title = "Fylkeslag"
@@ -283,9 +289,7 @@ class FylkeslagsmedlemskapInline(admin.TabularInline):
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         field = super().formfield_for_foreignkey(db_field, request, **kwargs)
         if db_field.name == "medlem" and self._current_fylke_id:
-            field.queryset = Medlem.objects.filter(
-                lokallag__fylke_id=self._current_fylke_id
-            ).distinct()
+            field.queryset = Medlem.objects.filter(in_lag_i_fylke(self._current_fylke_id))
         return field
 
 
@@ -333,8 +337,21 @@ class FylkeslagAdmin(admin.ModelAdmin):
     # Viktig: ingen inlines her før siden laster stabilt
     inlines = [FylkeslagsmedlemskapInline]
 
+class MedlemChangeListMixin:
+    """Admin-søk via Medlem.sok (FULLTEXT) i stedet for LIKE over search_fields, og cachet antall."""
+
+    # totalantall caches kort (members/pagination.py), og ingen ekstra COUNT(*) uten filter
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        if is_phone_like(search_term):
+            return queryset.filter(phone_q(search_term)), False
+        return search_members(queryset, search_term), False
+
+
 @admin.register(Medlem)
-class MedlemAdmin(admin.ModelAdmin):
+class MedlemAdmin(MedlemChangeListMixin, admin.ModelAdmin):
     list_display = (
         "etternavn", "fornavn",
         "telefon", "epost",
@@ -365,55 +382,39 @@ class MedlemAdmin(admin.ModelAdmin):
     lokallag_list.short_description = "Lokallag"
 
     def status(self, obj):
-        return "Godkjent" if obj.verver_user_id else "Pending"
-    status.admin_order_field = "verver_user"
+        return "Pending" if obj.status == "pending" else "Godkjent"
+    status.admin_order_field = "status"
 
 
 # ------------- PENDING-ADMIN --------------
 
 def pending_filter(qs):
-    return qs.filter(verve_kilde="self", verver_user__isnull=True).filter(
-        Q(verver_navn__isnull=True) | Q(verver_navn="")
-    )
+    return pending_qs(qs)
 
 
 @admin.action(description="Godkjenn valgte (krever lokallag)")
 def approve_members(modeladmin, request, queryset):
-    # Filtrer fortsatt bare "pending"
-    qs = pending_filter(queryset).annotate(lag_count=Count("lokallag"))
-    to_approve = qs.filter(lag_count__gt=0)
-    lacking    = qs.filter(lag_count=0)
+    result = approve(queryset, request.user, require_lokallag=True, kilde="admin")
 
-    if lacking.exists():
+    if result.lacking:
         # Vis en kort liste over hvem som mangler lokallag
-        sample = ", ".join(
-            f"{m['etternavn']}, {m['fornavn']} (id {m['id']})"
-            for m in lacking.values("id", "fornavn", "etternavn")[:10]
-        )
-        more = " ..." if lacking.count() > 10 else ""
+        sample = ", ".join(f"{etternavn}, {fornavn} (id {pk})" for pk, fornavn, etternavn in result.lacking_sample)
+        more = " ..." if result.lacking > len(result.lacking_sample) else ""
         messages.error(
             request,
-            f"{lacking.count()} medlem(mer) mangler lokallag. "
+            f"{result.lacking} medlem(mer) mangler lokallag. "
             f"Åpne raden og legg til lokallag i inlinen før godkjenning. {sample}{more}"
         )
 
-    if not to_approve.exists():
-        if not lacking.exists():
+    if not result.approved:
+        if not result.lacking:
             messages.info(request, "Ingen valgte rader å godkjenne.")
         return
 
-    with transaction.atomic():
-        updated = Medlem.objects.filter(
-            id__in=list(to_approve.values_list("id", flat=True))
-        ).update(
-            verver_user=request.user,
-            verver_navn=request.user.get_username(),
-        )
-
-    messages.success(request, f"Godkjente {updated} medlem(mer).")
+    messages.success(request, f"Godkjente {result.approved} medlem(mer).")
 
 @admin.register(PendingMedlem)
-class PendingMedlemAdmin(admin.ModelAdmin):
+class PendingMedlemAdmin(MedlemChangeListMixin, admin.ModelAdmin):
     list_display  = ("etternavn", "fornavn", "telefon", "kommune", "lokallag_list", "registrert")
     search_fields = ("fornavn", "etternavn", "telefon", "epost")
     list_per_page = 50
@@ -446,6 +447,62 @@ class PendingMedlemAdmin(admin.ModelAdmin):
         return False
 
 
+@admin.register(Godkjenning)
+class GodkjenningAdmin(admin.ModelAdmin):
+    list_display = ("godkjent", "medlem", "godkjent_av", "kilde")
+    list_filter = ("kilde",)
+    date_hierarchy = "godkjent"
+    search_fields = ("medlem__fornavn", "medlem__etternavn", "godkjent_av__username")
+    list_select_related = ("medlem", "godkjent_av")
+    readonly_fields = ("medlem", "godkjent_av", "godkjent", "kilde")
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.action(description="Send valgte varsler på nytt")
+def resend_varsler(modeladmin, request, queryset):
+    n = queryset.update(neste_forsok=timezone.now(), forsok=0, sendt=None, claimed_by="", lease_until=None)
+    messages.success(request, f"{n} varsler lagt i kø igjen.")
+
+
+@admin.register(Varsel)
+class VarselAdmin(admin.ModelAdmin):
+    list_display = ("opprettet", "type", "medlem", "forsok", "sendt", "neste_forsok", "feil")
+    list_filter = ("type", ("sendt", admin.EmptyFieldListFilter), ("neste_forsok", admin.EmptyFieldListFilter))
+    date_hierarchy = "opprettet"
+    search_fields = ("medlem__fornavn", "medlem__etternavn", "medlem__epost")
+    list_select_related = ("medlem",)
+    readonly_fields = ("type", "medlem", "opprettet", "neste_forsok", "forsok", "sendt", "feil",
+                       "claimed_by", "lease_until")
+    actions = [resend_varsler]
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(Kontaktrute)
+class KontaktruteAdmin(admin.ModelAdmin):
+    list_display = ("niva", "ref_id", "epost", "kilde", "oppdatert")
+    list_filter = ("niva", "kilde")
+    search_fields = ("epost",)
+    readonly_fields = ("niva", "ref_id", "epost", "kilde", "oppdatert")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Rolle)
 class RolleAdmin(admin.ModelAdmin):
     list_display = ("navn", "kode", "scope", "rang")
@@ -0,0 +1,59 @@
+# members/approval.py
+"""
+Godkjenning av selvregistreringer – felles for admin-handlingen, ventelista
+(ApproveBulk) og enkeltgodkjenning (MemberApprove).
+
+approve() klassifiserer de valgte ventende medlemmene (har lokallag / mangler
+lokallag) med én SELECT ... FOR UPDATE med EXISTS-annotasjon, og godkjenner
+dem med én UPDATE. Hvem og når skrives til Godkjenning med bulk_create, så
+2000 selvregistreringer er tre spørringer uansett antall.
+"""
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Godkjenning, Medlem, Medlemskap
+from .queries import pending_qs
+
+SAMPLE_SIZE = 10
+
+# lacking_sample: [(id, fornavn, etternavn)] – de første som mangler lokallag
+ApprovalResult = namedtuple("ApprovalResult", "approved lacking lacking_sample")
+
+
+def approver_name(user):
+    return user.get_full_name() or user.get_username()
+
+
+@transaction.atomic
+def approve(qs, user, *, require_lokallag=False, kilde="liste"):
+    """
+    Godkjenn de ventende medlemmene i `qs` (andre rader ignoreres).
+    Med require_lokallag godkjennes bare de som er med i minst ett lokallag.
+    """
+    har_lag = Exists(Medlemskap.objects.filter(medlem_id=OuterRef("pk")))
+    rows = list(
+        pending_qs(qs.prefetch_related(None))
+        .select_for_update()
+        .annotate(har_lag=har_lag)
+        .order_by("etternavn", "fornavn", "id")
+        .values_list("id", "fornavn", "etternavn", "har_lag")
+    )
+    ok = [pk for pk, _, _, lag in rows if lag or not require_lokallag]
+    lacking = [(pk, fornavn, etternavn) for pk, fornavn, etternavn, lag in rows if require_lokallag and not lag]
+
+    if ok:
+        # verve_kilde beholdes ('self'); verver_user/-navn markerer godkjent, og
+        # status følger samme regel som Medlem.fill_derived()
+        now = timezone.now()
+        Medlem.objects.filter(pk__in=ok).update(
+            verver_user=user, verver_navn=approver_name(user),
+            status="approved", approved_by=user, approved_at=now,
+        )
+        Godkjenning.objects.bulk_create(
+            [Godkjenning(medlem_id=pk, godkjent_av=user, godkjent=now, kilde=kilde) for pk in ok],
+            batch_size=1000,
+        )
+    return ApprovalResult(len(ok), len(lacking), lacking[:SAMPLE_SIZE])
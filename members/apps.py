@@ -8,6 +8,6 @@ class MembersConfig(AppConfig):
     name = "members"
 
     def ready(self):
-        # Vi sender e-post direkte fra viewet etter commit.
-        # (Kan reaktivere signals senere når rotårsaken er funnet.)
-        pass
+        # Varsler legges i kø fra viewet (members.Varsel) og sendes av send_varsler;
+        # signals holder kontaktrutene (members/routing.py) oppdatert.
+        from . import signals  # noqa: F401
@@ -0,0 +1,171 @@
+# members/export.py
+"""
+Strømmende eksport av medlemslister (CSV og XLSX).
+
+Radene hentes i keyset-biter (members.pagination) med values_list – ingen
+Medlem-instanser, og aldri mer enn CHUNK_SIZE rader i minnet. På MySQL
+bufrer driveren hele resultatet for én spørring, så .iterator() alene gir
+ikke konstant minne; derfor én LIMIT-spørring per bit.
+
+XLSX skrives med zipfile direkte ut i responsen (ingen openpyxl): ett ark,
+inline-strenger, og zip-oppføringen strømmes etter hvert som radene kommer.
+"""
+import csv
+import zipfile
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+
+from .models import Medlemskap
+from .pagination import ORDERING, after_q
+
+CHUNK_SIZE = 2000
+
+COLUMNS = [
+    ("Fornavn", "fornavn"),
+    ("Etternavn", "etternavn"),
+    ("Telefon", "telefon"),
+    ("E-post", "epost"),
+    ("Adresse", "adresse"),
+    ("Postnr", "postnummer__nummer"),
+    ("Poststed", "postnummer__poststed"),
+    ("Kommune", "kommune__navn"),
+    ("Fylke", "kommune__fylke__navn"),
+    ("Registrert", "registrert"),
+]
+HEADER = [label for label, _ in COLUMNS] + ["Lokallag"]
+
+
+def iter_rows(qs, chunk_size=CHUNK_SIZE):
+    """Rader (lister) for eksport, sortert på etternavn, fornavn, id."""
+    fields = [f for _, f in COLUMNS]
+    key_idx = [len(fields) + i for i in range(len(ORDERING))]
+    qs = qs.order_by(*ORDERING).values_list(*fields, *ORDERING)
+    after = None
+    while True:
+        chunk = list((qs.filter(after_q(ORDERING, after, "gt")) if after else qs)[:chunk_size])
+        if not chunk:
+            return
+        ids = [row[-1] for row in chunk]
+        lag = {}
+        for medlem_id, navn in (Medlemskap.objects.filter(medlem_id__in=ids)
+                                .order_by("lokallag__navn").values_list("medlem_id", "lokallag__navn")):
+            lag.setdefault(medlem_id, []).append(navn)
+        for row in chunk:
+            yield [*row[:len(fields)], ", ".join(lag.get(row[-1], []))]
+        if len(chunk) < chunk_size:
+            return
+        after = [chunk[-1][i] for i in key_idx]
+
+
+def _cell_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return timezone.localtime(value).strftime("%Y-%m-%d %H:%M") if timezone.is_aware(value) else f"{value:%Y-%m-%d %H:%M}"
+    return str(value)
+
+
+class _Echo:
+    """Fil-objekt for csv.writer: write() returnerer linja i stedet for å lagre den."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(_Echo(), delimiter=";")
+    # BOM slik at Excel åpner filen som UTF-8
+    yield "\ufeff" + writer.writerow(HEADER)
+    for row in rows:
+        yield writer.writerow([_cell_text(v) for v in row])
+
+
+class _Pipe:
+    """Ikke-søkbar strøm for zipfile: samler bytes til generatoren henter dem."""
+
+    def __init__(self):
+        self.parts = []
+        self.pos = 0
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, *args):
+        raise OSError("ikke søkbar")
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+_XLSX_STATIC = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/></Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Medlemmer" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/></Relationships>'
+    ),
+}
+
+
+def _xlsx_row(values):
+    cells = "".join(
+        f'<c t="inlineStr"><is><t xml:space="preserve">{escape(_cell_text(v))}</t></is></c>' for v in values
+    )
+    return f"<row>{cells}</row>".encode("utf-8")
+
+
+def stream_xlsx(rows, flush_every=500):
+    pipe = _Pipe()
+    with zipfile.ZipFile(pipe, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, xml in _XLSX_STATIC.items():
+            zf.writestr(name, xml)
+        yield pipe.drain()
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(_xlsx_row(HEADER))
+            for n, row in enumerate(rows, 1):
+                sheet.write(_xlsx_row(row))
+                if n % flush_every == 0:
+                    yield pipe.drain()
+            sheet.write(b"</sheetData></worksheet>")
+    yield pipe.drain()
@@ -1,7 +1,9 @@
 from django import forms
 from django.db import transaction
 from .models import Medlem, Lokallag
-from geo.models import Fylke, Kommune, Postnummer
+from .phone import normalize_phone
+from geo.models import Fylke, Kommune
+from geo import resolver as geo_resolver
 
 
 class MedlemForm(forms.ModelForm):
@@ -85,7 +87,7 @@ class MedlemForm(forms.ModelForm):
         if not raw.isdigit() or len(raw) != 4:
             raise forms.ValidationError("Ugyldig postnummer.")
         nr = raw.zfill(4)
-        pn = Postnummer.objects.filter(nummer=nr).first()
+        pn = geo_resolver.resolve(nr)
         if not pn:
             raise forms.ValidationError("Postnummer finnes ikke i registeret.")
         self._postnummer_instance = pn
@@ -97,7 +99,9 @@ class MedlemForm(forms.ModelForm):
         # Varsle (ikke blokkere) duplikat telefon
         tel = cleaned.get("telefon")
         if tel:
-            qs = Medlem.objects.filter(telefon=tel)
+            # samme nøkkel som lagres i telefon_e164 ("+47 900 00 000" == "90000000")
+            e164 = normalize_phone(tel)
+            qs = Medlem.objects.filter(telefon_e164=e164) if e164 else Medlem.objects.filter(telefon=tel)
             if self.instance and self.instance.pk:
                 qs = qs.exclude(pk=self.instance.pk)
             self._dupe_phones = qs.count()
@@ -105,10 +109,8 @@ class MedlemForm(forms.ModelForm):
         # Autofyll kommune/fylke fra postnummer
         pn = getattr(self, "_postnummer_instance", None)
         if pn:
-            pk = pn.kommuner.filter(primar=True).select_related("kommune__fylke").first() \
-                 or pn.kommuner.select_related("kommune__fylke").first()
-            if pk:
-                k = pk.kommune
+            k = geo_resolver.kommune_instance(pn.kommune)
+            if k:
                 if not cleaned.get("kommune"):
                     cleaned["kommune"] = k
                 if not cleaned.get("fylke"):
@@ -134,12 +136,9 @@ class MedlemForm(forms.ModelForm):
         # Knytt postnummer + evt. automatisk kommune
         pn = getattr(self, "_postnummer_instance", None)
         if pn is not None:
-            medlem.postnummer = pn
-            if not medlem.kommune:
-                pk = pn.kommuner.filter(primar=True).select_related("kommune").first() \
-                     or pn.kommuner.select_related("kommune").first()
-                if pk:
-                    medlem.kommune = pk.kommune
+            medlem.postnummer_id = pn.id
+            if medlem.kommune_id is None and pn.kommune:
+                medlem.kommune_id = pn.kommune.id
 
         # Sett verver automatisk når bruker er innlogget
         req = request or getattr(self, "request", None)
@@ -0,0 +1,249 @@
+# members/importer.py
+"""
+Masseimport av medlemmer fra CSV (management-kommandoen import_csv).
+
+Fila leses strømmende og behandles i biter på CHUNK_SIZE rader:
+- tekst repareres for cp850-mojibake (samme fikser som i det gamle
+  templates/import_medlemmer.py), men bare når strengen faktisk har tegn
+  fra C1-området – korrekt UTF-8 røres ikke;
+- postnummer og kommune slås opp i geo.resolver (ingen spørring per rad);
+- eksisterende medlemmer matches mot en indeks bygget med én spørring:
+  på e-post, og – når raden mangler e-post – på telefon (E.164) hvis bare
+  ett medlem har nummeret;
+- skriving skjer med bulk_create/bulk_update, én transaksjon per bit.
+
+Feltreglene for oppdatering er de samme som før: navn, telefon og adresse
+overskrives når CSV har en annen, ikke-tom verdi; postnummer, kommune og
+verve_kilde fylles bare når de mangler.
+"""
+import csv
+import re
+import time
+from collections import Counter
+
+from django.db import transaction
+
+from geo import resolver as geo_resolver
+
+from .models import Medlem
+from .phone import normalize_phone
+
+CHUNK_SIZE = 2000
+DUMMY_DOMAIN = "mangler.q1.no"
+REQUIRED = ("navn", "epost", "telefon", "adresse", "postnummer")
+OVERWRITE_FIELDS = ("fornavn", "etternavn", "telefon", "adresse")
+UPDATE_FIELDS = (*OVERWRITE_FIELDS, "postnummer", "kommune", "verve_kilde", *Medlem.DERIVED_FIELDS)
+
+_ARTIFACTS = re.compile(r"[Â┬](?=[åÅøØæÆ])")
+_C1 = re.compile("[\x80-\x9f]")
+_KEY_ALIASES = {
+    "navn": "navn",
+    "epost": "epost", "e-post": "epost", "email": "epost", "epostadresse": "epost",
+    "tlf": "telefon", "telefon": "telefon", "tlfnr": "telefon", "mobil": "telefon",
+    "adresse": "adresse",
+    "postnr": "postnummer", "postnummer": "postnummer",
+    "poststed": "poststed",
+    "fylke": "fylke",
+    "kommune": "kommune",
+}
+
+
+def repair_text(s):
+    """
+    cp850-tekst som er lest som latin-1/UTF-8 (å blir U+0086 osv.) tilbake
+    til riktige tegn, og fjern Â/┬-rester foran æøå.
+    """
+    if not s:
+        return s
+    if _C1.search(s):
+        try:
+            s = s.encode("latin-1").decode("cp850")
+        except UnicodeError:
+            pass
+    return _ARTIFACTS.sub("", s)
+
+
+def normalize_key(k):
+    k1 = re.sub(r"[ \-_.]", "", (k or "").strip().lower())
+    return _KEY_ALIASES.get(k1, k1)
+
+
+def split_name(fullname):
+    parts = (fullname or "").strip().split()
+    if not parts:
+        return "", ""
+    if len(parts) == 1:
+        return parts[0], ""
+    return " ".join(parts[:-1]), parts[-1]
+
+
+def sniff_dialect(sample):
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=";,")
+    except csv.Error:
+        class Semikolon(csv.excel):
+            delimiter = ";"
+        return Semikolon
+
+
+def dummy_email(fornavn, etternavn, postnr, domain=DUMMY_DOMAIN):
+    base = (etternavn or fornavn or "ukjent").strip().lower()
+    base = re.sub(r"[^a-z0-9]+", ".", base).strip(".")
+    return f"{base}.{postnr}@{domain}"
+
+
+class MemberIndex:
+    """E-post/telefon → medlem-id for eksisterende medlemmer (én spørring)."""
+
+    def __init__(self, qs=None):
+        self.by_epost = {}
+        self.by_phone = {}      # e164 -> id, eller None når flere deler nummeret
+        self.created = set()    # nøkler opprettet i denne kjøringen
+        qs = Medlem.objects.all() if qs is None else qs
+        for pk, epost, e164 in qs.order_by().values_list("id", "epost", "telefon_e164").iterator(chunk_size=5000):
+            if epost:
+                self.by_epost.setdefault(epost.lower(), pk)
+            if e164:
+                self.by_phone[e164] = None if e164 in self.by_phone else pk
+
+    def match(self, epost, e164, *, has_epost):
+        """Medlem-id, "ny" hvis raden allerede er opprettet i kjøringen, ellers None."""
+        if ("epost", epost) in self.created or (not has_epost and ("tel", e164) in self.created):
+            return "ny"
+        pk = self.by_epost.get(epost)
+        if pk is None and not has_epost and e164:
+            pk = self.by_phone.get(e164)
+        return pk
+
+    def add(self, epost, e164):
+        self.created.add(("epost", epost))
+        if e164:
+            self.created.add(("tel", e164))
+
+
+class Importer:
+    """
+    Kjør import av ferdig normaliserte rader (dict med nøkler fra
+    normalize_key). `on_diff(kind, label, changes)` kalles for hver ny
+    eller endret rad; `on_chunk(stats, elapsed)` etter hver bit.
+    """
+
+    def __init__(self, *, update_existing=True, dry_run=False, chunk_size=CHUNK_SIZE,
+                 dummy_domain=DUMMY_DOMAIN, on_diff=None, on_chunk=None):
+        self.update_existing = update_existing
+        self.dry_run = dry_run
+        self.chunk_size = chunk_size
+        self.dummy_domain = dummy_domain
+        self.on_diff = on_diff
+        self.on_chunk = on_chunk
+        self.stats = Counter()
+        self.index = None
+        self.started = None
+
+    def run(self, rows):
+        self.started = time.monotonic()
+        self.index = MemberIndex()
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                self._flush(chunk)
+                chunk = []
+        if chunk:
+            self._flush(chunk)
+        return self.stats
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started if self.started else 0.0
+
+    def parse(self, row):
+        """Rens én rad; None hvis postnummeret er ukjent."""
+        fornavn, etternavn = split_name(repair_text(row.get("navn", "")))
+        postnr = row.get("postnummer", "")
+        pn = geo_resolver.resolve(postnr)
+        if pn is None:
+            return None
+        epost_in = row.get("epost", "").lower()  # e-post skal ikke repareres
+        telefon = repair_text(row.get("telefon", ""))
+        kommune = geo_resolver.kommune_for(pn.nummer, repair_text(row.get("kommune", "")))
+        return {
+            "fornavn": fornavn,
+            "etternavn": etternavn,
+            "epost": epost_in or dummy_email(fornavn, etternavn, pn.nummer, self.dummy_domain),
+            "has_epost": bool(epost_in),
+            "telefon": telefon,
+            "telefon_e164": normalize_phone(telefon),
+            "adresse": repair_text(row.get("adresse", "")),
+            "postnummer_id": pn.id,
+            "kommune_id": kommune.id if kommune else None,
+        }
+
+    def _changes(self, m, data):
+        changes = []
+        for field in OVERWRITE_FIELDS:
+            if data[field] and getattr(m, field) != data[field]:
+                changes.append((field, getattr(m, field), data[field]))
+        if m.postnummer_id is None:
+            changes.append(("postnummer_id", None, data["postnummer_id"]))
+        if m.kommune_id is None and data["kommune_id"]:
+            changes.append(("kommune_id", None, data["kommune_id"]))
+        if not m.verve_kilde:
+            changes.append(("verve_kilde", m.verve_kilde, "self"))
+        return changes
+
+    def _flush(self, chunk):
+        parsed, matched = [], {}
+        for row in chunk:
+            self.stats["rader"] += 1
+            data = self.parse(row)
+            if data is None:
+                self.stats["ukjent_postnr"] += 1
+                continue
+            pk = self.index.match(data["epost"], data["telefon_e164"], has_epost=data["has_epost"])
+            if pk == "ny":
+                self.stats["duplikat"] += 1
+                continue
+            if pk is None:
+                self.index.add(data["epost"], data["telefon_e164"])
+            elif not self.update_existing:
+                self.stats["uendret"] += 1
+                continue
+            parsed.append((pk, data))
+            if pk is not None:
+                matched[pk] = None
+
+        existing = Medlem.objects.in_bulk(list(matched)) if matched else {}
+        to_create, to_update = [], {}
+        for pk, data in parsed:
+            if pk is None:
+                m = Medlem(
+                    fornavn=data["fornavn"], etternavn=data["etternavn"], epost=data["epost"],
+                    telefon=data["telefon"], adresse=data["adresse"], verve_kilde="self",
+                    postnummer_id=data["postnummer_id"], kommune_id=data["kommune_id"],
+                )
+                m.fill_derived()
+                to_create.append(m)
+                self.stats["opprettet"] += 1
+                if self.on_diff:
+                    self.on_diff("+", f"{m.fornavn} {m.etternavn} <{m.epost}>", [])
+                continue
+            m = existing.get(pk)
+            changes = self._changes(m, data) if m else []
+            if not changes:
+                self.stats["uendret"] += 1
+                continue
+            for field, _, new in changes:
+                setattr(m, field, new)
+            m.fill_derived()
+            to_update[m.pk] = m
+            self.stats["oppdatert"] += 1
+            if self.on_diff:
+                self.on_diff("~", f"{m.fornavn} {m.etternavn} <{m.epost}>", changes)
+
+        if not self.dry_run and (to_create or to_update):
+            with transaction.atomic():
+                Medlem.objects.bulk_create(to_create, batch_size=self.chunk_size)
+                Medlem.objects.bulk_update(to_update.values(), UPDATE_FIELDS, batch_size=500)
+        if self.on_chunk:
+            self.on_chunk(self.stats, self.elapsed)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from members.models import Medlem
+from members.phone import fill_phone_columns
+
+
+class Command(BaseCommand):
+    help = "Fyll Medlem.telefon_e164 og telefon_rev fra telefon (etter import/bulk-endringer)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--missing", action="store_true", help="Bare rader som mangler normalisert nummer")
+
+    def handle(self, *args, **opts):
+        changed = fill_phone_columns(Medlem, only_missing=opts["missing"])
+        unparsed = Medlem.objects.exclude(telefon="").filter(telefon_e164="").count()
+        self.stdout.write(self.style.SUCCESS(
+            f"Oppdaterte {changed} medlem(mer). {unparsed} nummer kunne ikke tolkes som E.164."
+        ))
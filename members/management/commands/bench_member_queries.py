@@ -0,0 +1,81 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from geo.models import Fylke
+from members.models import Lokallag, Medlem
+from members.queries import in_lag_i_fylke, in_lokallag
+
+
+class Command(BaseCommand):
+    help = (
+        "Sammenlign lokallag-filtre: JOIN + DISTINCT (gammelt) mot EXISTS (nytt). "
+        "Viser spørringer, tid og – på MySQL – om EXPLAIN bruker temp-tabell/filesort."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fylke", help="Fylke (id eller slug); default: fylket med flest lokallag-medlemmer")
+        parser.add_argument("--lokallag", type=int, help="Lokallag-id; default: største lag i fylket")
+        parser.add_argument("-n", type=int, default=20, help="Gjentakelser per spørring")
+        parser.add_argument("--page", type=int, default=30, help="Rader per side (LIMIT)")
+
+    def handle(self, *args, **opts):
+        fylke = self._fylke(opts.get("fylke"))
+        lag_id = opts.get("lokallag") or (
+            Lokallag.objects.filter(fylke=fylke)
+            .annotate(n=Count("medlemskap")).order_by("-n").values_list("id", flat=True).first()
+        )
+        if not lag_id:
+            raise CommandError("Fant ikke noe lokallag å måle mot.")
+        page = opts["page"]
+        base = Medlem.objects.select_related("kommune", "kommune__fylke").order_by("etternavn", "fornavn", "id")
+
+        cases = [
+            (f"lokallag {lag_id}",
+             base.filter(lokallag__id=lag_id).distinct(),
+             base.filter(in_lokallag(lag_id))),
+            (f"fylke {fylke.navn} (lag i fylket)",
+             base.filter(lokallag__fylke_id=fylke.id).distinct(),
+             base.filter(in_lag_i_fylke(fylke.id))),
+        ]
+        self.stdout.write(f"{connection.vendor}, n={opts['n']}, side={page}")
+        for label, old, new in cases:
+            self.stdout.write(self.style.NOTICE(label))
+            for name, qs in (("JOIN + DISTINCT", old), ("EXISTS", new)):
+                self._measure(name, qs, page, opts["n"])
+
+    def _fylke(self, value):
+        qs = Fylke.objects.all()
+        if value:
+            fylke = qs.filter(pk=int(value)).first() if str(value).isdigit() else qs.filter(slug=value).first()
+        else:
+            fylke = qs.annotate(n=Count("lokallag__medlemskap")).order_by("-n").first()
+        if not fylke:
+            raise CommandError("Fant ikke fylket.")
+        return fylke
+
+    def _measure(self, name, qs, page, n):
+        with CaptureQueriesContext(connection) as ctx:
+            t0 = time.perf_counter()
+            for _ in range(n):
+                total = qs.count()
+                rows = list(qs[:page])
+            dur = (time.perf_counter() - t0) / n
+        per_run = len(ctx.captured_queries) // n
+        self.stdout.write(
+            f"  {name:<16} {total} treff, {len(rows)} på side 1: {per_run} spørringer, {dur * 1000:.1f} ms"
+        )
+        notes = self._explain(qs[:page])
+        if notes:
+            self.stdout.write(f"  {'':<16} EXPLAIN: {notes}")
+
+    def _explain(self, qs):
+        if connection.vendor != "mysql":
+            return ""
+        extra = set()
+        for line in qs.explain().splitlines():
+            for flag in ("Using temporary", "Using filesort", "Using index", "FirstMatch", "LooseScan"):
+                if flag in line:
+                    extra.add(flag)
+        return ", ".join(sorted(extra)) or "ingen temp-tabell/filesort"
@@ -0,0 +1,82 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+from members.importer import CHUNK_SIZE, DUMMY_DOMAIN, REQUIRED, Importer, normalize_key, sniff_dialect
+
+
+class Command(BaseCommand):
+    help = (
+        "Importer medlemmer fra CSV (navn, epost, telefon, adresse, postnummer[, kommune]). "
+        "Eksisterende medlemmer matches på e-post (eller entydig telefon når e-post mangler) "
+        "og oppdateres; nye opprettes. Skriver i biter med bulk_create/bulk_update."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV-fil")
+        parser.add_argument("--encoding", default="utf-8-sig", help="Filens tegnsett (default: utf-8-sig)")
+        parser.add_argument("--delimiter", help="Skilletegn; default: gjettes (; eller ,)")
+        parser.add_argument("--chunk", type=int, default=CHUNK_SIZE, help="Rader per bit/transaksjon")
+        parser.add_argument("--dry-run", action="store_true", help="Vis endringene uten å lagre")
+        parser.add_argument("--no-update", action="store_true", help="Ikke oppdater eksisterende medlemmer")
+        parser.add_argument("--dummy-domain", default=DUMMY_DOMAIN, help="Domene for plassholder-e-post")
+        parser.add_argument("--diff-limit", type=int, default=50,
+                            help="Maks antall rader som vises ved --dry-run (0 = alle)")
+
+    def handle(self, *args, **opts):
+        self.shown = 0
+        self.show_diff = opts["dry_run"] or opts["verbosity"] > 1
+        self.diff_limit = opts["diff_limit"]
+        try:
+            f = open(opts["path"], newline="", encoding=opts["encoding"], errors="replace")
+        except OSError as e:
+            raise CommandError(f"Kan ikke åpne {opts['path']}: {e}")
+
+        with f:
+            if opts["delimiter"]:
+                dialect = type("Dialekt", (csv.excel,), {"delimiter": opts["delimiter"]})
+            else:
+                dialect = sniff_dialect(f.read(4096))
+                f.seek(0)
+            reader = csv.DictReader(f, dialect=dialect)
+            if not reader.fieldnames:
+                raise CommandError("Fant ingen header i CSV.")
+            fields = {normalize_key(k): k for k in reader.fieldnames if k is not None}
+            missing = [r for r in REQUIRED if r not in fields]
+            if missing:
+                raise CommandError(
+                    f"Mangler påkrevde kolonner: {', '.join(missing)} (fant: {', '.join(reader.fieldnames)})"
+                )
+            rows = ({key: (row.get(orig) or "").strip() for key, orig in fields.items()} for row in reader)
+
+            importer = Importer(
+                update_existing=not opts["no_update"],
+                dry_run=opts["dry_run"],
+                chunk_size=opts["chunk"],
+                dummy_domain=opts["dummy_domain"],
+                on_diff=self._diff if self.show_diff else None,
+                on_chunk=self._progress if opts["verbosity"] > 0 else None,
+            )
+            stats = importer.run(rows)
+
+        elapsed = importer.elapsed
+        rate = stats["rader"] / elapsed if elapsed else 0
+        prefix = "Tørrkjøring – ingenting lagret. " if opts["dry_run"] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}Rader: {stats['rader']}, opprettet: {stats['opprettet']}, oppdatert: {stats['oppdatert']}, "
+            f"uendret: {stats['uendret']}, duplikat i fila: {stats['duplikat']}, "
+            f"ukjent postnr: {stats['ukjent_postnr']}. {elapsed:.1f} s ({rate:.0f} rader/s)"
+        ))
+
+    def _diff(self, kind, label, changes):
+        self.shown += 1
+        if self.diff_limit and self.shown > self.diff_limit:
+            if self.shown == self.diff_limit + 1:
+                self.stdout.write("  … (flere endringer, se --diff-limit)")
+            return
+        self.stdout.write(f"{kind} {label}")
+        for field, old, new in changes:
+            self.stdout.write(f"    {field}: {old!r} → {new!r}")
+
+    def _progress(self, stats, elapsed):
+        rate = stats["rader"] / elapsed if elapsed else 0
+        self.stdout.write(f"  {stats['rader']} rader, {rate:.0f} rader/s")
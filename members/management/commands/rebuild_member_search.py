@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from members.models import Medlem
+from members.search import refresh_search_text
+
+
+class Command(BaseCommand):
+    help = "Regn ut Medlem.sok (søkeindeksen) på nytt – etter import eller andre bulk-endringer"
+
+    def handle(self, *args, **opts):
+        changed = refresh_search_text(Medlem.objects.all())
+        self.stdout.write(self.style.SUCCESS(f"Oppdaterte søketekst for {changed} medlem(mer)."))
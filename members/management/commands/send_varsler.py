@@ -0,0 +1,69 @@
+import signal
+import sys
+import time
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from mailings.services import sender_id
+from members.notifications import (
+    DIGEST_MINUTES, DIGEST_TYPES, claim_varsler, deliver, deliver_digest, release_varsler,
+)
+
+BATCH_SIZE = int(getattr(settings, "VARSEL_BATCH_SIZE", 200))
+POLL_SECONDS = float(getattr(settings, "VARSEL_POLL_SECONDS", 5))
+
+
+class Command(BaseCommand):
+    help = (
+        "Sender varsler fra køen (members.Varsel), f.eks. om nye selvregistreringer. "
+        "Feilede varsler prøves igjen med økende ventetid. Med VARSEL_DIGEST_MINUTES > 0 "
+        "får hver mottaker ett sammendrag per vindu."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true",
+                            help="Fortsett å vente på nye varsler (for systemd) i stedet for å avslutte når køen er tom")
+        parser.add_argument("--batch", type=int, default=BATCH_SIZE, help="Varsler per SMTP-tilkobling (og per sammendrag)")
+
+    def handle(self, *args, **opts):
+        me = sender_id()
+        batch_size = max(1, opts["batch"])
+        ok = failed = 0
+        # SIGTERM (systemd/cron-timeout) → samme opprydding som Ctrl-C
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+        try:
+            while True:
+                batch = claim_varsler(me, batch_size)
+                if not batch:
+                    if not opts["loop"]:
+                        break
+                    time.sleep(POLL_SECONDS)
+                    continue
+                # én SMTP-tilkobling per batch
+                connection = get_connection()
+                try:
+                    try:
+                        connection.open()
+                    except Exception:
+                        pass  # feilen registreres på hvert varsel når sendingen prøves
+                    if DIGEST_MINUTES > 0:
+                        digest = [v for v in batch if v.type in DIGEST_TYPES]
+                        batch = [v for v in batch if v.type not in DIGEST_TYPES]
+                        if digest:
+                            sent, feilet = deliver_digest(digest, connection=connection)
+                            ok, failed = ok + sent, failed + feilet
+                    for varsel in batch:
+                        if deliver(varsel, connection=connection):
+                            ok += 1
+                        else:
+                            failed += 1
+                            # en død tilkobling skal ikke felle resten av batchen
+                            connection.close()
+                finally:
+                    connection.close()
+                if int(opts.get("verbosity", 1)) >= 2:
+                    self.stdout.write(f"  {ok} sendt, {failed} feil så langt")
+        finally:
+            release_varsler(me)
+
+        self.stdout.write(self.style.SUCCESS(f"Ferdig: {ok} varsler sendt, {failed} feilet (prøves igjen senere)."))
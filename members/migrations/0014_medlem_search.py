@@ -0,0 +1,47 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:26
+
+import members.search
+from django.db import migrations
+
+
+def fill_search_text(apps, schema_editor):
+    Medlem = apps.get_model("members", "Medlem")
+    batch = []
+    for m in Medlem.objects.only("id", "fornavn", "etternavn", "epost", "adresse", "telefon").iterator(chunk_size=2000):
+        m.sok = members.search.medlem_search_text(m)
+        batch.append(m)
+        if len(batch) >= 2000:
+            Medlem.objects.bulk_update(batch, ["sok"])
+            batch = []
+    if batch:
+        Medlem.objects.bulk_update(batch, ["sok"])
+
+
+def add_fulltext(apps, schema_editor):
+    # FULLTEXT med ngram-parser finnes bare på MySQL; andre baser søker med LIKE
+    if schema_editor.connection.vendor == "mysql":
+        schema_editor.execute(
+            "CREATE FULLTEXT INDEX members_medlem_sok_ft ON members_medlem (sok) WITH PARSER ngram"
+        )
+
+
+def drop_fulltext(apps, schema_editor):
+    if schema_editor.connection.vendor == "mysql":
+        schema_editor.execute("DROP INDEX members_medlem_sok_ft ON members_medlem")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0013_medlem_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medlem',
+            name='sok',
+            field=members.search.SearchTextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(add_fulltext, drop_fulltext),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:27
+
+from django.db import migrations, models
+
+from members.phone import fill_phone_columns
+
+
+def forwards(apps, schema_editor):
+    fill_phone_columns(apps.get_model("members", "Medlem"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0014_medlem_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medlem',
+            name='telefon_e164',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=16, verbose_name='Telefon (E.164)'),
+        ),
+        migrations.AddField(
+            model_name='medlem',
+            name='telefon_rev',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=20),
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0015_medlem_phone_normalized'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medlemskap',
+            index=models.Index(fields=['lokallag', 'medlem'], name='medlemskap_lag_medlem_idx'),
+        ),
+    ]
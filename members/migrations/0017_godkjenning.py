@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:41
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0016_medlemskap_lag_medlem_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Godkjenning',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('godkjent', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('kilde', models.CharField(choices=[('admin', 'Admin'), ('liste', 'Venteliste'), ('enkelt', 'Enkeltgodkjenning')], max_length=10)),
+                ('godkjent_av', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('medlem', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='godkjenninger', to='members.medlem')),
+            ],
+            options={
+                'verbose_name': 'Godkjenning',
+                'verbose_name_plural': 'Godkjenninger',
+                'ordering': ['-godkjent'],
+            },
+        ),
+    ]
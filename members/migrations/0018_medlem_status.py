@@ -0,0 +1,56 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Q, Subquery
+
+CHUNK = 5000
+
+
+def forwards(apps, schema_editor):
+    Medlem = apps.get_model("members", "Medlem")
+    Godkjenning = apps.get_model("members", "Godkjenning")
+    # alle starter som 'approved' (default); pending settes i id-intervaller så hver UPDATE er kort
+    pending = Q(verve_kilde="self", verver_user__isnull=True) & (Q(verver_navn__isnull=True) | Q(verver_navn=""))
+    top = Medlem.objects.aggregate(m=Max("id"))["m"] or 0
+    for lo in range(0, top + 1, CHUNK):
+        Medlem.objects.filter(id__gte=lo, id__lt=lo + CHUNK).filter(pending).update(status="pending")
+    # godkjenninger registrert før kolonnene fantes (members 0017)
+    siste = Godkjenning.objects.filter(medlem_id=OuterRef("pk")).order_by("-godkjent", "-id")
+    Medlem.objects.filter(approved_at__isnull=True, godkjenninger__isnull=False).update(
+        approved_at=Subquery(siste.values("godkjent")[:1]),
+        approved_by=Subquery(siste.values("godkjent_av")[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geo', '0008_geo_import_history'),
+        ('members', '0017_godkjenning'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medlem',
+            name='approved_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='medlem',
+            name='approved_by',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='approved_members', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='medlem',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Til godkjenning'), ('approved', 'Godkjent')], default='approved', editable=False, max_length=10),
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='medlem',
+            index=models.Index(fields=['status', 'registrert'], name='medlem_status_reg_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:45
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0018_medlem_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Varsel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('selvregistrering', 'Ny selvregistrering')], max_length=20)),
+                ('opprettet', models.DateTimeField(default=django.utils.timezone.now)),
+                ('neste_forsok', models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True, verbose_name='Neste forsøk')),
+                ('forsok', models.PositiveSmallIntegerField(default=0, verbose_name='Forsøk')),
+                ('sendt', models.DateTimeField(blank=True, null=True)),
+                ('feil', models.TextField(blank=True, verbose_name='Siste feil')),
+                ('claimed_by', models.CharField(blank=True, max_length=100)),
+                ('lease_until', models.DateTimeField(blank=True, null=True)),
+                ('medlem', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='varsler', to='members.medlem')),
+            ],
+            options={
+                'verbose_name': 'Varsel',
+                'verbose_name_plural': 'Varsler',
+                'ordering': ['-opprettet'],
+                'indexes': [models.Index(fields=['neste_forsok'], name='varsel_neste_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:48
+
+import django.utils.timezone
+from django.db import migrations, models
+
+from members.routing import rebuild_routes
+
+
+def forwards(apps, schema_editor):
+    rebuild_routes(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geo', '0008_geo_import_history'),
+        ('members', '0019_varsel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Kontaktrute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('niva', models.CharField(choices=[('lokallag', 'Lokallag'), ('kommune', 'Kommune'), ('fylke', 'Fylke')], max_length=10, verbose_name='Nivå')),
+                ('ref_id', models.PositiveBigIntegerField(verbose_name='Id')),
+                ('epost', models.EmailField(max_length=254)),
+                ('kilde', models.CharField(choices=[('lokallag', 'Lokallag'), ('fylkeslag', 'Fylkeslag'), ('fylke', 'Fylke')], max_length=10)),
+                ('oppdatert', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Kontaktrute',
+                'verbose_name_plural': 'Kontaktruter',
+                'ordering': ['niva', 'ref_id'],
+                'constraints': [models.UniqueConstraint(fields=('niva', 'ref_id'), name='uniq_kontaktrute')],
+            },
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,12 @@
 from django.db import models
 from django.conf import settings
 from geo.models import Kommune, Postnummer, Fylke
+from geo import resolver as geo_resolver
 from django.urls import reverse
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from .phone import normalize_phone, reversed_digits
+from .search import SearchTextField, medlem_search_text
 
 FYLKESLAG_ROLLER = (
     ("leder", "Leder"),
@@ -16,11 +19,7 @@ VERVE_KILDE_CHOICES = (
     ("verver", "Vervet av"),
 )
 
-# members/models.py (tillegg)
 STATUS_CHOICES = (("pending","Til godkjenning"), ("approved","Godkjent"))
-status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="approved")
-approved_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name="approved_members")
-approved_at = models.DateTimeField(null=True, blank=True)
 
 
 class Lokallag(models.Model):
@@ -75,6 +74,9 @@ class Medlem(models.Model):
     epost       = models.EmailField(blank=True)  # valgfritt
     adresse     = models.CharField(max_length=200, blank=True)
     telefon     = models.CharField(max_length=20, db_index=True)  # PÅKREVD i form (ikke unique)
+    # avledet fra telefon i save() – se members/phone.py
+    telefon_e164 = models.CharField("Telefon (E.164)", max_length=16, blank=True, db_index=True, editable=False)
+    telefon_rev  = models.CharField(max_length=20, blank=True, db_index=True, editable=False)
     fodselsdato = models.DateField(null=True, blank=True)
 
     postnummer  = models.ForeignKey(Postnummer, on_delete=models.PROTECT, null=True, blank=True)
@@ -96,10 +98,22 @@ class Medlem(models.Model):
 
     registrert  = models.DateTimeField(auto_now_add=True)
 
+    # godkjenning: status avledes i fill_derived() (selvregistrert uten verver = pending);
+    # approved_by/approved_at settes av members/approval.py
+    status      = models.CharField(max_length=10, choices=STATUS_CHOICES, default="approved", editable=False)
+    approved_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL,
+                                    related_name="approved_members", editable=False)
+    approved_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # denormalisert søketekst (FULLTEXT på MySQL) – se members/search.py
+    sok         = SearchTextField(blank=True, default="", editable=False)
+
     class Meta:
         ordering = ["etternavn", "fornavn"]
         verbose_name = "Medlem"
         verbose_name_plural = "Medlemmer"
+        # ventelista og antall til godkjenning (status='pending') slås opp i indeksen
+        indexes = [models.Index(fields=["status", "registrert"], name="medlem_status_reg_idx")]
         permissions = [
             ("approve_member", "Kan godkjenne selvregistreringer"),
         ]
@@ -108,16 +122,34 @@ class Medlem(models.Model):
 
     def save(self, *args, **kwargs):
         """
-        Sett kommune automatisk fra postnummer (dersom primærkobling finnes).
+        Sett kommune automatisk fra postnummer (primærkommunen, via geo.resolver).
         """
-        if not self.kommune and self.postnummer:
-            pk_rel = getattr(self.postnummer, "kommuner", None)  # forventer relasjon Postnummer->PostnummerKommune som 'kommuner'
-            if pk_rel:
-                pk = pk_rel.filter(primar=True).select_related("kommune").first()
-                if pk:
-                    self.kommune = pk.kommune
+        if self.kommune_id is None and self.postnummer_id:
+            pn = geo_resolver.resolve_id(self.postnummer_id)
+            if pn and pn.kommune:
+                self.kommune_id = pn.kommune.id
+        # avledede kolonner (søk og telefon) følger alltid med, også ved update_fields
+        self.fill_derived()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, *self.DERIVED_FIELDS}
         super().save(*args, **kwargs)
 
+    DERIVED_FIELDS = ("sok", "telefon_e164", "telefon_rev", "status")
+
+    @property
+    def is_pending(self):
+        """Selvregistrering som ingen har godkjent – samme regel som backfillen i migrasjon 0018
+        (verver_navn NULL eller "", som den gamle PENDING_Q)."""
+        return self.verve_kilde == "self" and self.verver_user_id is None and not self.verver_navn
+
+    def fill_derived(self):
+        """Sett DERIVED_FIELDS – også for bulk_create/bulk_update, som ikke kaller save()."""
+        self.sok = medlem_search_text(self)
+        self.telefon_e164 = normalize_phone(self.telefon)
+        self.telefon_rev = reversed_digits(self.telefon)
+        self.status = "pending" if self.is_pending else "approved"
+
 
 class Medlemskap(models.Model):
     medlem    = models.ForeignKey(Medlem,   on_delete=models.CASCADE, related_name="medlemskap")
@@ -127,6 +159,8 @@ class Medlemskap(models.Model):
 
     class Meta:
         unique_together = [("medlem", "lokallag")]
+        # dekker EXISTS-oppslag fra lokallag-siden (members.queries.in_lokallag)
+        indexes = [models.Index(fields=["lokallag", "medlem"], name="medlemskap_lag_medlem_idx")]
         verbose_name = "Medlemskap"
         verbose_name_plural = "Medlemskap"
 
@@ -138,6 +172,59 @@ class PendingMedlem(Medlem):
         proxy = True
         verbose_name = "Selvregistrering til godkjenning"
         verbose_name_plural = "Selvregistreringer til godkjenning"
+
+
+class Godkjenning(models.Model):
+    """Revisjonsspor: hvem godkjente en selvregistrering, og når (members/approval.py)."""
+    KILDER = (
+        ("admin", "Admin"),
+        ("liste", "Venteliste"),
+        ("enkelt", "Enkeltgodkjenning"),
+    )
+    medlem      = models.ForeignKey(Medlem, on_delete=models.CASCADE, related_name="godkjenninger")
+    godkjent_av = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, on_delete=models.SET_NULL, related_name="+")
+    godkjent    = models.DateTimeField(default=timezone.now, db_index=True)
+    kilde       = models.CharField(max_length=10, choices=KILDER)
+
+    class Meta:
+        ordering = ["-godkjent"]
+        verbose_name = "Godkjenning"
+        verbose_name_plural = "Godkjenninger"
+
+    def __str__(self):
+        return f"{self.medlem_id} godkjent {self.godkjent:%Y-%m-%d %H:%M}"
+
+
+class Varsel(models.Model):
+    """
+    Jobbkø for varsel-e-post. Raden skrives i samme transaksjon som det den
+    varsler om, og sendes av send_varsler (members/notifications.py), så
+    SMTP-ventetid aldri havner i en web-forespørsel.
+    neste_forsok = NULL betyr ferdig (sendt eller gitt opp).
+    """
+    TYPER = (
+        ("selvregistrering", "Ny selvregistrering"),
+    )
+    type         = models.CharField(max_length=20, choices=TYPER)
+    medlem       = models.ForeignKey(Medlem, on_delete=models.CASCADE, related_name="varsler")
+    opprettet    = models.DateTimeField(default=timezone.now)
+    neste_forsok = models.DateTimeField("Neste forsøk", null=True, blank=True, default=timezone.now)
+    forsok       = models.PositiveSmallIntegerField("Forsøk", default=0)
+    sendt        = models.DateTimeField(null=True, blank=True)
+    feil         = models.TextField("Siste feil", blank=True)
+    # lease: hvilken send_varsler-prosess som har raden nå (utløpt = ledig igjen)
+    claimed_by   = models.CharField(max_length=100, blank=True)
+    lease_until  = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-opprettet"]
+        verbose_name = "Varsel"
+        verbose_name_plural = "Varsler"
+        indexes = [models.Index(fields=["neste_forsok"], name="varsel_neste_idx")]
+
+    def __str__(self):
+        tilstand = "sendt" if self.sendt else ("i kø" if self.neste_forsok else "feilet")
+        return f"{self.get_type_display()} {self.medlem_id} ({tilstand})"
 class Fylkeslagsmedlemskap(models.Model):
     medlem     = models.ForeignKey("Medlem", on_delete=models.CASCADE)
     fylkeslag  = models.ForeignKey(Fylkeslag, on_delete=models.CASCADE)
@@ -208,3 +295,36 @@ class SentralstyreMedlemskap(models.Model):
     def __str__(self):
         til = f"– {self.sluttdato}" if self.sluttdato else "–"
         return f"{self.medlem} • {self.rolle.navn} ({self.startdato} {til})"
+
+
+class Kontaktrute(models.Model):
+    """
+    Ferdig utregnet varslingsadresse per lokallag, kommune og fylke
+    (members/routing.py). Bygges på nytt når kontaktfeltene endres.
+    """
+    NIVAER = (
+        ("lokallag", "Lokallag"),
+        ("kommune", "Kommune"),
+        ("fylke", "Fylke"),
+    )
+    KILDER = (
+        ("lokallag", "Lokallag"),
+        ("fylkeslag", "Fylkeslag"),
+        ("fylke", "Fylke"),
+    )
+    niva      = models.CharField("Nivå", max_length=10, choices=NIVAER)
+    ref_id    = models.PositiveBigIntegerField("Id")
+    epost     = models.EmailField()
+    kilde     = models.CharField(max_length=10, choices=KILDER)
+    oppdatert = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["niva", "ref_id"]
+        verbose_name = "Kontaktrute"
+        verbose_name_plural = "Kontaktruter"
+        constraints = [
+            models.UniqueConstraint(fields=["niva", "ref_id"], name="uniq_kontaktrute")
+        ]
+
+    def __str__(self):
+        return f"{self.niva} {self.ref_id} → {self.epost} ({self.kilde})"
@@ -1,101 +1,202 @@
 # members/notifications.py
-from typing import Set
+"""
+Varsel-e-post. Views legger varsler i kø (members.Varsel) med
+queue_self_registration() i samme transaksjon som registreringen;
+send_varsler henter dem med claim_varsler() og sender med deliver().
+
+Med VARSEL_DIGEST_MINUTES > 0 samles selvregistreringene i faste vinduer:
+alle varsler i samme vindu forfaller samtidig, og deliver_digest() sender
+ett sammendrag per mottakeradresse i stedet for én e-post per registrering.
+
+Mottakerne slås opp i kontaktrutene (members/routing.py), som leses med
+én spørring og holdes i prosessen.
+"""
 import logging
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
 from django.core.mail import send_mail
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from django.utils import timezone
 
-from members.models import Fylkeslag  # <- NYTT: bruk Fylkeslag for mellomledd
+from members.models import Lokallag, Varsel
+from members.routing import contact_routes
 
 logger = logging.getLogger(__name__)
 
-def _first_nonempty(*vals):
-    for v in vals:
-        v = (v or "").strip()
-        if v:
-            return v
-    return None
-
-def _get_fylke_from_obj(obj):
-    # Prøv direkte felt
-    if getattr(obj, "fylke_id", None):
-        return obj.fylke
-    # Prøv via kommune
-    if getattr(obj, "kommune_id", None) and getattr(obj, "kommune", None):
-        return obj.kommune.fylke
-    return None
-
-def notify_new_self_registration(obj) -> int:
-    """
-    Bygger mottakerliste:
-      1) Lokallag (contact_email/epost)
-      2) Fylkeslag (for obj sitt fylke)  ← NY PRIORITET
-      3) geo.Fylke.contact_email
-      4) DEFAULT_FROM_EMAIL
-    """
-    recipients: Set[str] = set()
-
-    # 1) Lokallag først
-    lag_qs = getattr(obj, "lokallag", None)
-    if lag_qs:
-        for lag in lag_qs.all():
-            email = _first_nonempty(
-                getattr(lag, "contact_email", None),
-                getattr(lag, "epost", None),
-            )
-            if email:
-                recipients.add(email)
-
-    # 2) Hvis ingen lokallag: forsøk Fylkeslag for samme fylke
-    if not recipients:
-        fylke = _get_fylke_from_obj(obj)
-        if fylke:
-            fl = (Fylkeslag.objects
-                  .filter(fylke_id=fylke.id)
-                  .order_by("id")
-                  .first())
-            if fl:
-                email = _first_nonempty(
-                    getattr(fl, "contact_email", None),
-                    getattr(fl, "epost", None),
-                )
-                if email:
-                    recipients.add(email)
-
-    # 3) Hvis fortsatt tomt: geo.Fylke som fallback
-    if not recipients:
-        fylke = _get_fylke_from_obj(obj)
-        if fylke:
-            email = _first_nonempty(getattr(fylke, "contact_email", None))
-            if email:
-                recipients.add(email)
-
-    # 4) Siste utvei
-    if not recipients:
-        recipients.add(getattr(settings, "DEFAULT_FROM_EMAIL", "bn@zc.no"))
-
-    recipients = sorted(recipients)
-    logger.info("notify_new_self_registration: mottakere=%s", recipients)
+MAX_ATTEMPTS = int(getattr(settings, "VARSEL_MAX_ATTEMPTS", 8))
+RETRY_BASE_SECONDS = int(getattr(settings, "VARSEL_RETRY_BASE_SECONDS", 60))
+RETRY_MAX_SECONDS = int(getattr(settings, "VARSEL_RETRY_MAX_SECONDS", 3600))
+LEASE_SECONDS = int(getattr(settings, "VARSEL_LEASE_SECONDS", 300))
+DIGEST_MINUTES = int(getattr(settings, "VARSEL_DIGEST_MINUTES", 0))
+
+FOOTER = "Logg inn på fylkessiden for å tildele lokallag og godkjenne det nye medlemmet."
+
+
+# --- mottakere ---
+
+def _recipients(lag, obj):
+    return contact_routes().recipients([l.id for l in lag], obj.kommune_id)
 
-    fullnavn = f"{getattr(obj, 'fornavn', '')} {getattr(obj, 'etternavn', '')}".strip()
+
+def _registration(obj):
+    """(lokallag, linjer) for én registrering – lokallagene hentes én gang."""
+    lag = list(obj.lokallag.all())
     linjer = [
-        f"Navn: {fullnavn}",
-        f"Telefon: {getattr(obj, 'telefon', '-') or '-'}",
-        f"E-post: {getattr(obj, 'epost', '-') or '-'}",
+        f"Navn: {obj.fornavn} {obj.etternavn}".rstrip(),
+        f"Telefon: {obj.telefon or '-'}",
+        f"E-post: {obj.epost or '-'}",
     ]
-    if getattr(obj, "kommune", None):
+    if obj.kommune_id:
         linjer.append(f"Kommune: {obj.kommune.navn}")
-    if lag_qs and lag_qs.exists():
-        linjer.append("Valgte lokallag: " + ", ".join(l.navn for l in lag_qs.all()))
-    else:
-        linjer.append("Valgte lokallag: (ingen)")
+    linjer.append("Valgte lokallag: " + (", ".join(l.navn for l in lag) or "(ingen)"))
+    return lag, linjer
+
 
-    body = "Ny selv-registrering i Konservativt:\n\n" + "\n".join(linjer) + "\n\n" \
-           "Logg inn på fylkessiden for å tildele lokallag og godkjenne det nye medlemmegt."
+def notify_new_self_registration(obj, connection=None) -> int:
+    """Én e-post om én selvregistrering (uten sammendrag)."""
+    lag, linjer = _registration(obj)
+    recipients = _recipients(lag, obj)
+    logger.info("notify_new_self_registration: mottakere=%s", recipients)
 
+    body = "Ny selv-registrering i Konservativt:\n\n" + "\n".join(linjer) + "\n\n" + FOOTER
     return send_mail(
         subject="Ny selv-registrering",
         message=body,
         from_email=getattr(settings, "DEFAULT_FROM_EMAIL", None),
         recipient_list=recipients,
         fail_silently=False,
+        connection=connection,
     )
+
+
+# --- jobbkø (members.Varsel) ---
+
+SENDERS = {
+    "selvregistrering": notify_new_self_registration,
+}
+DIGEST_TYPES = {"selvregistrering"}
+
+
+def digest_due(now):
+    """Slutten av sammendragsvinduet `now` ligger i (vinduene følger klokka, f.eks. hvert 30. minutt)."""
+    window = DIGEST_MINUTES * 60
+    return datetime.fromtimestamp(math.ceil(now.timestamp() / window) * window, tz=dt_timezone.utc)
+
+
+def queue_self_registration(obj):
+    """Legg varsel om ny selvregistrering i kø (sendes når transaksjonen er committed)."""
+    now = timezone.now()
+    due = digest_due(now) if DIGEST_MINUTES > 0 else now
+    return Varsel.objects.create(type="selvregistrering", medlem=obj, opprettet=now, neste_forsok=due)
+
+
+def retry_delay(attempts):
+    """Eksponentiell ventetid før neste forsøk på et varsel."""
+    return timedelta(seconds=min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** max(0, attempts - 1)))
+
+
+def claim_varsler(claimed_by, limit, *, lease_seconds=LEASE_SECONDS):
+    """
+    Reserver opptil `limit` forfalte varsler for `claimed_by` – samme
+    lease-mønster som mailings.services.claim_batch (SKIP LOCKED, så flere
+    send_varsler kan kjøre samtidig).
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(Varsel.objects
+                   .select_for_update(skip_locked=True)
+                   .filter(neste_forsok__lte=now)
+                   .filter(Q(lease_until__isnull=True) | Q(lease_until__lt=now))
+                   .order_by("neste_forsok", "id")
+                   .values_list("id", flat=True)[:limit])
+        if not ids:
+            return []
+        Varsel.objects.filter(id__in=ids).update(
+            claimed_by=claimed_by, lease_until=now + timedelta(seconds=lease_seconds),
+        )
+    return list(Varsel.objects
+                .filter(id__in=ids, claimed_by=claimed_by)
+                .select_related("medlem__kommune")
+                .prefetch_related(Prefetch("medlem__lokallag", queryset=Lokallag.objects.order_by("navn")))
+                .order_by("id"))
+
+
+def _finish(varsel, error=None):
+    """Oppdater raden etter et forsøk (lagres av kalleren)."""
+    varsel.forsok += 1
+    varsel.claimed_by, varsel.lease_until = "", None
+    if error is None:
+        varsel.sendt, varsel.neste_forsok, varsel.feil = timezone.now(), None, ""
+        return True
+    logger.warning("Varsel %s feilet (forsøk %s): %s", varsel.id, varsel.forsok, error)
+    varsel.feil = str(error)[:2000]
+    # gitt opp etter MAX_ATTEMPTS: neste_forsok = NULL, kan sendes på nytt fra admin
+    varsel.neste_forsok = (timezone.now() + retry_delay(varsel.forsok)
+                           if varsel.forsok < MAX_ATTEMPTS else None)
+    return False
+
+
+FINISH_FIELDS = ["forsok", "sendt", "neste_forsok", "feil", "claimed_by", "lease_until"]
+
+
+def deliver(varsel, connection=None):
+    """Send ett varsel og oppdater raden. Gir True hvis det ble sendt."""
+    try:
+        SENDERS[varsel.type](varsel.medlem, connection=connection)
+    except Exception as e:
+        ok = _finish(varsel, e)
+    else:
+        ok = _finish(varsel)
+    varsel.save(update_fields=FINISH_FIELDS)
+    return ok
+
+
+def deliver_digest(varsler, connection=None):
+    """
+    Ett sammendrag per mottakeradresse for selvregistreringene i `varsler`.
+    Et varsel er sendt når alle mottakerne har fått sitt sammendrag; feiler
+    én mottaker, prøves varselet igjen senere (de andre mottakerne kan da få
+    det to ganger). Gir (sendt, feilet) i antall varsler.
+    """
+    groups = defaultdict(list)    # mottaker -> [(varsel, linjer)]
+    for v in varsler:
+        lag, linjer = _registration(v.medlem)
+        for email in _recipients(lag, v.medlem):
+            groups[email].append((v, linjer))
+
+    errors = {}
+    for email, items in sorted(groups.items()):
+        n = len(items)
+        subject = "Ny selv-registrering" if n == 1 else f"{n} nye selv-registreringer"
+        body = (f"Nye selv-registreringer i Konservativt ({n}):\n\n"
+                + "\n\n".join("\n".join(linjer) for _, linjer in items)
+                + "\n\n" + FOOTER)
+        try:
+            send_mail(
+                subject=subject,
+                message=body,
+                from_email=getattr(settings, "DEFAULT_FROM_EMAIL", None),
+                recipient_list=[email],
+                fail_silently=False,
+                connection=connection,
+            )
+            logger.info("Sammendrag sendt til %s (%s registreringer)", email, n)
+        except Exception as e:
+            for v, _ in items:
+                errors.setdefault(v.id, f"{email}: {e}")
+            # en død tilkobling skal ikke felle resten av mottakerne
+            if connection is not None:
+                connection.close()
+
+    ok = sum(_finish(v, errors.get(v.id)) for v in varsler)
+    Varsel.objects.bulk_update(varsler, FINISH_FIELDS)
+    return ok, len(varsler) - ok
+
+
+def release_varsler(claimed_by):
+    """Slipp leasen på varsler vi holder, men ikke har forsøkt (f.eks. ved Ctrl-C)."""
+    return Varsel.objects.filter(claimed_by=claimed_by).update(claimed_by="", lease_until=None)
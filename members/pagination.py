@@ -0,0 +1,140 @@
+# members/pagination.py
+"""
+Paginering for medlemslister.
+
+keyset_page(): cursor-paginering på (etternavn, fornavn, id). I stedet for
+OFFSET n (som må lese og kaste n rader) hentes «rader etter siste viste»
+med et WHERE på sorteringsnøkkelen, så side 1000 er like billig som side 1.
+Cursorene er opake (base64 av nøkkelverdiene) og brukes som ?after= / ?before=.
+
+CachedCountPaginator / cached_count(): totalantallet caches en kort stund
+per filter (MEMBERS_COUNT_CACHE_SECONDS), så ikke hver sidevisning kjører
+COUNT(*) over hele registeret.
+"""
+import base64
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+ORDERING = ("etternavn", "fornavn", "id")
+COUNT_CACHE_SECONDS = int(getattr(settings, "MEMBERS_COUNT_CACHE_SECONDS", 60))
+
+
+def encode_cursor(obj, fields=ORDERING):
+    raw = json.dumps([getattr(obj, f) for f in fields], ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token, fields=ORDERING):
+    """Nøkkelverdiene fra en cursor, eller None hvis den er ugyldig."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw.decode("utf-8"))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(values, list) or len(values) != len(fields):
+        return None
+    # navnefeltene er tekst (NOT NULL – None gir feil i after_q), siste felt er id
+    *names, pk = values
+    if not all(isinstance(v, str) for v in names):
+        return None
+    if not isinstance(pk, int) or isinstance(pk, bool):
+        return None
+    return values
+
+
+def after_q(fields, values, op):
+    """(a, b, c) > (x, y, z) som OR av likhet-prefiks + streng ulikhet."""
+    q = Q()
+    for i, field in enumerate(fields):
+        cond = {f: v for f, v in zip(fields[:i], values[:i])}
+        cond[f"{field}__{op}"] = values[i]
+        q |= Q(**cond)
+    return q
+
+
+class KeysetPage:
+    """Én side fra keyset_page(); ligner nok på Page til å brukes i maler."""
+
+    def __init__(self, object_list, paginator, *, has_next, has_previous, fields=ORDERING):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.fields = fields
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        return encode_cursor(self.object_list[-1], self.fields) if self._has_next else ""
+
+    @property
+    def previous_cursor(self):
+        return encode_cursor(self.object_list[0], self.fields) if self._has_previous else ""
+
+
+def keyset_page(qs, per_page, *, after=None, before=None, paginator=None, fields=ORDERING):
+    """
+    Hent én side av `qs` sortert på `fields` (stigende). `after`/`before` er
+    cursor-strenger; uten noen av dem gis første side.
+    """
+    after_values = decode_cursor(after, fields)
+    before_values = None if after_values else decode_cursor(before, fields)
+
+    if before_values:
+        rows = list(
+            qs.filter(after_q(fields, before_values, "lt"))
+            .order_by(*(f"-{f}" for f in fields))[:per_page + 1]
+        )
+        has_previous = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        # tom side (cursor fra en utdatert lenke): ingen rad å lage cursor fra
+        has_next = bool(rows)
+    else:
+        if after_values:
+            qs = qs.filter(after_q(fields, after_values, "gt"))
+        rows = list(qs.order_by(*fields)[:per_page + 1])
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_previous = after_values is not None and bool(rows)
+    return KeysetPage(rows, paginator, has_next=has_next, has_previous=has_previous, fields=fields)
+
+
+def cached_count(qs, timeout=None):
+    """COUNT(*) for `qs`, cachet per SQL i `timeout` sekunder."""
+    sql, params = qs.order_by().query.sql_with_params()
+    key = "members:count:" + hashlib.md5(repr((sql, params)).encode("utf-8")).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = qs.count()
+        cache.set(key, count, COUNT_CACHE_SECONDS if timeout is None else timeout)
+    return count
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator med cachet totalantall (brukes i medlemslista og admin)."""
+
+    @cached_property
+    def count(self):
+        return cached_count(self.object_list)
@@ -0,0 +1,97 @@
+# members/phone.py
+"""
+Normalisering av telefonnumre.
+
+Medlem.telefon lagres slik det ble skrevet inn ("+47 900 00 000", "90000000",
+"0047-900..."). Medlem.save() fyller i tillegg:
+
+- telefon_e164: E.164-form ("+4790000000"), tom hvis nummeret ikke lar seg tolke
+- telefon_rev:  sifrene baklengs ("0000000974"), slik at «slutter på 000 00»
+  blir et indeksert prefiks-oppslag (telefon_rev LIKE '00000%')
+
+phone_q() bygger filteret som brukes i medlemslista og admin-søket.
+"""
+import re
+
+from django.db.models import Q
+
+DEFAULT_COUNTRY_CODE = "47"
+NATIONAL_LENGTH = 8  # norske numre
+_NON_DIGITS = re.compile(r"\D")
+_PHONE_LIKE = re.compile(r"^[\d\s+\-().]+$")
+
+
+def digits(raw):
+    return _NON_DIGITS.sub("", raw or "")
+
+
+def normalize_phone(raw):
+    """E.164 ("+4790000000"), eller "" når nummeret ikke kan tolkes."""
+    raw = (raw or "").strip()
+    d = digits(raw)
+    if not d:
+        return ""
+    if raw.startswith("+"):
+        number = d
+    elif d.startswith("00"):
+        number = d[2:]
+    elif len(d) == NATIONAL_LENGTH:
+        number = DEFAULT_COUNTRY_CODE + d
+    elif len(d) == NATIONAL_LENGTH + len(DEFAULT_COUNTRY_CODE) and d.startswith(DEFAULT_COUNTRY_CODE):
+        number = d
+    else:
+        return ""
+    # E.164: maks 15 sifre, landskode starter aldri med 0
+    if not 8 <= len(number) <= 15 or number.startswith("0"):
+        return ""
+    return "+" + number
+
+
+def reversed_digits(raw):
+    """Sifrene baklengs – fra E.164-formen når den finnes, ellers rå sifre."""
+    return digits(normalize_phone(raw) or raw)[::-1]
+
+
+def is_phone_like(text):
+    return bool(_PHONE_LIKE.match(text or "")) and len(digits(text)) >= 3
+
+
+def phone_q(text):
+    """
+    Filter for telefonsøk. "+47 900…" (og "0047…" lengre enn et norsk
+    nummer) tolkes som starten av et fullt nummer; alt annet som de siste
+    sifrene i nummeret – "003" finner altså "+47 900 00 003".
+    """
+    text = (text or "").strip()
+    d = digits(text)
+    if not d:
+        return Q(pk__in=[])
+    if text.startswith("+"):
+        return Q(telefon_e164__startswith="+" + d)
+    if d.startswith("00") and len(d) > NATIONAL_LENGTH:
+        return Q(telefon_e164__startswith="+" + d[2:])
+    return Q(telefon_rev__startswith=d[::-1])
+
+
+def fill_phone_columns(model, batch_size=2000, only_missing=False):
+    """
+    Regn ut telefon_e164/telefon_rev for alle rader i `model` (Medlem, eller
+    den historiske modellen i en migrasjon). Returnerer antall endrede rader.
+    """
+    qs = model.objects.only("id", "telefon", "telefon_e164", "telefon_rev").order_by("id")
+    if only_missing:
+        qs = qs.filter(telefon_rev="").exclude(telefon="")
+    changed, total = [], 0
+    for m in qs.iterator(chunk_size=batch_size):
+        e164, rev = normalize_phone(m.telefon), reversed_digits(m.telefon)
+        if (e164, rev) != (m.telefon_e164, m.telefon_rev):
+            m.telefon_e164, m.telefon_rev = e164, rev
+            changed.append(m)
+        if len(changed) >= batch_size:
+            model.objects.bulk_update(changed, ["telefon_e164", "telefon_rev"])
+            total += len(changed)
+            changed = []
+    if changed:
+        model.objects.bulk_update(changed, ["telefon_e164", "telefon_rev"])
+        total += len(changed)
+    return total
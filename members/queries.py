@@ -1,11 +1,53 @@
 # members/queries.py
-from django.db.models import Q
-from .models import Medlem
+from django.db.models import Exists, OuterRef, Q
+from .models import Fylkeslagsmedlemskap, Medlem, Medlemskap
+
+# Pending = selvregistrering uten verver; avledet til Medlem.status i save()
+# (se Medlem.is_pending), så oppslaget går via indeksen (status, registrert)
+PENDING_Q = Q(status="pending")
 
 def pending_qs(qs=None):
-    qs = qs or Medlem.objects.all()
-    # Pending = selvregistrering uten verver
-    return qs.filter(
-        verve_kilde="self",
-        verver_user__isnull=True,
-    ).filter(Q(verver_navn__isnull=True) | Q(verver_navn=""))
+    # NB: ikke `qs or ...` – det evaluerer hele querysetet
+    qs = Medlem.objects.all() if qs is None else qs
+    return qs.filter(PENDING_Q)
+
+
+# Lokallag-filtre som EXISTS i stedet for JOIN via Medlemskap: ingen duplikater,
+# så ingen .distinct() (og ingen temp-tabell for DISTINCT + ORDER BY på MySQL)
+def in_lokallag(lokallag_id):
+    return Exists(Medlemskap.objects.filter(medlem_id=OuterRef("pk"), lokallag_id=lokallag_id))
+
+
+def in_lag_i_fylke(fylke_id):
+    return Exists(Medlemskap.objects.filter(medlem_id=OuterRef("pk"), lokallag__fylke_id=fylke_id))
+
+
+# Tilgang til medlemslister (fylkehub/laghub og eksporten)
+def has_fylke_access(user, fylke_id):
+    """Superuser, eller har en rolle i fylkeslaget for fylket."""
+    return user.is_superuser or Fylkeslagsmedlemskap.objects.filter(
+        medlem__user=user, fylkeslag__fylke_id=fylke_id,
+    ).exists()
+
+
+def has_lag_access(user, lokallag_id):
+    """Superuser, eller er selv medlem av lokallaget."""
+    return user.is_superuser or Medlemskap.objects.filter(
+        medlem__user=user, lokallag_id=lokallag_id,
+    ).exists()
+
+
+def can_export(user, fylke_id=None, lokallag_id=None):
+    """
+    Eksport krever tilgang til fylket (f) eller laget (l) det filtreres på.
+    Filtrene AND-es, så resultatet er alltid en delmengde av det brukeren
+    har tilgang til; uten f/l er det bare superuser som kan eksportere.
+    """
+    if not user.is_authenticated:
+        return False
+    if user.is_superuser:
+        return True
+    return bool(
+        (lokallag_id and has_lag_access(user, lokallag_id))
+        or (fylke_id and has_fylke_access(user, fylke_id))
+    )
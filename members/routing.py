@@ -0,0 +1,148 @@
+# members/routing.py
+"""
+Kontaktruter: ferdig utregnet varslingsadresse for hvert lokallag, hver
+kommune og hvert fylke (members.Kontaktrute), så varsler, utsendelser og
+hub-sidene slipper å gå gjennom reservekjeden
+Lokallag.contact_email → Fylkeslag.epost → Fylke.contact_email per hendelse.
+
+rebuild_routes() regner ut hele tabellen (fire små spørringer) og skriver
+bare endringene; members/signals.py kjører den etter commit når
+kontaktfeltene kan ha endret seg. contact_routes() leser tabellen med én
+spørring og holder den i prosessen i KONTAKTRUTE_TTL sekunder (andre
+prosesser ser en endring innen da).
+"""
+import threading
+import time
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from geo.loading import diff
+from .models import Kontaktrute
+
+ROUTE_TTL = float(getattr(settings, "KONTAKTRUTE_TTL", 300))
+
+
+def _clean(email):
+    return (email or "").strip()
+
+
+def build_routes(apps=global_apps):
+    """{(nivå, id): (epost, kilde)} for alle lokallag, kommuner og fylker som har en adresse."""
+    Fylke = apps.get_model("geo", "Fylke")
+    Kommune = apps.get_model("geo", "Kommune")
+    Fylkeslag = apps.get_model("members", "Fylkeslag")
+    Lokallag = apps.get_model("members", "Lokallag")
+
+    fylke = {fid: (_clean(e), "fylke") for fid, e in Fylke.objects.values_list("id", "contact_email") if _clean(e)}
+    # fylkeslaget går foran fylkets egen adresse
+    fylke.update((fid, (_clean(e), "fylkeslag"))
+                 for fid, e in Fylkeslag.objects.values_list("fylke_id", "epost") if _clean(e))
+
+    routes = {("fylke", fid): route for fid, route in fylke.items()}
+    for kid, fid in Kommune.objects.values_list("id", "fylke_id"):
+        if fid in fylke:
+            routes[("kommune", kid)] = fylke[fid]
+    for lid, e, fid in Lokallag.objects.values_list("id", "contact_email", "fylke_id"):
+        if _clean(e):
+            routes[("lokallag", lid)] = (_clean(e), "lokallag")
+        elif fid in fylke:
+            routes[("lokallag", lid)] = fylke[fid]
+    return routes
+
+
+def rebuild_routes(apps=global_apps):
+    """Bygg Kontaktrute på nytt; skriver bare forskjellene. Gir (nye, endrede, fjernede)."""
+    Kontaktrute = apps.get_model("members", "Kontaktrute")
+    incoming = build_routes(apps)
+    ids, current = {}, {}
+    for pk, niva, ref_id, epost, kilde in Kontaktrute.objects.values_list("id", "niva", "ref_id", "epost", "kilde"):
+        ids[(niva, ref_id)], current[(niva, ref_id)] = pk, (epost, kilde)
+    new, changed, missing = diff(current, incoming)
+
+    now = timezone.now()
+
+    def build(key, pk=None):
+        return Kontaktrute(id=pk, niva=key[0], ref_id=key[1], epost=incoming[key][0], kilde=incoming[key][1],
+                           oppdatert=now)
+
+    with transaction.atomic():
+        if missing:
+            Kontaktrute.objects.filter(id__in=[ids[k] for k in missing]).delete()
+        if changed:
+            Kontaktrute.objects.bulk_update([build(k, ids[k]) for k in changed], ["epost", "kilde", "oppdatert"],
+                                            batch_size=1000)
+        if new:
+            Kontaktrute.objects.bulk_create([build(k) for k in new], batch_size=1000)
+    if new or changed or missing:
+        invalidate_routes()
+    return len(new), len(changed), len(missing)
+
+
+class RouteMap:
+    """Kontaktruter i minnet: lokallag {id: (epost, kilde)}, kommune/fylke {id: epost}."""
+
+    def __init__(self, rows):
+        self.lokallag, self.kommune, self.fylke = {}, {}, {}
+        for niva, ref_id, epost, kilde in rows:
+            if niva == "lokallag":
+                self.lokallag[ref_id] = (epost, kilde)
+            elif niva == "kommune":
+                self.kommune[ref_id] = epost
+            else:
+                self.fylke[ref_id] = epost
+
+    @staticmethod
+    def default():
+        return getattr(settings, "DEFAULT_FROM_EMAIL", "bn@zc.no")
+
+    def for_lokallag(self, lokallag_id):
+        """Lagets adresse, ellers fylkeslagets/fylkets; "" hvis ingen (brukes på hub-sidene)."""
+        route = self.lokallag.get(lokallag_id)
+        return route[0] if route else ""
+
+    def for_fylke(self, fylke_id):
+        return self.fylke.get(fylke_id, "")
+
+    def recipients(self, lokallag_ids, kommune_id):
+        """
+        Mottakere for noe som gjelder et medlem:
+          1) lokallagenes egne adresser (Lokallag.contact_email)
+          2) kommunens rute (Fylkeslag.epost, ellers Fylke.contact_email)
+          3) DEFAULT_FROM_EMAIL
+        """
+        found = set()
+        for pk in lokallag_ids:
+            route = self.lokallag.get(pk)
+            if route and route[1] == "lokallag":
+                found.add(route[0])
+        if not found and kommune_id in self.kommune:
+            found.add(self.kommune[kommune_id])
+        return sorted(found) or [self.default()]
+
+    def for_medlem(self, medlem):
+        """Første mottaker for et medlem (lokallag må være forhåndslastet for å unngå spørring)."""
+        return self.recipients([l.id for l in medlem.lokallag.all()], medlem.kommune_id)[0]
+
+
+_lock = threading.Lock()
+_cached = {"map": None, "loaded": 0.0}
+
+
+def contact_routes():
+    """RouteMap – én spørring, deretter høyst ROUTE_TTL sekunder gammel."""
+    now = time.monotonic()
+    with _lock:
+        if _cached["map"] is not None and now - _cached["loaded"] < ROUTE_TTL:
+            return _cached["map"]
+    routes = RouteMap(Kontaktrute.objects.values_list("niva", "ref_id", "epost", "kilde"))
+    with _lock:
+        _cached["map"], _cached["loaded"] = routes, now
+    return routes
+
+
+def invalidate_routes():
+    with _lock:
+        _cached["map"] = None
@@ -0,0 +1,97 @@
+# members/search.py
+"""
+Fritekstsøk på Medlem.
+
+Medlem.sok er en denormalisert kolonne (navn, e-post, adresse, telefon i små
+bokstaver) som settes i Medlem.save(). På MySQL har den en FULLTEXT-indeks med
+ngram-parser (migrasjon 0014), så `sok__match="ola storg"` blir
+MATCH ... AGAINST i boolean mode: hvert ord må forekomme som delstreng, som
+med de gamle icontains-filtrene – men via indeksen i stedet for full skann.
+Andre databaser (sqlite lokalt) faller tilbake til LIKE per ord.
+
+Bulk-stier som går utenom save() (queryset.update, bulk_create) må sette
+`sok` selv med search_text(), eller kjøre refresh_search_text() etterpå.
+"""
+from django.db import models
+from django.db.models import Lookup
+
+# MySQL ngram_token_size (default 2): kortere ord kan ikke slås opp i indeksen
+NGRAM_TOKEN_SIZE = 2
+_BOOLEAN_SPECIALS = str.maketrans("", "", '"')
+
+
+def search_text(*values):
+    """Verdien som lagres i Medlem.sok."""
+    return " ".join(" ".join(str(v).split()) for v in values if v).lower()
+
+
+def medlem_search_text(m):
+    return search_text(m.fornavn, m.etternavn, m.epost, m.adresse, m.telefon)
+
+
+def search_terms(q):
+    return [t for t in (q or "").translate(_BOOLEAN_SPECIALS).lower().split() if t]
+
+
+class SearchTextField(models.TextField):
+    """TextField med `__match`-oppslag (FULLTEXT på MySQL, LIKE ellers)."""
+
+
+@SearchTextField.register_lookup
+class Match(Lookup):
+    lookup_name = "match"
+    prepare_rhs = False
+
+    def _like(self, lhs, terms, connection):
+        op = connection.operators["contains"] % "%s"
+        sql = " AND ".join(f"{lhs} {op}" for _ in terms)
+        return sql, [f"%{connection.ops.prep_for_like_query(t)}%" for t in terms]
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        terms = search_terms(self.rhs)
+        if not terms:
+            return "1=1", []
+        sql, params = self._like(lhs, terms, connection)
+        return f"({sql})", lhs_params * len(terms) + params
+
+    def as_mysql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        terms = search_terms(self.rhs)
+        indexed = [t for t in terms if len(t) >= NGRAM_TOKEN_SIZE]
+        short = [t for t in terms if len(t) < NGRAM_TOKEN_SIZE]
+        parts, params = [], []
+        if indexed:
+            parts.append(f"MATCH ({lhs}) AGAINST (%s IN BOOLEAN MODE)")
+            params += lhs_params + [" ".join(f'+"{t}"' for t in indexed)]
+        if short:
+            sql, like_params = self._like(lhs, short, connection)
+            parts.append(sql)
+            params += lhs_params * len(short) + like_params
+        if not parts:
+            return "1=1", []
+        return "(" + " AND ".join(parts) + ")", params
+
+
+def search_members(qs, q):
+    """Filtrer et Medlem-queryset på fritekst (tomt søk = uendret)."""
+    return qs.filter(sok__match=q) if search_terms(q) else qs
+
+
+def refresh_search_text(qs, batch_size=1000):
+    """Regn ut `sok` på nytt for et Medlem-queryset (etter bulk-endringer)."""
+    fields = ("id", "fornavn", "etternavn", "epost", "adresse", "telefon", "sok")
+    changed, total = [], 0
+    for m in qs.only(*fields).order_by("id").iterator(chunk_size=batch_size):
+        text = medlem_search_text(m)
+        if text != m.sok:
+            m.sok = text
+            changed.append(m)
+        if len(changed) >= batch_size:
+            total += len(changed)
+            qs.model.objects.bulk_update(changed, ["sok"])
+            changed = []
+    if changed:
+        total += len(changed)
+        qs.model.objects.bulk_update(changed, ["sok"])
+    return total
@@ -1,25 +1,25 @@
 # members/signals.py
-import logging
 from django.db import transaction
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from .models import PendingMedlem
-from .notifications import notify_new_self_registration
+from geo.models import Fylke, GeoImport, Kommune
+from .models import Fylkeslag, Lokallag
+from .routing import rebuild_routes
 
-log = logging.getLogger(__name__)
+# Varsel om nye selvregistreringer legges i kø fra SelfRegister (members.Varsel)
+# og sendes av send_varsler – ingen e-post fra signaler her.
 
-@receiver(post_save, sender=PendingMedlem)  # korrekt bruk: ingen lister her
-def pendingmedlem_created(sender, instance, created, **kwargs):
-    if not created:
-        return
 
-    def _send():
-        try:
-            sent = notify_new_self_registration(instance)
-            log.info("Varsel sendt for PendingMedlem id=%s (antall=%s)", instance.id, sent)
-        except Exception:
-            log.exception("Varsel feilet (id=%s)", getattr(instance, "id", "?"))
-
-    # Send etter DB-commit (M2M ferdig)
-    transaction.on_commit(_send)
+@receiver(post_save, sender=Lokallag)
+@receiver(post_delete, sender=Lokallag)
+@receiver(post_save, sender=Fylkeslag)
+@receiver(post_delete, sender=Fylkeslag)
+@receiver(post_save, sender=Fylke)
+@receiver(post_delete, sender=Fylke)
+@receiver(post_save, sender=Kommune)
+@receiver(post_delete, sender=Kommune)
+@receiver(post_save, sender=GeoImport)  # load_kommuner skriver med bulk-operasjoner uten signaler
+def contact_fields_changed(sender, instance, **kwargs):
+    # kontaktrutene (members/routing.py) bygges etter commit; bare endrede ruter skrives
+    transaction.on_commit(rebuild_routes)
@@ -1,3 +1,102 @@
+import base64
+import json
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
 
-# Create your tests here.
+from geo.models import Fylke
+from .approval import approve
+from .models import Godkjenning, Lokallag, Medlem, Medlemskap
+from .pagination import decode_cursor, encode_cursor, keyset_page
+
+
+def make_medlem(fornavn, etternavn, **kwargs):
+    return Medlem.objects.create(fornavn=fornavn, etternavn=etternavn, telefon="+47 900 00 000", **kwargs)
+
+
+def token(values):
+    raw = json.dumps(values).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        # to like navn, så id skiller dem i sorteringen
+        for etternavn, fornavn in [("Ås", "Kari"), ("Berg", "Ola"), ("Berg", "Ola"), ("Dahl", "Per"), ("Aas", "Liv")]:
+            make_medlem(fornavn, etternavn)
+        self.ordered = list(Medlem.objects.order_by("etternavn", "fornavn", "id"))
+
+    def test_cursor_rundtur(self):
+        obj = self.ordered[2]
+        self.assertEqual(decode_cursor(encode_cursor(obj)), [obj.etternavn, obj.fornavn, obj.id])
+
+    def test_bla_fram_og_tilbake(self):
+        qs = Medlem.objects.all()
+        first = keyset_page(qs, 2)
+        self.assertEqual(list(first), self.ordered[:2])
+        self.assertFalse(first.has_previous())
+
+        second = keyset_page(qs, 2, after=first.next_cursor)
+        self.assertEqual(list(second), self.ordered[2:4])
+        self.assertTrue(second.has_previous())
+
+        last = keyset_page(qs, 2, after=second.next_cursor)
+        self.assertEqual(list(last), self.ordered[4:])
+        self.assertFalse(last.has_next())
+
+        back = keyset_page(qs, 2, before=last.previous_cursor)
+        self.assertEqual(list(back), self.ordered[2:4])
+        self.assertTrue(back.has_next() and back.has_previous())
+
+    def test_ugyldig_cursor_avvises(self):
+        for bad in ["ikke-base64!", token({"a": 1}), token(["Berg", "Ola"]), token(["Berg", None, 1]),
+                    token(["Berg", "Ola", "1"]), token(["Berg", "Ola", True]), token([1, "Ola", 1])]:
+            with self.subTest(bad=bad):
+                self.assertIsNone(decode_cursor(bad))
+                # ugyldig cursor gir første side
+                self.assertEqual(list(keyset_page(Medlem.objects.all(), 2, after=bad)), self.ordered[:2])
+
+    def test_tom_side(self):
+        # cursor fra siste rad (f.eks. en utdatert lenke etter sletting)
+        page = keyset_page(Medlem.objects.all(), 2, after=encode_cursor(self.ordered[-1]))
+        self.assertEqual(list(page), [])
+        self.assertEqual((page.next_cursor, page.previous_cursor), ("", ""))
+
+
+class ApprovalTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("godkjenner", first_name="Gro", last_name="Godkjenner")
+        fylke = Fylke.objects.create(navn="Agder", slug="agder")
+        self.lag = Lokallag.objects.create(navn="Risør", fylke=fylke, slug="risor")
+        self.med_lag = make_medlem("Ola", "Berg")
+        Medlemskap.objects.create(medlem=self.med_lag, lokallag=self.lag)
+        self.uten_lag = make_medlem("Kari", "Dahl")
+        self.vervet = make_medlem("Per", "Aas", verve_kilde="verver", verver_navn="Noen")
+
+    def test_ventende_medlemmer(self):
+        self.assertEqual(set(Medlem.objects.filter(status="pending")), {self.med_lag, self.uten_lag})
+        self.assertEqual(self.vervet.status, "approved")
+
+    def test_godkjenning_skriver_status_og_revisjonsspor(self):
+        result = approve(Medlem.objects.all(), self.user, kilde="admin")
+        self.assertEqual((result.approved, result.lacking), (2, 0))
+        for m in Medlem.objects.filter(pk__in=[self.med_lag.pk, self.uten_lag.pk]):
+            self.assertEqual((m.status, m.approved_by, m.verver_user, m.verver_navn),
+                             ("approved", self.user, self.user, "Gro Godkjenner"))
+            self.assertIsNotNone(m.approved_at)
+            # avledet status stemmer med feltene etter godkjenning
+            self.assertFalse(m.is_pending)
+        self.assertEqual(
+            set(Godkjenning.objects.values_list("medlem_id", "godkjent_av", "kilde")),
+            {(self.med_lag.pk, self.user.pk, "admin"), (self.uten_lag.pk, self.user.pk, "admin")},
+        )
+        # allerede godkjente hoppes over
+        self.assertEqual(approve(Medlem.objects.all(), self.user).approved, 0)
+        self.assertEqual(Godkjenning.objects.count(), 2)
+
+    def test_krev_lokallag(self):
+        result = approve(Medlem.objects.all(), self.user, require_lokallag=True)
+        self.assertEqual((result.approved, result.lacking), (1, 1))
+        self.assertEqual(result.lacking_sample, [(self.uten_lag.pk, "Kari", "Dahl")])
+        self.assertEqual(set(Medlem.objects.filter(status="pending")), {self.uten_lag})
+        self.assertEqual(list(Godkjenning.objects.values_list("medlem_id", flat=True)), [self.med_lag.pk])
@@ -7,6 +7,7 @@ app_name = "members"
 urlpatterns = [
     # CRUD
     path("", views.MembersList.as_view(), name="list"),
+    path("export/", views.MembersExport.as_view(), name="export"),
     path("new/", views.MemberCreate.as_view(), name="new"),
     path("<int:pk>/", views.MemberDetail.as_view(), name="detail"),
     path("<int:pk>/edit/", views.MemberUpdate.as_view(), name="edit"),
@@ -8,103 +8,37 @@ from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.views import View
 from django.views.generic import CreateView, UpdateView, ListView, DetailView, TemplateView
 from django.utils.decorators import method_decorator
-from django.views.decorators.http import require_GET
-from django.http import HttpResponse, JsonResponse, HttpResponseRedirect
-from django.db.models import Q
+from django.conf import settings
+from django.utils import timezone
+from django.views.decorators.http import condition, require_GET
+from django.utils.cache import patch_cache_control
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.utils.functional import cached_property
+from django.utils.http import urlencode
 from .models import Medlem, Medlemskap, Lokallag
 from .forms import MedlemForm
-from .queries import pending_qs
-from geo.models import Fylke, Kommune, Postnummer
+from .export import iter_rows, stream_csv, stream_xlsx
+from .approval import approve
+from .queries import can_export, in_lokallag, pending_qs
+from .phone import phone_q
+from .pagination import CachedCountPaginator, keyset_page
+from .search import search_members
+from geo.models import Fylke, Kommune
+from geo.fragments import kommune_options, lokallag_options, postnummer_options
+from geo.stamp import current_stamp
+from geo import resolver as geo_resolver
 from .forms import SelfMedlemPublicForm
 from django.db import transaction
-from members.notifications import notify_new_self_registration
+from members.notifications import queue_self_registration
 
 logger = logging.getLogger("members")
 
+GEO_FRAGMENT_MAX_AGE = int(getattr(settings, "GEO_FRAGMENT_MAX_AGE", 24 * 3600))
+
 # -----------------------
 # CRUD for Member
 # -----------------------
 
-# members/views.py (utdrag)
-
-class MembersList(LoginRequiredMixin, ListView):
-    model = Medlem
-    template_name = "members/list.html"
-    context_object_name = "members"
-    paginate_by = 30
-
-    @cached_property
-    def f_id(self):
-        v = (self.request.GET.get("f") or "").strip()
-        return int(v) if v.isdigit() else None
-
-    @cached_property
-    def k_id(self):
-        v = (self.request.GET.get("k") or "").strip()
-        return int(v) if v.isdigit() else None
-
-    @cached_property
-    def l_id(self):
-        v = (self.request.GET.get("l") or "").strip()
-        return int(v) if v.isdigit() else None
-
-    @cached_property
-    def tel(self):
-        return (self.request.GET.get("tel") or "").strip()
-
-    @cached_property
-    def q(self):
-        return (self.request.GET.get("q") or "").strip()
-
-    def get_queryset(self):
-        qs = (
-            Medlem.objects.all()
-            .select_related("kommune", "kommune__fylke", "postnummer")
-            .prefetch_related("lokallag")
-            .order_by("etternavn", "fornavn", "id")
-        )
-        if self.f_id:
-            qs = qs.filter(kommune__fylke_id=self.f_id)
-        if self.k_id:
-            qs = qs.filter(kommune_id=self.k_id)
-        if self.l_id:
-            qs = qs.filter(lokallag__id=self.l_id)
-        if self.tel:
-            qs = qs.filter(telefon__icontains=self.tel)
-        if self.q:
-            qs = qs.filter(
-                Q(fornavn__icontains=self.q) |
-                Q(etternavn__icontains=self.q) |
-                Q(epost__icontains=self.q) |
-                Q(adresse__icontains=self.q)
-            )
-        return qs.distinct()
-
-    def get_context_data(self, **kwargs):
-        ctx = super().get_context_data(**kwargs)
-        fylker = Fylke.objects.order_by("navn")
-        kommuner = Kommune.objects.none()
-        lag = Lokallag.objects.none()
-
-        if self.f_id:
-            kommuner = Kommune.objects.filter(fylke_id=self.f_id).order_by("navn")
-            lag = Lokallag.objects.filter(fylke_id=self.f_id).order_by("navn")
-        if self.k_id:
-            lag = lag.filter(kommune_id=self.k_id) if lag.exists() else Lokallag.objects.filter(
-                kommune_id=self.k_id
-            ).order_by("navn")
-
-        ctx.update(
-            fylker=fylker,
-            kommuner=kommuner,
-            lokallag=lag,
-            f=self.f_id, k=self.k_id, l=self.l_id,
-            tel=self.tel, q=self.q,
-        )
-        return ctx
-
-
 class MemberUpdate(LoginRequiredMixin, UpdateView):
     model = Medlem
     form_class = MedlemForm
@@ -137,13 +71,9 @@ class MemberUpdate(LoginRequiredMixin, UpdateView):
     def get_success_url(self):
         return reverse("members:detail", kwargs={"pk": self.object.pk})
 
-class MembersList(LoginRequiredMixin, ListView):
-    model = Medlem
-    template_name = "members/list.html"
-    context_object_name = "medlemmer"
-    paginate_by = 30
+class MemberFilterMixin:
+    """f/k/l/tel/q-filtrene fra GET – felles for medlemslista og eksporten."""
 
-    # --- filtre hentet fra GET ---
     @cached_property
     def f_id(self):
         v = (self.request.GET.get("f") or "").strip()
@@ -167,14 +97,7 @@ class MembersList(LoginRequiredMixin, ListView):
     def q(self):
         return (self.request.GET.get("q") or "").strip()
 
-    def get_queryset(self):
-        qs = (
-            Medlem.objects.all()
-            .select_related("kommune", "kommune__fylke", "postnummer")
-            .prefetch_related("lokallag")
-            .order_by("etternavn", "fornavn", "id")
-        )
-
+    def filter_members(self, qs):
         if self.f_id:
             qs = qs.filter(kommune__fylke_id=self.f_id)
 
@@ -182,21 +105,53 @@ class MembersList(LoginRequiredMixin, ListView):
             qs = qs.filter(kommune_id=self.k_id)
 
         if self.l_id:
-            qs = qs.filter(lokallag__id=self.l_id)
+            qs = qs.filter(in_lokallag(self.l_id))
 
         if self.tel:
-            qs = qs.filter(telefon__icontains=self.tel)
+            # indeksert: siste sifre via telefon_rev, eller +47… via telefon_e164
+            qs = qs.filter(phone_q(self.tel))
 
         if self.q:
-            qs = qs.filter(
-                Q(fornavn__icontains=self.q) |
-                Q(etternavn__icontains=self.q) |
-                Q(epost__icontains=self.q) |
-                Q(adresse__icontains=self.q)
-            )
+            # FULLTEXT-indeks på Medlem.sok i stedet for icontains-OR over fire kolonner
+            qs = search_members(qs, self.q)
 
-        # M2M-filter (lokallag) kan gi duplikater → distinkt
-        return qs.distinct()
+        # lokallag-filteret er EXISTS (ingen JOIN) → ingen duplikater, ingen distinct
+        return qs
+
+    @property
+    def filter_qs(self):
+        return urlencode({k: v for k, v in (
+            ("f", self.f_id), ("k", self.k_id), ("l", self.l_id), ("tel", self.tel), ("q", self.q),
+        ) if v})
+
+
+class MembersList(LoginRequiredMixin, MemberFilterMixin, ListView):
+    model = Medlem
+    template_name = "members/list.html"
+    context_object_name = "members"
+    paginate_by = 30
+    paginator_class = CachedCountPaginator
+
+    def get_queryset(self):
+        qs = (
+            Medlem.objects.all()
+            .select_related("kommune", "kommune__fylke", "postnummer")
+            .prefetch_related("lokallag")
+            .order_by("etternavn", "fornavn", "id")
+        )
+        return self.filter_members(qs)
+
+    def paginate_queryset(self, queryset, page_size):
+        # ?page=N (gamle lenker) → OFFSET; ellers keyset med ?after= / ?before=
+        if self.request.GET.get(self.page_kwarg):
+            return super().paginate_queryset(queryset, page_size)
+        paginator = self.get_paginator(queryset, page_size)
+        page = keyset_page(
+            queryset, page_size,
+            after=self.request.GET.get("after"), before=self.request.GET.get("before"),
+            paginator=paginator,
+        )
+        return paginator, page, page.object_list, page.has_other_pages()
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
@@ -222,9 +177,34 @@ class MembersList(LoginRequiredMixin, ListView):
             fylker=fylker,
             kommuner=kommuner,
             lokallag=lag,
+            filter_qs=self.filter_qs,
+            can_export=can_export(self.request.user, fylke_id=self.f_id, lokallag_id=self.l_id),
         )
         return ctx
 
+class MembersExport(LoginRequiredMixin, MemberFilterMixin, View):
+    """
+    /members/export/?format=csv|xlsx&f=&k=&l=&tel=&q= – samme filtre som lista,
+    strømmet (members/export.py). Krever tilgang til fylket/laget det filtreres på.
+    """
+    def get(self, request):
+        if not can_export(request.user, fylke_id=self.f_id, lokallag_id=self.l_id):
+            return HttpResponseForbidden("Du har ikke tilgang til å eksportere denne medlemslista.")
+        rows = iter_rows(self.filter_members(Medlem.objects.all()))
+        stamp = timezone.localtime().strftime("%Y%m%d-%H%M")
+        if request.GET.get("format") == "xlsx":
+            response = StreamingHttpResponse(
+                stream_xlsx(rows),
+                content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            )
+            filename = f"medlemmer-{stamp}.xlsx"
+        else:
+            response = StreamingHttpResponse(stream_csv(rows), content_type="text/csv; charset=utf-8")
+            filename = f"medlemmer-{stamp}.csv"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        logger.info("Eksport %s av %s (%s)", filename, request.user, self.filter_qs or "uten filter")
+        return response
+
 class MemberCreate(LoginRequiredMixin, CreateView):
     model = Medlem
     form_class = MedlemForm
@@ -252,27 +232,15 @@ class SelfRegister(CreateView):
     success_url = reverse_lazy("members:self-thanks")
 
     def form_valid(self, form):
-        # 1) Lagre en gang, og behold objektet
-        self.object = form.save(request=None)  # viktig: ingen innlogget verver settes
-        # 2) Sørg for at M2M (lokallag) også lagres
-        if hasattr(form, "save_m2m"):
-            form.save_m2m()
-
-        # 3) Send varsel-epost ETTER at transaksjonen er committed
-        def _send():
-            try:
-                notify_new_self_registration(self.object)
-                logging.getLogger(__name__).info(
-                    "Varsel sendt ved self-registrering id=%s", getattr(self.object, "id", "?")
-                )
-            except Exception:
-                logging.getLogger(__name__).exception(
-                    "Varsel-epost feilet for id=%s", getattr(self.object, "id", "?")
-                )
-
-        transaction.on_commit(_send)
-
-        # 4) Flash-melding og redirect
+        # Registrering, lokallag og varsel i én transaksjon; e-posten sendes av
+        # send_varsler, så treg SMTP aldri holder igjen forespørselen
+        with transaction.atomic():
+            self.object = form.save(request=None)  # viktig: ingen innlogget verver settes
+            if hasattr(form, "save_m2m"):
+                form.save_m2m()
+            queue_self_registration(self.object)
+
+        # Flash-melding og redirect
         messages.success(self.request, "Takk! Registreringen er mottatt.")
         return HttpResponseRedirect(self.get_success_url())
 
@@ -286,68 +254,66 @@ class SelfThanks(TemplateView):
 # -----------------------
 # --- HJELPE-ENDEPUNKTER (GET) ---
 
-@method_decorator(require_GET, name="dispatch")
-class HxKommuner(View):
-    def get(self, request):
-        fylke_id = request.GET.get("fylke")
-        qs = Kommune.objects.all().order_by("navn")
-        if fylke_id:
-            qs = qs.filter(fylke_id=fylke_id)
-        options = "".join(f'<option value="{k.id}">{k.navn}</option>' for k in qs)
-        return HttpResponse(options or '<option value="">(Ingen kommuner)</option>')
+def _geo_id(request, name):
+    v = (request.GET.get(name) or "").strip()
+    return int(v) if v.isdigit() else None
 
 
-@method_decorator(require_GET, name="dispatch")
-class HxLokallag(View):
+def _geo_etag(request, *args, **kwargs):
+    # samme versjon for alle fragmenter; spørrestrengen skiller dem
+    return f"geo-{current_stamp()[0]}-{request.GET.urlencode()}"
+
+
+def _geo_last_modified(request, *args, **kwargs):
+    return current_stamp()[1]
+
+
+class GeoFragmentView(View):
+    """Ferdigbygde <option>-fragmenter (geo/fragments.py) med ETag/Last-Modified."""
+    max_age = GEO_FRAGMENT_MAX_AGE
+
+    @method_decorator(require_GET)
+    @method_decorator(condition(etag_func=_geo_etag, last_modified_func=_geo_last_modified))
+    def dispatch(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        patch_cache_control(response, public=True, max_age=self.max_age)
+        return response
+
+
+class HxKommuner(GeoFragmentView):
     def get(self, request):
-        fylke_id = request.GET.get("fylke")
-        kommune_id = request.GET.get("kommune")
-        qs = Lokallag.objects.all().order_by("navn")
-        if fylke_id:
-            qs = qs.filter(fylke_id=fylke_id)
-        if kommune_id:
-            qs = qs.filter(kommune_id=kommune_id)
-        options = "".join(f'<option value="{l.id}">{l.navn}</option>' for l in qs)
-        return HttpResponse(options or '<option value="">(Ingen lag)</option>')
+        return HttpResponse(kommune_options(_geo_id(request, "fylke")))
 
 
-@method_decorator(require_GET, name="dispatch")
-class HxPostnummer(View):
+class HxLokallag(GeoFragmentView):
+    # nye lag skal dukke opp raskt – kortere levetid i nettleseren
+    max_age = 300
+
     def get(self, request):
-        kommune_id = request.GET.get("kommune")
-        qs = Postnummer.objects.all()
-        if kommune_id:
-            # bruk riktig related_name for kobling postnummer<->kommune
-            qs = qs.filter(kommuner__kommune_id=kommune_id)
-        qs = qs.distinct().order_by("nummer")
+        return HttpResponse(lokallag_options(_geo_id(request, "fylke"), _geo_id(request, "kommune")))
 
-        def label(p):
-            navn = getattr(p, "navn", None) or getattr(p, "poststed", None) or ""
-            return f"{p.nummer} – {navn}" if navn else p.nummer
 
-        options = "".join(f'<option value="{p.nummer}">{label(p)}</option>' for p in qs[:1000])
-        return HttpResponse(options or '<option value="">(Ingen postnummer)</option>')
+class HxPostnummer(GeoFragmentView):
+    def get(self, request):
+        return HttpResponse(postnummer_options(_geo_id(request, "kommune")))
 
 
 @method_decorator(require_GET, name="dispatch")
 class ApiPostnummer(View):
     def get(self, request):
-        nr = (request.GET.get("nr") or "").strip().zfill(4)
-        pn = Postnummer.objects.filter(nummer=nr).first()
+        pn = geo_resolver.resolve((request.GET.get("nr") or "").strip().zfill(4))
         if not pn:
             return JsonResponse({"found": False})
-        pk = pn.kommuner.filter(primar=True).select_related("kommune__fylke").first() \
-             or pn.kommuner.select_related("kommune__fylke").first()
-        if not pk:
+        k = pn.kommune
+        if not k:
             return JsonResponse({"found": True})
-        k = pk.kommune
         return JsonResponse({
             "found": True,
             "kommune_id": k.id,
             "kommune_navn": k.navn,
             "kommune_nr": k.nummer,
             "fylke_id": k.fylke_id,
-            "fylke_navn": k.fylke.navn,
+            "fylke_navn": k.fylke_navn,
         })
 
 
@@ -377,17 +343,7 @@ class MemberApprove(LoginRequiredMixin, ApprovePermissionMixin, View):
         m = get_object_or_404(Medlem, pk=pk)
 
         # Kun godkjenn “ekte pending”
-        if (
-            m.verve_kilde == "self"
-            and m.verver_user_id is None
-            and not (m.verver_navn or "").strip()
-        ):
-            display = request.user.get_full_name() or request.user.get_username()
-            # Behold verve_kilde='self', sett hvem som godkjente
-            m.verver_user = request.user
-            if not (m.verver_navn or "").strip():
-                m.verver_navn = display
-            m.save(update_fields=["verver_user", "verver_navn"])
+        if approve(Medlem.objects.filter(pk=m.pk), request.user, kilde="enkelt").approved:
             messages.success(request, f"{m.fornavn} {m.etternavn} er godkjent.")
         else:
             messages.info(request, "Denne posten er ikke i 'til godkjenning'.")
@@ -407,18 +363,7 @@ class ApproveBulk(LoginRequiredMixin, ApprovePermissionMixin, View):
             messages.info(request, "Ingen valgt.")
             return redirect(reverse("members:pending"))
 
-        qs = pending_qs(Medlem.objects.filter(pk__in=ids))
-        count = 0
-        display = request.user.get_full_name() or request.user.get_username()
-
-        for m in qs:
-            # Behold verve_kilde='self', sett hvem som godkjente
-            m.verver_user = request.user
-            if not (m.verver_navn or "").strip():
-                m.verver_navn = display
-            m.save(update_fields=["verver_user", "verver_navn"])
-            count += 1
-
+        count = approve(Medlem.objects.filter(pk__in=ids), request.user, kilde="liste").approved
         messages.success(request, f"Godkjente {count} selvregistrering(er).")
         return redirect(reverse("members:pending"))
 
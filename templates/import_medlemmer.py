@@ -1,4 +1,5 @@
 # templates/import_medlemmer.py
+# Erstattet av `python manage.py import_csv <fil>` (members/importer.py) – beholdt for referanse.
 import csv
 import re
 from django.utils import timezone
@@ -112,90 +113,15 @@ def unique_dummy_email(fornavn, etternavn, postnr):
     base = re.sub(r"[^a-z0-9]+", ".", base).strip(".")
     return f"{base}.{postnr}@{DUMMY_DOMAIN}"
 
-from django.apps import apps
-from django.db.models.fields.related import ManyToManyField, ForeignKey
+from geo import resolver as geo_resolver
 
 def get_kommune_from_postnummer(p, kommune_csv: str = ""):
     """
-    Returner en geo.Kommune-instans for gitt Postnummer p.
-    Prøver:
-      (1) M2M Postnummer->Kommune
-      (2) FK Kommune->Postnummer
-      (3) Through-modell geo.PostnummerKommune (hvis finnes)
-    Velger eksakt navnsmatch om oppgitt i CSV, ellers første.
+    Returner en geo.Kommune-instans for gitt postnummer p (Postnummer eller
+    geo.resolver.PostnummerRef). Slås opp i geo.resolver uten spørringer:
+    eksakt navnsmatch om kommune er oppgitt i CSV, ellers primærkommunen.
     """
-    Kommune = apps.get_model("geo", "Kommune")
-    Postnummer = apps.get_model("geo", "Postnummer")
-
-    kandidater = []
-
-    # --- (1) M2M fra Postnummer til Kommune ---
-    m2m_fields = [f for f in Postnummer._meta.get_fields() if isinstance(getattr(f, "remote_field", None), type(getattr(Postnummer._meta, "many_to_many", []))) or isinstance(f, ManyToManyField)]
-    # Fall-back måte å finne M2M på:
-    if not m2m_fields:
-        m2m_fields = list(Postnummer._meta.many_to_many)
-
-    for f in m2m_fields:
-        rel_model = getattr(f.remote_field, "model", None)
-        if rel_model is Kommune:
-            # Fins det en M2M-manager på instansen?
-            manager = getattr(p, f.name, None)
-            try:
-                if manager is not None:
-                    kandidater = list(manager.all())
-                else:
-                    kandidater = []
-            except Exception:
-                kandidater = []
-            if kandidater:
-                break  # fant kommuner via M2M
-
-    # --- (2) FK fra Kommune til Postnummer (reverse) ---
-    if not kandidater:
-        # Finn FK-felt i Kommune som peker til Postnummer
-        fk_fields = [f for f in Kommune._meta.get_fields() if isinstance(f, ForeignKey) and getattr(f.remote_field, "model", None) is Postnummer]
-        for fk in fk_fields:
-            try:
-                kandidater = list(Kommune.objects.filter(**{fk.name: p}))
-            except Exception:
-                kandidater = []
-            if kandidater:
-                break
-
-    # --- (3) Through-modell geo.PostnummerKommune ---
-    if not kandidater:
-        try:
-            Through = apps.get_model("geo", "PostnummerKommune")
-        except LookupError:
-            Through = None
-        if Through is not None:
-            # Finn FK-navn i through som peker til Postnummer og Kommune
-            fk_post, fk_komm = None, None
-            for f in Through._meta.get_fields():
-                remote = getattr(f, "remote_field", None)
-                if not remote:
-                    continue
-                if remote.model is Postnummer:
-                    fk_post = f.name
-                elif remote.model is Kommune:
-                    fk_komm = f.name
-            if fk_post and fk_komm:
-                links = (Through.objects
-                         .filter(**{f"{fk_post}_id": p.pk})
-                         .select_related(fk_komm))
-                kandidater = [getattr(l, fk_komm, None) for l in links if getattr(l, fk_komm, None) is not None]
-
-    if not kandidater:
-        return None
-
-    # Velg kandidat: eksakt navnsmatch hvis kommune_csv er gitt
-    if kommune_csv:
-        kcsv = kommune_csv.strip().lower()
-        for k in kandidater:
-            if getattr(k, "navn", "").strip().lower() == kcsv:
-                return k
-
-    return kandidater[0]
+    return geo_resolver.kommune_instance(geo_resolver.kommune_for(p.nummer, kommune_csv))
 
 
 def run():
@@ -250,9 +176,8 @@ def run():
 #        kommune_csv = g("kommune") if "kommune" in fields_norm else ""
 
         # Postnummer
-        try:
-            p = Postnummer.objects.get(nummer=postnr)
-        except Postnummer.DoesNotExist:
+        p = geo_resolver.resolve(postnr)
+        if p is None:
             print(f"⚠️  Fant ikke postnr {postnr} for {navn}, hopper over.")
             unknown_postnr += 1
             skipped += 1
@@ -276,7 +201,7 @@ def run():
         if hasattr(Medlem, "verve_kilde"):
             defaults["verve_kilde"] = "self"
         if hasattr(Medlem, "postnummer"):
-            defaults["postnummer"] = p
+            defaults["postnummer_id"] = p.id
         if hasattr(Medlem, "kommune") and kommune is not None:
             defaults["kommune"] = kommune
 
@@ -298,7 +223,7 @@ def run():
                         changed = True
 
                 if hasattr(Medlem, "postnummer") and getattr(medlem, "postnummer_id", None) is None:
-                    medlem.postnummer = p
+                    medlem.postnummer_id = p.id
                     changed = True
 
                 if hasattr(Medlem, "kommune") and kommune and getattr(medlem, "kommune_id", None) is None: